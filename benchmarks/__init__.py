@@ -0,0 +1,15 @@
+# __init__.py
+
+
+"""
+Benchmarks of the routes and the database helpers against synthetic data.
+
+generate.py - deterministic synthetic data of any size (users, recipes, steps, ingredients, meals, plans, photos)
+harness.py  - drives every route through the flask test client and every database.py helper directly, reports
+              p50/p95/p99 latency, query counts and peak memory and saves them as JSON
+compare.py  - compares two result files, e.g. of two commits
+
+Everything runs offline in a scratch directory, run from the project root:
+    python -m benchmarks.harness --scale small --out bench-results.json
+    python -m benchmarks.compare old.json bench-results.json
+"""
@@ -0,0 +1,91 @@
+# compare.py
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+
+"""
+This script compares two result files of harness.py, e.g. of the commit before and after a change.
+
+For every scenario in both files it prints p50 and p95 before -> after with the change in percent, and the query
+counts when they differ. Scenarios that are slower by more than --threshold percent (p50) or that run more queries
+are marked with '!', faster ones with '+'. Scenarios only one of the files has are listed at the end.
+
+The exit status is 1 if something got worse, so it can fail a script:
+    python -m benchmarks.compare old.json new.json --threshold 10
+"""
+
+
+def _change(before, after):
+    if not before:
+        return 0.0
+    return (after - before) / before * 100
+
+
+def compare(old, new, threshold=10.0):
+    """
+    Returns:
+        tuple: (lines to print, number of scenarios that got worse)
+    """
+    lines, worse = [], 0
+    for section in ('routes', 'helpers'):
+        before, after = old.get(section, {}), new.get(section, {})
+        names = [name for name in after if name in before]
+        if names:
+            lines.append(section.capitalize())
+
+        for name in names:
+            a, b = before[name], after[name]
+            if 'error' in a or 'error' in b:
+                lines.append(f"  {name:44} {b.get('error') or a.get('error')}")
+                continue
+
+            p50 = _change(a['p50_ms'], b['p50_ms'])
+            mark = ' '
+            if p50 > threshold or b['queries'] > a['queries']:
+                mark = '!'
+                worse += 1
+            elif p50 < -threshold or b['queries'] < a['queries']:
+                mark = '+'
+
+            line = (f"{mark} {name:44} p50 {a['p50_ms']:8.2f} -> {b['p50_ms']:8.2f} ms {p50:+7.1f}%  "
+                    f"p95 {a['p95_ms']:8.2f} -> {b['p95_ms']:8.2f} ms {_change(a['p95_ms'], b['p95_ms']):+7.1f}%")
+            if a['queries'] != b['queries']:
+                line += f"  sql {a['queries']} -> {b['queries']}"
+            lines.append(line)
+
+        for name in before:
+            if name not in after:
+                lines.append(f"  {name:44} only in the old results")
+        for name in after:
+            if name not in before:
+                lines.append(f"  {name:44} only in the new results")
+
+    for key in ('scale', 'sizes', 'iterations', 'render_cache', 'sqlite'):
+        if old.get('meta', {}).get(key) != new.get('meta', {}).get(key):
+            lines.append(f"Note: {key} differs ({old['meta'].get(key)} -> {new['meta'].get(key)}), "
+                         f"the numbers may not be comparable")
+    return lines, worse
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two result files of the benchmark harness.")
+    parser.add_argument('old', type=Path)
+    parser.add_argument('new', type=Path)
+    parser.add_argument('--threshold', type=float, default=10.0, help="percent of p50 that counts as a change")
+    args = parser.parse_args(argv)
+
+    old = json.loads(args.old.read_text(encoding='utf-8'))
+    new = json.loads(args.new.read_text(encoding='utf-8'))
+    print(f"{old['meta'].get('commit') or args.old} -> {new['meta'].get('commit') or args.new}")
+
+    lines, worse = compare(old, new, args.threshold)
+    print("\n".join(lines))
+    print(f"{worse} scenario(s) got worse" if worse else "Nothing got worse")
+    return 1 if worse else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,283 @@
+# generate.py
+
+import argparse
+import io
+import random
+import sqlite3
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+from PIL import Image, ImageDraw
+
+from website.database import DDL_PATH
+from website.migrations import migrate
+from website.photos import save_photo, render_variants
+from website.quantities import parse_amount, unit_code
+
+
+"""
+This script generates a synthetic database for the benchmarks.
+
+The data is deterministic: the same seed and sizes give the same rows, so results of two commits are comparable.
+Every user gets the same amounts (recipes, steps, ingredients, meals, plans), user 1 (user1@example.com /
+password1) is the one the harness logs in as. Photos are rendered once in the given sizes and shared by the recipes
+and users that get one, like identical uploads share one file in the photo store.
+
+The schema is ddl.sql plus all migrations, so every trigger (search index, row versions, schedule owner) runs while
+the rows go in, as it would for rows written by the app.
+
+Run it from the project root, e.g.:
+    python -m benchmarks.generate --scale medium --db /tmp/bench/instance/database.db
+"""
+
+
+# users x recipes per user; the other sizes scale with them
+SCALES = {
+    'tiny': {'users': 2, 'recipes': 20, 'ingredients': 60, 'meals': 10, 'plans': 2, 'photos': 2},
+    'small': {'users': 20, 'recipes': 200, 'ingredients': 300, 'meals': 50, 'plans': 8, 'photos': 8},
+    'medium': {'users': 200, 'recipes': 1000, 'ingredients': 800, 'meals': 200, 'plans': 26, 'photos': 16},
+    'large': {'users': 10000, 'recipes': 1000, 'ingredients': 800, 'meals': 200, 'plans': 52, 'photos': 32},
+}
+
+DEFAULTS = {
+    'seed': 0,
+    'steps': 6,
+    'ingredients_per_recipe': 8,
+    'recipes_per_meal': 3,
+    'meals_per_plan': 14,
+    'photo_sizes': ((1600, 1200), (800, 600)),
+    'photo_ratio': 0.5,
+}
+
+_ADJECTIVES = ('Spicy', 'Creamy', 'Smoky', 'Crispy', 'Quick', 'Hearty', 'Fresh', 'Roasted', 'Grilled', 'Zesty',
+               'Rustic', 'Golden', 'Sweet', 'Tangy', 'Herbed', 'Garlic', 'Lemon', 'Honey', 'Baked', 'Slow Cooked')
+_DISHES = ('Curry', 'Pasta', 'Risotto', 'Salad', 'Soup', 'Stew', 'Tacos', 'Burger', 'Pizza', 'Noodles', 'Pancakes',
+           'Omelette', 'Casserole', 'Stir Fry', 'Dumplings', 'Flatbread', 'Chili', 'Pie', 'Bowl', 'Sandwich')
+_ORIGINS = ('Indian', 'Italian', 'Mexican', 'Japanese', 'Thai', 'French', 'Greek', 'Chinese', 'Spanish', 'Turkish',
+            'Lebanese', 'Korean', 'American', 'Ethiopian', 'Vietnamese')
+_FOODS = ('Rice', 'Flour', 'Tomato', 'Onion', 'Garlic', 'Chicken', 'Beef', 'Tofu', 'Lentils', 'Chickpeas', 'Spinach',
+          'Potato', 'Carrot', 'Pepper', 'Cheese', 'Milk', 'Butter', 'Egg', 'Basil', 'Coriander', 'Cumin', 'Paprika',
+          'Salmon', 'Shrimp', 'Mushroom', 'Zucchini', 'Eggplant', 'Yogurt', 'Cream', 'Oats', 'Honey', 'Lime',
+          'Ginger', 'Noodles', 'Beans', 'Corn', 'Peas', 'Kale', 'Apple', 'Walnut')
+_FOOD_KINDS = ('', 'Red', 'Green', 'Organic', 'Smoked', 'Dried', 'Fresh', 'Frozen', 'Wild', 'Baby', 'Black', 'White',
+               'Brown', 'Sweet', 'Ground', 'Whole', 'Chopped', 'Sliced', 'Roasted', 'Pickled')
+_STORES = ('Lidl', 'Aldi', 'Tesco', 'Rewe', 'Edeka', 'Market', None)
+_QUANTITIES = (('200', 'g'), ('1 1/2', 'cups'), ('2', None), ('1', 'tbsp'), ('500', 'ml'), ('3', 'cloves'),
+               ('1', 'kg'), ('2', 'tsp'), ('½', 'cup'), ('1', 'pinch'), (None, None), ('4', 'slices'))
+_VERBS = ('Chop', 'Dice', 'Stir', 'Simmer', 'Whisk', 'Fold in', 'Season', 'Fry', 'Roast', 'Blend', 'Slice', 'Mix')
+_DETAILS = ('until golden', 'for five minutes', 'over medium heat', 'with a pinch of salt', 'until soft',
+            'and set aside', 'in a large bowl', 'until fragrant', 'gently', 'until it thickens')
+_MEAL_TIMES = ('Breakfast', 'Lunch', 'Dinner', 'Snack')
+_SLOTS = ('08:00', '12:30', '19:00')
+_PREFERENCES = ('vegetarian', 'vegan', 'pescatarian', 'low carb', 'halal', 'kosher')
+_ALLERGIES = ('peanuts', 'gluten', 'lactose', 'shellfish', 'soy', 'eggs')
+
+FIRST_PLAN_DATE = date(2025, 1, 6)
+
+
+def render_photo(rng: random.Random, width: int, height: int) -> bytes:
+    """
+    A JPEG of the given size with random shapes, so it compresses like a photo rather than a flat colour.
+    """
+    image = Image.new('RGB', (width, height), tuple(rng.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(40):
+        x, y = rng.randrange(width), rng.randrange(height)
+        w, h = rng.randrange(1, width // 2 + 2), rng.randrange(1, height // 2 + 2)
+        draw.ellipse((x, y, x + w, y + h), fill=tuple(rng.randrange(256) for _ in range(3)))
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=85)
+    return buffer.getvalue()
+
+
+def generate_photos(rng: random.Random, count: int, sizes, root: Path) -> list[str]:
+    """
+    Stores count photos (sizes used in turn) with their variants and returns their digests.
+    """
+    digests = []
+    for i in range(count):
+        width, height = sizes[i % len(sizes)]
+        digest = save_photo(render_photo(rng, width, height), root)
+        render_variants(digest, root)
+        digests.append(digest)
+    return digests
+
+
+def _ingredient_names(rng: random.Random, count: int) -> list[str]:
+    combos = [f"{kind} {food}".strip() for kind in _FOOD_KINDS for food in _FOODS]
+    rng.shuffle(combos)
+    # past the combinations names get a number, they stay unique per user
+    return [combos[i % len(combos)] + (f" {i // len(combos) + 1}" if i >= len(combos) else '') for i in range(count)]
+
+
+def _user_rows(conn, rng: random.Random, user_id: int, ids: dict, sizes: dict, digests: list[str]):
+    def photo():
+        return rng.choice(digests) if digests and rng.random() < sizes['photo_ratio'] else None
+
+    conn.execute("INSERT INTO users (id, user_name, name, email, password, cooking_level, photo_hash)"
+                 " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                 (user_id, f"user{user_id}", f"User {user_id}", f"user{user_id}@example.com", f"password{user_id}",
+                  rng.randint(1, 5), photo()))
+    conn.executemany("INSERT INTO user_dietary_preference (user_id, preference) VALUES (?, ?)",
+                     [(user_id, preference) for preference in rng.sample(_PREFERENCES, 2)])
+    conn.executemany("INSERT INTO user_allergy (user_id, allergy) VALUES (?, ?)",
+                     [(user_id, allergy) for allergy in rng.sample(_ALLERGIES, 1)])
+
+    names = _ingredient_names(rng, sizes['ingredients'])
+    first_ingredient = ids['ingredient']
+    conn.executemany(
+        "INSERT INTO ingredient (id, user_id, name, name_key, store) VALUES (?, ?, ?, ?, ?)",
+        [(first_ingredient + i, user_id, name, name.lower(), rng.choice(_STORES)) for i, name in enumerate(names)]
+    )
+    ids['ingredient'] += len(names)
+
+    first_recipe = ids['recipe']
+    for n in range(sizes['recipes']):
+        recipe_id = first_recipe + n
+        conn.execute(
+            "INSERT INTO recipe (id, user_id, name, origin, difficulty, preparation_time, cooking_time, serving_size,"
+            " source, photo_hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (recipe_id, user_id, f"{rng.choice(_ADJECTIVES)} {rng.choice(_DISHES)} {n + 1}", rng.choice(_ORIGINS),
+             rng.randint(1, 5), str(rng.randrange(5, 60, 5)), str(rng.randrange(5, 120, 5)), rng.randint(1, 6),
+             rng.choice(('Self', 'AI', 'Family')), photo())
+        )
+        used = rng.sample(range(len(names)), min(sizes['ingredients_per_recipe'], len(names)))
+        conn.executemany(
+            "INSERT INTO recipe_step (recipe_id, step_number, description) VALUES (?, ?, ?)",
+            [(recipe_id, step, f"{rng.choice(_VERBS)} the {names[rng.choice(used)].lower()} {rng.choice(_DETAILS)}.")
+             for step in range(1, sizes['steps'] + 1)]
+        )
+        links = []
+        for index in used:
+            quantity, unit = rng.choice(_QUANTITIES)
+            amount = parse_amount(quantity)
+            code = (unit_code(unit) if unit else 'piece') if amount is not None else None
+            links.append((recipe_id, first_ingredient + index, quantity, unit, amount, code))
+        conn.executemany("INSERT INTO recipe_ingredient (recipe_id, ingredient_id, quantity, unit, amount, unit_code)"
+                         " VALUES (?, ?, ?, ?, ?, ?)", links)
+    ids['recipe'] += sizes['recipes']
+
+    first_meal = ids['meal']
+    recipe_ids = range(first_recipe, first_recipe + sizes['recipes'])
+    for n in range(sizes['meals']):
+        conn.execute("INSERT INTO meal (meal_id, meal_title, user_id, meal_time) VALUES (?, ?, ?, ?)",
+                     (first_meal + n, f"{rng.choice(_ORIGINS)} {rng.choice(_MEAL_TIMES)} {n + 1}", user_id,
+                      rng.choice(_MEAL_TIMES)))
+        conn.executemany("INSERT INTO meal_recipe (meal_id, recipe_id) VALUES (?, ?)",
+                         [(first_meal + n, recipe_id) for recipe_id in
+                          rng.sample(recipe_ids, min(sizes['recipes_per_meal'], len(recipe_ids)))])
+    ids['meal'] += sizes['meals']
+
+    meal_ids = range(first_meal, first_meal + sizes['meals'])
+    for n in range(sizes['plans'] if sizes['meals'] else 0):
+        plan_id = ids['meal_plan'] + n
+        start = FIRST_PLAN_DATE + timedelta(weeks=n)
+        conn.execute("INSERT INTO meal_plan (meal_plan_id, title, user_id, start_date, end_date, goals)"
+                     " VALUES (?, ?, ?, ?, ?, ?)",
+                     (plan_id, f"Week {n + 1}", user_id, start.isoformat(), (start + timedelta(days=6)).isoformat(),
+                      rng.choice(('Balanced meals', 'More vegetables', 'High protein', None))))
+        scheduled = rng.sample(meal_ids, min(sizes['meals_per_plan'], len(meal_ids)))
+        conn.executemany(
+            "INSERT INTO meal_plan_meal (meal_plan_id, meal_id, scheduled_datetime) VALUES (?, ?, ?)",
+            [(plan_id, meal_id, f"{start + timedelta(days=i // len(_SLOTS) % 7)} {_SLOTS[i % len(_SLOTS)]}")
+             for i, meal_id in enumerate(scheduled)]
+        )
+    ids['meal_plan'] += sizes['plans']
+
+
+def generate(db_path, photos_root=None, scale='tiny', **sizes) -> dict:
+    """
+    Creates a new database at db_path (ddl.sql plus all migrations) and fills it with synthetic data.
+
+    Parameters:
+        db_path (Path): must not exist yet.
+        photos_root (Path, optional): photo store for the generated photos, defaults to photos/ next to db_path.
+        scale (str): one of SCALES, the base sizes.
+        sizes: overrides of SCALES / DEFAULTS: users, recipes (per user), steps (per recipe), ingredients (per user),
+            ingredients_per_recipe, meals (per user), recipes_per_meal, plans (per user), meals_per_plan, photos
+            (distinct photos), photo_sizes ((width, height) pairs), photo_ratio (share of recipes / users with a
+            photo), seed.
+
+    Returns:
+        dict: the sizes used and the row counts of the tables.
+
+    Raises:
+        FileExistsError: If db_path exists.
+    """
+    if scale not in SCALES:
+        raise ValueError(f"Unknown scale {scale!r}, expected one of {', '.join(SCALES)}")
+    sizes = {**DEFAULTS, **SCALES[scale], **{key: value for key, value in sizes.items() if value is not None}}
+
+    db_path = Path(db_path)
+    if db_path.exists():
+        raise FileExistsError(f"{db_path} exists, the generator only writes new databases")
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    photos_root = Path(photos_root) if photos_root else db_path.parent / 'photos'
+
+    conn = sqlite3.connect(db_path)
+    conn.executescript(DDL_PATH.read_text(encoding='utf-8'))
+    conn.close()
+    migrate(db_path)
+
+    rng = random.Random(sizes['seed'])
+    digests = generate_photos(rng, sizes['photos'], sizes['photo_sizes'], photos_root)
+
+    started = time.perf_counter()
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA foreign_keys = ON")
+    # a half written benchmark database is thrown away anyway
+    conn.execute("PRAGMA synchronous = OFF")
+    ids = {'ingredient': 1, 'recipe': 1, 'meal': 1, 'meal_plan': 1}
+    for user_id in range(1, sizes['users'] + 1):
+        # one transaction per user, and a generator of its own so the data of a user doesn't depend on the
+        # number of users before it
+        _user_rows(conn, random.Random(f"{sizes['seed']}-{user_id}"), user_id, ids, sizes, digests)
+        conn.commit()
+    conn.execute("ANALYZE")
+    counts = {table: conn.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+              for table in ('users', 'ingredient', 'recipe', 'recipe_step', 'recipe_ingredient', 'meal',
+                            'meal_recipe', 'meal_plan', 'meal_plan_meal')}
+    conn.close()
+
+    return {'sizes': {key: (list(map(list, value)) if key == 'photo_sizes' else value)
+                      for key, value in sizes.items()},
+            'counts': counts, 'photos': digests, 'seconds': round(time.perf_counter() - started, 2)}
+
+
+def _photo_sizes(text):
+    return tuple(tuple(int(n) for n in size.lower().split('x')) for size in text.split(','))
+
+
+def add_size_arguments(parser):
+    parser.add_argument('--scale', choices=SCALES, default='tiny')
+    parser.add_argument('--seed', type=int)
+    for name in ('users', 'recipes', 'steps', 'ingredients', 'ingredients_per_recipe', 'meals', 'recipes_per_meal',
+                 'plans', 'meals_per_plan', 'photos'):
+        parser.add_argument('--' + name.replace('_', '-'), dest=name, type=int)
+    parser.add_argument('--photo-sizes', type=_photo_sizes, help="e.g. 1600x1200,800x600")
+    parser.add_argument('--photo-ratio', type=float)
+
+
+def size_arguments(args) -> dict:
+    return {name: getattr(args, name) for name in ('seed', 'users', 'recipes', 'steps', 'ingredients',
+                                                   'ingredients_per_recipe', 'meals', 'recipes_per_meal', 'plans',
+                                                   'meals_per_plan', 'photos', 'photo_sizes', 'photo_ratio')}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic database for the benchmarks.")
+    parser.add_argument('--db', type=Path, required=True, help="path of the new database")
+    parser.add_argument('--photos-root', type=Path)
+    add_size_arguments(parser)
+    args = parser.parse_args(argv)
+
+    result = generate(args.db, args.photos_root, args.scale, **size_arguments(args))
+    print(f"Generated {args.db} in {result['seconds']}s: "
+          + ", ".join(f"{table}={count}" for table, count in result['counts'].items()))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
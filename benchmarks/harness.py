@@ -0,0 +1,642 @@
+# harness.py
+
+import argparse
+import inspect
+import itertools
+import json
+import os
+import platform
+import re
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+from .generate import generate, add_size_arguments, size_arguments
+
+
+"""
+This script runs the benchmarks.
+
+It generates a database (generate.py) in a scratch directory, creates the app on it and measures
+    routes  - every route of the app through the flask test client, logged in as user 1
+    helpers - every query helper of database.py, called directly inside an app context
+Each scenario runs --warmup times unmeasured, then --iterations times timed, then once more under tracemalloc for its
+peak memory. Scenarios that change data prepare what they change (a recipe to delete, a fresh title) untimed.
+
+Reported per scenario: p50 / p95 / p99 / mean latency in ms, sql statements per call (see QueryCounter; transaction
+control and pragmas aren't counted), peak traced python memory in KB and the http status for routes. Routes and
+helpers without a scenario are listed as skipped, so new ones show up.
+
+The render cache is off unless --render-cache is given, so the routes measure the queries and the rendering.
+
+Run it from the project root:
+    python -m benchmarks.harness --scale small --iterations 50 --out bench-results.json
+"""
+
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+# statements the query counts leave out
+_NOT_COUNTED = ('BEGIN', 'COMMIT', 'ROLLBACK', 'PRAGMA', 'SAVEPOINT', 'RELEASE', 'ANALYZE')
+
+# database.py functions that don't run queries of their own or only matter at startup
+NOT_HELPERS = {
+    'get_pragma_profile', 'apply_database_pragmas', 'get_db_connection', 'release_db_connection', 'init_db_pool',
+    'get_pool_stats', 'get_cache_stats', 'create_database', 'configure_render_cache', 'cached_page',
+    'bump_user_generation', 'configure_user_cache', 'invalidate_session_user', 'configure_ingredient_index', 'invalidate_ingredient_index',
+    'normalize_ingredient_name', 'normalize_scheduled_datetime',
+}
+
+# unique part of the names of the rows the scenarios create
+_serial = itertools.count(1)
+
+# routes that end the benchmark user's session
+NOT_ROUTES = {'auth.logout', 'static'}
+
+
+class QueryCounter:
+    """
+    sqlite trace callback counting the statements run on the connections it is set on.
+
+    sqlite traces the statements of a virtual table (fts5) prefixed with '--' and every trigger program as the
+    statement that fired it again, so those are left out: a count is one per statement the code executed (or per
+    row of an executemany).
+    """
+    def __init__(self):
+        self.count = 0
+        self.last = None
+
+    def __call__(self, statement):
+        if statement.startswith('--') or statement.lstrip().upper().startswith(_NOT_COUNTED):
+            return
+        if statement != self.last:
+            self.count += 1
+        self.last = statement
+
+    def reset(self):
+        self.count = 0
+        self.last = None
+
+
+def percentile(values, p):
+    # nearest rank
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, round(p / 100 * len(ordered) + 0.5) - 1))]
+
+
+def measure(prepare, run, iterations, warmup, counter):
+    """
+    Runs one scenario: prepare(i) returns what run(prepared) needs and isn't timed.
+
+    Returns:
+        dict: p50_ms, p95_ms, p99_ms, mean_ms, queries (median per call), peak_kb, plus the result of the last run.
+    """
+    for i in range(warmup):
+        run(prepare(i))
+
+    timings, queries = [], []
+    result = None
+    for i in range(warmup, warmup + iterations):
+        prepared = prepare(i)
+        counter.reset()
+        started = time.perf_counter()
+        result = run(prepared)
+        timings.append((time.perf_counter() - started) * 1000)
+        queries.append(counter.count)
+
+    prepared = prepare(warmup + iterations)
+    tracemalloc.start()
+    run(prepared)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'mean_ms': round(sum(timings) / len(timings), 3),
+        'queries': sorted(queries)[len(queries) // 2],
+        'peak_kb': round(peak / 1024, 1),
+        'result': result,
+    }
+
+
+def _ids(conn, user_id):
+    ids = {}
+    for key, sql in (('recipe', "SELECT id FROM recipe WHERE user_id = ? ORDER BY id"),
+                     ('meal', "SELECT meal_id FROM meal WHERE user_id = ? ORDER BY meal_id"),
+                     ('meal_plan', "SELECT meal_plan_id FROM meal_plan WHERE user_id = ? ORDER BY meal_plan_id"),
+                     ('ingredient', "SELECT name FROM ingredient WHERE user_id = ? ORDER BY id")):
+        ids[key] = [row[0] for row in conn.execute(sql, (user_id,))]
+    ids['photo'] = [row[0] for row in conn.execute(
+        "SELECT DISTINCT photo_hash FROM recipe WHERE photo_hash IS NOT NULL ORDER BY photo_hash")]
+    ids['first_plan_date'] = conn.execute(
+        "SELECT min(start_date) FROM meal_plan WHERE user_id = ?", (user_id,)).fetchone()[0]
+    return ids
+
+
+def _pick(values, i):
+    return values[i % len(values)] if values else 0
+
+
+def _import_records(names, count):
+    # records in the form importer.normalize_record returns, so they can go to the endpoint or to import_batch
+    return [{'type': 'recipe', 'name': f"Imported Recipe {next(_serial)}", 'origin': 'Bulk', 'difficulty': 2,
+             'preparation_time': '10', 'cooking_time': '20', 'serving_size': 2, 'source': 'Import',
+             'steps': ['Chop', 'Cook', 'Serve'], 'ingredients': [f"200 g {name}" for name in names[n % 4::4][:6]]}
+            for n in range(count)]
+
+
+def route_scenarios(app, client, ids):
+    """
+    Returns a list of (name, endpoint, prepare) for the routes; prepare(i) returns (client, method, url, kwargs)
+    for client.open.
+    """
+    from website import database
+
+    recipe = lambda i: _pick(ids['recipe'], i)
+    meal = lambda i: _pick(ids['meal'], i)
+    plan = lambda i: _pick(ids['meal_plan'], i)
+    photo = lambda i: _pick(ids['photo'], i)
+    plan_date = ids['first_plan_date'] or '2025-01-06'
+
+    def get(url):
+        return lambda i: (client, 'GET', url(i) if callable(url) else url, {})
+
+    def post(url, data):
+        return lambda i: (client, 'POST', url(i) if callable(url) else url, {'data': data(i)})
+
+    def recipe_form(i):
+        return {'name': f"Bench Recipe {next(_serial)}", 'origin': 'Italian', 'difficulty_level': '2',
+                'preparation_steps': 'Boil the water, Cook the pasta, Stir in the sauce',
+                'preparation_time': '10', 'cooking_time': '20', 'serving': '2', 'source': 'Self',
+                'ingredients': ', '.join(['200 g ' + name for name in ids['ingredient'][:6]])}
+
+    def edit_recipe_form(i):
+        return {**recipe_form(i), 'name': f"Edited Recipe {recipe(i)}"}
+
+    def throwaway_recipe(i):
+        recipe_id, _ = database.save_recipe(1, f"Throwaway Recipe {next(_serial)}", ['Step'], ['1 Egg'], '1', '1')
+        return recipe_id
+
+    def throwaway_meal(i):
+        return database.create_meal(1, f"Throwaway Meal {next(_serial)}", ids['recipe'][:2], 'Lunch')
+
+    def throwaway_plan(i):
+        return database.create_meal_plan_with_schedule(1, f"Throwaway Plan {next(_serial)}", plan_date, plan_date,
+                                                       '', {ids['meal'][0]: f"{plan_date} 12:00"})
+
+    def throwaway_job(i):
+        return database.create_job('bench', '{}', 1, 3, 0)
+
+    def in_app(fn):
+        # the throwaway rows are written outside the measured request
+        def prepare(i):
+            with app.app_context():
+                return fn(i)
+        return prepare
+
+    def delete_account(i):
+        # a second client, so the benchmark user stays logged in
+        other = app.test_client()
+        email = f"throwaway{next(_serial)}@example.com"
+        with app.app_context():
+            database.create_user(email, email.split('@')[0], 'password')
+        other.post('/login', data={'email': email, 'password': 'password'})
+        with other.session_transaction() as session:
+            session.pop('_flashes', None)
+        return other, 'POST', '/delete-account', {}
+
+    def edit_meal_form(i):
+        # keeps the recipes of the meal, removing all of them would delete it
+        with app.app_context():
+            recipe_ids = database.get_recipe_ids_for_meal(meal(i))
+        return {'meal_title': f"Edited Meal {meal(i)}", 'meal_time': 'Dinner', 'recipe_ids': recipe_ids}
+
+    def plan_form(i, title, meal_ids):
+        return {'plan_title': title, 'start_date': plan_date, 'end_date': plan_date, 'goals': 'Bench',
+                'meal_ids': meal_ids, **{f"schedule_{m}": f"{plan_date}T08:00" for m in meal_ids}}
+
+    def edit_plan_form(i):
+        with app.app_context():
+            meal_ids = [row['meal_id'] for row in database.get_meal_plan_meals_and_schedules(plan(i))]
+        return plan_form(i, f"Edited Plan {plan(i)}", meal_ids)
+
+    def etag(url):
+        def prepare(i):
+            response = client.get(url(i))
+            return client, 'GET', url(i), {'headers': {'If-None-Match': response.headers.get('ETag', '')}}
+        return prepare
+
+    scenarios = [
+        ('GET /', 'views.home', get('/')),
+        ('GET /recipes/page', 'views.recipes_page', get(lambda i: f"/recipes/page?after={ids['recipe'][0]}")),
+        ('GET /meals/page', 'views.meals_page', get(lambda i: f"/meals/page?after={ids['meal'][0]}")),
+        ('GET /meal-plans/page', 'views.meal_plans_page',
+         get(lambda i: f"/meal-plans/page?after={ids['meal_plan'][0] if ids['meal_plan'] else 0}")),
+        ('GET /add-recipe', 'views.add_recipe', get('/add-recipe')),
+        ('POST /add-recipe', 'views.add_recipe', post('/add-recipe', recipe_form)),
+        ('GET /edit-recipe', 'views.edit_recipe', get(lambda i: f"/edit-recipe/{recipe(i)}")),
+        ('POST /edit-recipe', 'views.edit_recipe', post(lambda i: f"/edit-recipe/{recipe(i)}", edit_recipe_form)),
+        ('GET /recipe', 'views.view_recipe', get(lambda i: f"/recipe/{recipe(i)}")),
+        ('GET /recipe?servings', 'views.view_recipe', get(lambda i: f"/recipe/{recipe(i)}?servings=4")),
+        ('GET /recipe 304', 'views.view_recipe', etag(lambda i: f"/recipe/{recipe(i)}")),
+        ('POST /delete-recipe', 'views.delete_recipe',
+         lambda i: (client, 'POST', f"/delete-recipe/{in_app(throwaway_recipe)(i)}", {})),
+        ('GET /search', 'views.search', get(lambda i: f"/search?q={('curry', 'spicy soup', 'tom', 'rice')[i % 4]}")),
+        ('GET /ingredients/autocomplete', 'views.ingredient_autocomplete',
+         get(lambda i: f"/ingredients/autocomplete?q={('to', 'ri', 'sm', 'gr')[i % 4]}")),
+        ('GET /add-meal', 'views.add_meal', get('/add-meal')),
+        ('POST /add-meal', 'views.add_meal', post('/add-meal', lambda i: {
+            'meal_title': f"Bench Meal {next(_serial)}", 'meal_time': 'Lunch', 'recipe_ids': ids['recipe'][:3]})),
+        ('GET /meal', 'views.view_meal', get(lambda i: f"/meal/{meal(i)}")),
+        ('GET /meal 304', 'views.view_meal', etag(lambda i: f"/meal/{meal(i)}")),
+        ('GET /edit-meal', 'views.edit_meal', get(lambda i: f"/edit-meal/{meal(i)}")),
+        ('POST /edit-meal', 'views.edit_meal', post(lambda i: f"/edit-meal/{meal(i)}", edit_meal_form)),
+        ('POST /delete-meal', 'views.delete_meal',
+         lambda i: (client, 'POST', f"/delete-meal/{in_app(throwaway_meal)(i)}", {})),
+        ('GET /add-meal-plan', 'views.add_meal_plan', get('/add-meal-plan')),
+        ('POST /add-meal-plan', 'views.add_meal_plan',
+         post('/add-meal-plan', lambda i: plan_form(i, f"Bench Plan {next(_serial)}", ids['meal'][:5]))),
+        ('GET /view-meal-plan', 'views.view_meal_plan', get(lambda i: f"/view-meal-plan/{plan(i)}")),
+        ('GET /view-meal-plan/shopping-list', 'views.meal_plan_shopping_list',
+         get(lambda i: f"/view-meal-plan/{plan(i)}/shopping-list")),
+        ('GET /shopping-list', 'views.shopping_list',
+         get(f"/shopping-list?start_date={plan_date}&end_date=2025-12-31")),
+        ('GET /calendar/week', 'views.calendar_week', get(f"/calendar/week?date={plan_date}")),
+        ('GET /calendar/month', 'views.calendar_month', get(f"/calendar/month?month={plan_date[:7]}")),
+        ('GET /edit-meal-plan', 'views.edit_meal_plan', get(lambda i: f"/edit-meal-plan/{plan(i)}")),
+        ('POST /edit-meal-plan', 'views.edit_meal_plan',
+         post(lambda i: f"/edit-meal-plan/{plan(i)}", edit_plan_form)),
+        ('POST /delete-meal-plan', 'views.delete_meal_plan',
+         lambda i: (client, 'POST', f"/delete-meal-plan/{in_app(throwaway_plan)(i)}", {})),
+        ('GET /profile', 'views.profile_page', get('/profile')),
+        ('POST /profile', 'views.profile_page', post('/profile', lambda i: {
+            'user_name': 'user1', 'email': 'user1@example.com', 'cooking_level': str(i % 5 + 1),
+            'dietary_preferences': 'vegetarian', 'allergies': 'peanuts'})),
+        ('POST /delete-account', 'views.delete_account', delete_account),
+        ('GET /photo', 'views.photo', get(lambda i: f"/photo/{photo(i)}")),
+        ('GET /photo/card', 'views.photo', get(lambda i: f"/photo/{photo(i)}/card")),
+        ('GET /login', 'auth.login', get('/login')),
+        ('POST /login', 'auth.login',
+         post('/login', lambda i: {'email': 'user1@example.com', 'password': 'password1'})),
+        ('GET /sign-up', 'auth.sign_up', get('/sign-up')),
+        ('GET /metrics', 'metrics', get('/metrics')),
+        # the import and the export run in the streamed body, after the request hooks, so their statements aren't
+        # counted here
+        ('GET /export', 'views.export_data', get('/export')),
+        ('GET /export (zip)', 'views.export_data', get('/export?format=zip')),
+        ('GET /export (tar)', 'views.export_data', get('/export?format=tar')),
+        ('POST /import (100 recipes)', 'views.import_data', lambda i: (client, 'POST', '/import?format=ndjson', {
+            'data': ''.join(json.dumps(record) + '\n' for record in _import_records(ids['ingredient'], 100))})),
+        ('POST /import (background, 100 recipes)', 'views.import_data', lambda i: (
+            client, 'POST', '/import?format=ndjson&background=1',
+            {'data': ''.join(json.dumps(record) + '\n' for record in _import_records(ids['ingredient'], 100))})),
+        ('GET /jobs', 'views.jobs_page', get('/jobs')),
+        ('GET /jobs/<id>', 'views.job_status_page',
+         get(lambda i: f"/jobs/{in_app(throwaway_job)(i)}")),
+        ('POST /sign-up', 'auth.sign_up', post('/sign-up', lambda i: (lambda n: {
+            'email': f"bench{n}@example.com", 'userName': f"bench{n}", 'password1': 'password1',
+            'password2': 'password1'})(next(_serial)))),
+    ]
+    if not ids['photo']:
+        scenarios = [scenario for scenario in scenarios if scenario[1] != 'views.photo']
+    return scenarios
+
+
+def helper_scenarios(ids):
+    """
+    Returns a list of (name, prepare) for the helpers of database.py; prepare(i) returns a function without
+    arguments. Both run inside the same app context, so what prepare writes is committed before the timing starts.
+    """
+    from website import database as db
+
+    recipe = lambda i: _pick(ids['recipe'], i)
+    meal = lambda i: _pick(ids['meal'], i)
+    plan = lambda i: _pick(ids['meal_plan'], i)
+    names = ids['ingredient']
+    plan_date = ids['first_plan_date'] or '2025-01-06'
+
+    def call(fn, *args, **kwargs):
+        return lambda i: (lambda: fn(*(a(i) if callable(a) else a for a in args), **kwargs))
+
+    def with_throwaway(make, fn):
+        def prepare(i):
+            value = make(i)
+            return lambda: fn(value)
+        return prepare
+
+    new_recipe = lambda i: db.save_recipe(1, f"Helper Recipe {next(_serial)}", ['Step'], ['1 Egg'], '1', '1')[0]
+    new_meal = lambda i: db.create_meal(1, f"Helper Meal {next(_serial)}", ids['recipe'][:2], 'Lunch')
+    new_plan = lambda i: db.create_meal_plan(1, f"Helper Plan {next(_serial)}", plan_date, plan_date, '')
+    new_user = lambda i: (lambda n: db.create_user(f"helper{n}@example.com", f"helper{n}", 'password').id)(
+        next(_serial))
+
+    def user_with_recipe(i):
+        user_id = new_user(i)
+        db.save_recipe(user_id, f"Purged Recipe {next(_serial)}", ['Step'], ['1 Egg'], '1', '1')
+        return user_id
+
+    new_job = lambda i: db.create_job('bench', '{}', 1, 3, 0)
+
+    def plan_with_meal(i):
+        plan_id = new_plan(i)
+        db.add_meal_to_plan(plan_id, ids['meal'][0], f"{plan_date} 08:00")
+        return plan_id
+
+    return [
+        ('get_user_by_email', call(db.get_user_by_email, 'user1@example.com')),
+        ('get_user_by_username', call(db.get_user_by_username, 'user1')),
+        ('get_user_by_id', call(db.get_user_by_id, 1)),
+        ('get_session_user', call(db.get_session_user, '1')),
+        ('get_user_details', call(db.get_user_details, 1)),
+        ('get_user_password', call(db.get_user_password, 1)),
+        ('create_user', lambda i: (lambda n: lambda: db.create_user(f"created{n}@example.com", f"created{n}",
+                                                                     'password'))(next(_serial))),
+        ('update_user_profile', call(db.update_user_profile, 1, 'user1@example.com', 'user1', None,
+                                     lambda i: i % 5 + 1, ['vegetarian'], ['peanuts'])),
+        ('delete_user_by_id', with_throwaway(new_user, db.delete_user_by_id)),
+        ('mark_user_deleted', with_throwaway(new_user, db.mark_user_deleted)),
+        ('update_user_password', with_throwaway(new_user, lambda user_id: db.update_user_password(user_id,
+                                                                                                   'password'))),
+        ('purge_user', with_throwaway(user_with_recipe, db.purge_user)),
+        ('create_ingredient', lambda i: (lambda: db.create_ingredient(1, f"Helper Ingredient {next(_serial)}"))),
+        ('get_ingredients', call(db.get_ingredients, 1, lambda i: _pick(names, i))),
+        ('resolve_ingredients', call(db.resolve_ingredients, 1, lambda i: names[:8] + [f"Resolved {next(_serial)}"])),
+        ('suggest_ingredients', call(db.suggest_ingredients, 1, lambda i: ('to', 'ri', 'sm', 'gr')[i % 4])),
+        ('create_recipe_ingredient', lambda i: (lambda value: lambda: db.create_recipe_ingredient(
+            value, db.create_ingredient(1, f"Linked Ingredient {next(_serial)}"), '2', 'cups'))(new_recipe(i))),
+        ('get_recipe_ingredients', call(db.get_recipe_ingredients, recipe)),
+        ('delete_recipe_ingredient', with_throwaway(new_recipe, db.delete_recipe_ingredient)),
+        ('save_recipe (create)', lambda i: (lambda: db.save_recipe(
+            1, f"Saved Recipe {next(_serial)}", ['Chop', 'Cook', 'Serve'], [f"200 g {name}" for name in names[:8]],
+            '10', '20'))),
+        ('save_recipe (update)', lambda i: (lambda: db.save_recipe(
+            1, f"Updated Recipe {recipe(i)}", ['Chop', 'Cook', 'Serve'], [f"1 cup {name}" for name in names[:8]],
+            '10', '20', recipe_id=recipe(i)))),
+        ('get_all_recipes', call(db.get_all_recipes, 1)),
+        ('get_recipes_page', call(db.get_recipes_page, 1)),
+        ('get_recipe', call(db.get_recipe, recipe, 1)),
+        ('get_recipe_version', call(db.get_recipe_version, recipe, 1)),
+        ('get_recipe_by_name', call(db.get_recipe_by_name, 1, 'no such recipe')),
+        ('delete_recipe', with_throwaway(new_recipe, db.delete_recipe)),
+        ('get_recipe_steps', call(db.get_recipe_steps, recipe)),
+        ('get_recipe_in_meal', call(db.get_recipe_in_meal, meal)),
+        ('get_recipes_with_details', call(db.get_recipes_with_details, 1, lambda i: ids['recipe'][i % 10:i % 10 + 5])),
+        ('get_recipe_ids_for_meal', call(db.get_recipe_ids_for_meal, meal)),
+        ('delete_recipes_from_meal', with_throwaway(new_meal, db.delete_recipes_from_meal)),
+        ('delete_recipe_from_meal_recipe', with_throwaway(new_meal, lambda m: db.delete_recipe_from_meal_recipe(
+            m, ids['recipe'][0]))),
+        ('add_recipe_to_meal', with_throwaway(new_meal, lambda m: db.add_recipe_to_meal(m, ids['recipe'][2]))),
+        ('create_meal', lambda i: (lambda: db.create_meal(1, f"Created Meal {next(_serial)}", ids['recipe'][:3],
+                                                          'Dinner'))),
+        ('delete_meal', with_throwaway(new_meal, db.delete_meal)),
+        ('update_meal', call(db.update_meal, meal, meal_time='Dinner')),
+        ('view_meal', call(db.view_meal, meal)),
+        ('get_all_meals', call(db.get_all_meals, 1)),
+        ('get_meals_page', call(db.get_meals_page, 1)),
+        ('get_meal', call(db.get_meal, meal)),
+        ('get_meal_with_recipes', call(db.get_meal_with_recipes, meal, 1)),
+        ('get_meal_version', call(db.get_meal_version, meal, 1)),
+        ('get_meal_by_name', call(db.get_meal_by_name, 1, 'no such meal')),
+        ('create_meal_plan', lambda i: (lambda: db.create_meal_plan(1, f"Created Plan {next(_serial)}", plan_date,
+                                                                    plan_date, ''))),
+        ('create_meal_plan_with_schedule', lambda i: (lambda: db.create_meal_plan_with_schedule(
+            1, f"Scheduled Plan {next(_serial)}", plan_date, plan_date, '',
+            {meal_id: f"{plan_date} 08:00" for meal_id in ids['meal'][:7]}))),
+        ('add_meal_to_plan', with_throwaway(new_plan, lambda p: db.add_meal_to_plan(p, ids['meal'][0],
+                                                                                   f"{plan_date} 08:00"))),
+        ('get_meal_plan', call(db.get_meal_plan, plan, 1)),
+        ('get_meal_plan_version', call(db.get_meal_plan_version, plan, 1)),
+        ('get_meal_plan_by_title', call(db.get_meal_plan_by_title, 'Week 1')),
+        ('get_meal_plan_meals_and_schedules', call(db.get_meal_plan_meals_and_schedules, plan)),
+        ('get_shopping_list_for_plan', call(db.get_shopping_list_for_plan, plan, 1)),
+        ('get_shopping_list_for_dates', call(db.get_shopping_list_for_dates, 1, plan_date, '2025-12-31')),
+        ('get_scheduled_meals_between', call(db.get_scheduled_meals_between, 1, plan_date, '2025-12-31')),
+        ('get_meal_plan_by_user_and_title', call(db.get_meal_plan_by_user_and_title, 1, 'Week 1')),
+        ('delete_meal_plan_and_meal_plan_meals_by_id', with_throwaway(
+            plan_with_meal, db.delete_meal_plan_and_meal_plan_meals_by_id)),
+        ('get_all_meal_plans', call(db.get_all_meal_plans, 1)),
+        ('get_meal_plans_page', call(db.get_meal_plans_page, 1)),
+        ('update_meal_plan', call(db.update_meal_plan, lambda i: f"Week {plan(i)}", plan_date, plan_date, 'Bench',
+                                  plan)),
+        ('update_meal_plan_meal_schedule', with_throwaway(plan_with_meal, lambda p: db.update_meal_plan_meal_schedule(
+            p, ids['meal'][0], f"{plan_date} 19:00"))),
+        ('delete_meal_plan_meal', with_throwaway(plan_with_meal, lambda p: db.delete_meal_plan_meal(
+            p, ids['meal'][0]))),
+        ('get_all_photo_hashes', call(db.get_all_photo_hashes)),
+        ('search_recipes', call(db.search_recipes, 1, lambda i: ('curry', 'spicy soup', 'tom', 'rice')[i % 4])),
+        ('iter_export_records', lambda i: (lambda: sum(1 for _ in db.iter_export_records(1)))),
+        ('iter_export_photo_hashes', lambda i: (lambda: list(db.iter_export_photo_hashes(1)))),
+        ('create_job', lambda i: (lambda: db.create_job('bench', '{}', 1, 3, 0))),
+        ('claim_job', with_throwaway(new_job, lambda job_id: db.claim_job('bench', time.time()))),
+        ('finish_job', with_throwaway(new_job, lambda job_id: db.finish_job(job_id, '{}'))),
+        ('fail_job', with_throwaway(new_job, lambda job_id: db.fail_job(job_id, 'bench', time.time()))),
+        ('get_job', with_throwaway(new_job, lambda job_id: db.get_job(job_id, 1))),
+        ('get_jobs', call(db.get_jobs, 1)),
+        ('requeue_stale_jobs', call(db.requeue_stale_jobs, 0)),
+        ('prune_jobs', call(db.prune_jobs, 0)),
+        ('import_batch (100 recipes)', lambda i: (lambda records: lambda: db.import_batch(1, records))(
+            [(line, record) for line, record in enumerate(_import_records(names, 100), start=1)])),
+    ]
+
+
+def run_routes(app, ids, iterations, warmup, counter, only=None):
+
+    client = app.test_client()
+    client.post('/login', data={'email': 'user1@example.com', 'password': 'password1'})
+
+    results, skipped = {}, []
+    covered = set()
+    for name, endpoint, prepare in route_scenarios(app, client, ids):
+        covered.add(endpoint)
+        if only and not re.search(only, name):
+            continue
+
+        def run(prepared):
+            target, method, url, kwargs = prepared
+            response = target.open(url, method=method, **kwargs)
+            status = response.status_code
+            # streamed bodies (import, export) are only produced while they are read
+            response.get_data()
+            response.close()
+            # flashed messages of POSTs would keep the next pages out of the render cache
+            with target.session_transaction() as session:
+                session.pop('_flashes', None)
+            return status
+
+        try:
+            stats = measure(prepare, run, iterations, warmup, counter)
+        except Exception as e:
+            results[name] = {'error': f"{type(e).__name__}: {e}"}
+            continue
+        stats['status'] = stats.pop('result')
+        results[name] = stats
+        print(f"  {name:44} p50 {stats['p50_ms']:8.2f} ms  p95 {stats['p95_ms']:8.2f} ms  "
+              f"{stats['queries']:4} sql  {stats['status']}")
+
+    for rule in app.url_map.iter_rules():
+        if rule.endpoint not in covered and rule.endpoint not in NOT_ROUTES:
+            skipped.append(f"route {rule.endpoint} {rule.rule}")
+    return results, skipped
+
+
+def run_helpers(app, ids, iterations, warmup, counter, only=None):
+    from website import database
+    from website.database import get_db_connection
+
+    results, skipped = {}, []
+    scenarios = helper_scenarios(ids)
+    for name, prepare in scenarios:
+        if only and not re.search(only, name):
+            continue
+
+        # each call gets its own app context and with it its own pooled connection, like a request
+        def prepare_wrapped(i, prepare=prepare):
+            context = app.app_context()
+            context.push()
+            try:
+                fn = prepare(i)
+            except BaseException:
+                context.pop()
+                raise
+            get_db_connection().set_trace_callback(counter)
+            return context, fn
+
+        def run_wrapped(prepared):
+            context, fn = prepared
+            try:
+                return fn()
+            finally:
+                get_db_connection().set_trace_callback(None)
+                context.pop()
+
+        try:
+            stats = measure(prepare_wrapped, run_wrapped, iterations, warmup, counter)
+        except Exception as e:
+            results[name] = {'error': f"{type(e).__name__}: {e}"}
+            continue
+        stats.pop('result')
+        results[name] = stats
+        print(f"  {name:44} p50 {stats['p50_ms']:8.2f} ms  p95 {stats['p95_ms']:8.2f} ms  {stats['queries']:4} sql")
+
+    covered = {name.split(' ')[0] for name, _ in scenarios}
+    for name, fn in inspect.getmembers(database, inspect.isfunction):
+        if (fn.__module__ == database.__name__ and not name.startswith('_') and name not in NOT_HELPERS
+                and name not in covered):
+            skipped.append(f"helper {name}")
+    return results, skipped
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=PROJECT_ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(workdir, scale='tiny', sizes=None, iterations=50, warmup=5, render_cache=False, only=None):
+    """
+    Generates the data in workdir, runs every scenario and returns the results (see the module docstring).
+    """
+    workdir = Path(workdir)
+    workdir.mkdir(parents=True, exist_ok=True)
+    # the app finds its sql files and instance/ relative to the working directory
+    if not (workdir / 'website').exists():
+        (workdir / 'website').symlink_to(PROJECT_ROOT / 'website', target_is_directory=True)
+    os.chdir(workdir)
+
+    print(f"Generating the '{scale}' data set in {workdir}")
+    data = generate(Path('instance/database.db'), Path('instance/photos'), scale, **(sizes or {}))
+    print(f"  {data['seconds']}s: " + ", ".join(f"{table}={count}" for table, count in data['counts'].items()))
+
+    from website import create_app
+    from website.database import get_db_connection
+
+    # queued jobs stay in the table, the harness measures the requests that queue them
+    config = {'PHOTO_WORKERS': 1, 'JOB_WORKERS': 0}
+    if not render_cache:
+        config['RENDER_CACHE_MAX_BYTES'] = 0
+    app = create_app(config)
+
+    counter = QueryCounter()
+
+    @app.before_request
+    def trace_queries():
+        get_db_connection().set_trace_callback(counter)
+
+    @app.teardown_request
+    def stop_tracing(exception=None):
+        from flask import g
+        if 'db_conn' in g:
+            g.db_conn.set_trace_callback(None)
+
+    conn = sqlite3.connect('instance/database.db')
+    ids = _ids(conn, 1)
+    conn.close()
+
+    print("Routes")
+    routes, skipped_routes = run_routes(app, ids, iterations, warmup, counter, only)
+    print("Helpers")
+    helpers, skipped_helpers = run_helpers(app, ids, iterations, warmup, counter, only)
+
+    return {
+        'meta': {
+            'commit': _git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'scale': scale,
+            'sizes': data['sizes'],
+            'counts': data['counts'],
+            'iterations': iterations,
+            'warmup': warmup,
+            'render_cache': render_cache,
+            # whole process, includes the data generation
+            'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        },
+        'routes': routes,
+        'helpers': helpers,
+        'skipped': skipped_routes + skipped_helpers,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the routes and database helpers on synthetic data.")
+    add_size_arguments(parser)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--render-cache', action='store_true', help="keep the render cache on")
+    parser.add_argument('--only', help="regular expression, only scenarios whose name matches")
+    parser.add_argument('--workdir', type=Path, help="scratch directory, a temporary one by default")
+    parser.add_argument('--out', type=Path, help="write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    out = args.out.resolve() if args.out else None
+    if args.workdir:
+        results = run_benchmarks(args.workdir, args.scale, size_arguments(args), args.iterations, args.warmup,
+                                 args.render_cache, args.only)
+    else:
+        with tempfile.TemporaryDirectory(prefix='bench-') as workdir:
+            results = run_benchmarks(workdir, args.scale, size_arguments(args), args.iterations, args.warmup,
+                                     args.render_cache, args.only)
+            os.chdir(PROJECT_ROOT)
+
+    for line in results['skipped']:
+        print(f"skipped {line}")
+    if out:
+        out.write_text(json.dumps(results, indent=2), encoding='utf-8')
+        print(f"Results written to {out}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
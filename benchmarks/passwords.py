@@ -0,0 +1,153 @@
+# passwords.py
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from werkzeug.security import generate_password_hash
+
+from .generate import generate
+from .harness import PROJECT_ROOT, percentile
+
+
+"""
+This script measures the logins per second the password hashing allows, for capacity planning.
+
+For every scrypt cost (--cost n:r:p, the config's by default) and pool size (--workers, PASSWORD_WORKERS) it lets
+--concurrency threads post /login through the flask test client for --seconds and reports the logins per second,
+the logins per second and core (divided by the processes that can run at the same time, at most the cores of the
+machine) and p50 / p95 latency. The users log in once untimed before, so their plain generated passwords are
+rehashed with the cost and the timed logins verify a hash like in production. One hash outside the pool and the
+memory scrypt needs per hash (128 * n * r bytes) are reported too.
+
+Run it from the project root:
+    python -m benchmarks.passwords --cost 16384:8:1 --cost 32768:8:1 --workers 1 2 4 --seconds 10
+"""
+
+
+# users logging in, the threads take turns over them
+USERS = 8
+
+
+def _cost(value):
+    try:
+        n, r, p = (int(part) for part in value.split(':'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected n:r:p, e.g. 32768:8:1, got {value!r}")
+    return n, r, p
+
+
+def measure_logins(app, users, concurrency, seconds):
+    """
+    Posts /login as the given (email, password) users from concurrency threads for seconds.
+
+    Returns:
+        dict: logins, failed (not redirected home), logins_per_s, p50_ms and p95_ms.
+    """
+    timings, failed = [], [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def worker(number):
+        client = app.test_client()
+        email, password = users[number % len(users)]
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            response = client.post('/login', data={'email': email, 'password': password})
+            elapsed = time.perf_counter() - started
+            with lock:
+                if response.status_code == 302:
+                    timings.append(elapsed)
+                else:
+                    failed[0] += 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(number,)) for number in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        'logins': len(timings),
+        'failed': failed[0],
+        'logins_per_s': round(len(timings) / elapsed, 2),
+        'p50_ms': round(percentile(timings, 50) * 1000, 2) if timings else None,
+        'p95_ms': round(percentile(timings, 95) * 1000, 2) if timings else None,
+    }
+
+
+def run_password_benchmarks(workdir, costs, workers, concurrency=None, seconds=5.0):
+    workdir = Path(workdir)
+    workdir.mkdir(parents=True, exist_ok=True)
+    if not (workdir / 'website').exists():
+        (workdir / 'website').symlink_to(PROJECT_ROOT / 'website', target_is_directory=True)
+    os.chdir(workdir)
+    generate(Path('instance/database.db'), Path('instance/photos'), 'tiny', users=USERS, photo_ratio=0)
+
+    from website import create_app
+    from website.passwords import init_password_pool
+
+    # generate.py gives user<id> the password password<id>
+    users = [(f"user{user_id}@example.com", f"password{user_id}") for user_id in range(1, USERS + 1)]
+    app = create_app({'JOB_WORKERS': 0, 'PHOTO_WORKERS': 1, 'QUERY_TRACE': False, 'METRICS': False,
+                      'PASSWORD_QUEUE_SIZE': 1024, 'PASSWORD_TIMEOUT': 60.0})
+    cores = os.cpu_count() or 1
+    results = []
+    for n, r, p in costs or [(app.config['PASSWORD_SCRYPT_N'], app.config['PASSWORD_SCRYPT_R'],
+                              app.config['PASSWORD_SCRYPT_P'])]:
+        method = f"scrypt:{n}:{r}:{p}"
+        started = time.perf_counter()
+        generate_password_hash('password1', method)
+        single_ms = (time.perf_counter() - started) * 1000
+        print(f"{method}: one hash {single_ms:.1f} ms, {128 * n * r // 1024 // 1024} MiB")
+
+        for count in workers:
+            app.config.update(PASSWORD_SCRYPT_N=n, PASSWORD_SCRYPT_R=r, PASSWORD_SCRYPT_P=p, PASSWORD_WORKERS=count)
+            init_password_pool(app)
+            # untimed: rehashes the plain passwords with this cost and starts the processes
+            for email, password in users:
+                app.test_client().post('/login', data={'email': email, 'password': password})
+
+            stats = measure_logins(app, users, concurrency or max(count, 1) * 2, seconds)
+            parallel = min(max(count, 1), cores)
+            stats.update({'method': method, 'workers': count, 'hash_ms': round(single_ms, 2),
+                          'memory_mib': 128 * n * r / 1024 / 1024,
+                          'logins_per_s_per_core': round(stats['logins_per_s'] / parallel, 2)})
+            results.append(stats)
+            print(f"  {count:2} workers  {stats['logins_per_s']:8.2f} logins/s  "
+                  f"{stats['logins_per_s_per_core']:8.2f} per core  p50 {stats['p50_ms']} ms  "
+                  f"p95 {stats['p95_ms']} ms  {stats['failed']} failed")
+
+    return {'cores': cores, 'seconds': seconds, 'results': results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure login throughput of the password hashing.")
+    parser.add_argument('--cost', type=_cost, action='append', help="scrypt n:r:p, can be repeated")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, os.cpu_count() or 1],
+                        help="PASSWORD_WORKERS to measure, 0 hashes in the request threads")
+    parser.add_argument('--concurrency', type=int, help="threads logging in, twice the workers by default")
+    parser.add_argument('--seconds', type=float, default=5.0, help="duration of each measurement")
+    parser.add_argument('--out', type=Path, help="write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    out = args.out.resolve() if args.out else None
+    with tempfile.TemporaryDirectory(prefix='bench-passwords-') as workdir:
+        results = run_password_benchmarks(workdir, args.cost, sorted(set(args.workers)), args.concurrency,
+                                          args.seconds)
+        os.chdir(PROJECT_ROOT)
+    if out:
+        out.write_text(json.dumps(results, indent=2), encoding='utf-8')
+        print(f"Results written to {out}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
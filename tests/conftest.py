@@ -0,0 +1,32 @@
+# conftest.py
+
+import os
+from pathlib import Path
+
+import pytest
+
+
+"""
+Fixtures of the tests: an app on a fresh database in a temporary directory and a client logged in as user 1.
+"""
+
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    # the app finds its sql files and instance/ relative to the working directory
+    (tmp_path / 'website').symlink_to(PROJECT_ROOT / 'website', target_is_directory=True)
+    monkeypatch.chdir(tmp_path)
+    from website import create_app
+    app = create_app({'TESTING': True, 'JOB_WORKERS': 0, 'PHOTO_WORKERS': 1, 'PASSWORD_WORKERS': 0})
+    yield app
+    os.chdir(PROJECT_ROOT)
+
+
+@pytest.fixture
+def client(app):
+    client = app.test_client()
+    client.post('/login', data={'email': 'aarav@example.com', 'password': 'hashedpassword1'})
+    return client
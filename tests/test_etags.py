@@ -0,0 +1,60 @@
+# test_etags.py
+
+"""
+Conditional GETs of the detail pages (views.render_conditional): the ETag of a deleted row must not match the row
+that is created under its id afterwards. Run from the project root with python -m pytest.
+"""
+
+
+def _add_recipe(app, client, name):
+    # same number of steps and ingredients every time, so a per-row counter would give the same version again
+    client.post('/add-recipe', data={
+        'name': name, 'origin': 'Test', 'difficulty_level': '2', 'preparation_steps': 'Boil the water, Add the rice',
+        'preparation_time': '5', 'cooking_time': '10', 'serving': '2', 'source': 'self', 'ingredients': 'Water, Rice'})
+    from website.database import get_recipe_by_name
+    with app.app_context():
+        return get_recipe_by_name(1, name)
+
+
+def _add_meal(app, client, title, recipe_ids):
+    client.post('/add-meal', data={'meal_title': title, 'meal_time': 'Lunch', 'recipe_ids': recipe_ids})
+    from website.database import get_meal_by_name
+    with app.app_context():
+        return get_meal_by_name(1, title)
+
+
+def _fresh(client, url, etag):
+    # flashed messages make the page skip the validators, they are shown by the GET before
+    client.get('/')
+    return client.get(url, headers={'If-None-Match': etag})
+
+
+def test_recipe_recreated_under_the_same_id_gets_a_new_etag(app, client):
+    recipe_id = _add_recipe(app, client, 'Etag Soup')
+    client.get('/')
+    old = client.get(f'/recipe/{recipe_id}')
+    assert old.status_code == 200 and old.headers['ETag']
+    assert _fresh(client, f'/recipe/{recipe_id}', old.headers['ETag']).status_code == 304
+
+    client.post(f'/delete-recipe/{recipe_id}')
+    assert _add_recipe(app, client, 'Etag Stew') == recipe_id
+
+    response = _fresh(client, f'/recipe/{recipe_id}', old.headers['ETag'])
+    assert response.status_code == 200
+    assert response.headers['ETag'] != old.headers['ETag']
+    assert b'Etag Stew' in response.data
+
+
+def test_meal_recreated_under_the_same_id_gets_a_new_etag(app, client):
+    recipe_ids = [str(_add_recipe(app, client, f'Etag Side {n}')) for n in range(2)]
+    meal_id = _add_meal(app, client, 'Etag Lunch', recipe_ids)
+    client.get('/')
+    old = client.get(f'/meal/{meal_id}')
+    assert old.status_code == 200
+
+    client.post(f'/delete-meal/{meal_id}')
+    assert _add_meal(app, client, 'Etag Dinner', recipe_ids) == meal_id
+
+    response = _fresh(client, f'/meal/{meal_id}', old.headers['ETag'])
+    assert response.status_code == 200
+    assert b'Etag Dinner' in response.data
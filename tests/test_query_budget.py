@@ -0,0 +1,45 @@
+# test_query_budget.py
+
+from website.database import get_db_connection, get_meal_by_name
+from website.tracing import query_budget
+
+
+"""
+Query budgets of the meal pages (tracing.query_budget): the statements of a request must not grow with the number of
+recipes of the meal, so a helper called once per recipe (an N+1) fails here. Run from the project root with
+python -m pytest.
+"""
+
+
+def _recipe_ids(app, count):
+    with app.app_context():
+        rows = get_db_connection().execute("SELECT id FROM recipe WHERE user_id = 1 ORDER BY id LIMIT ?",
+                                           (count,)).fetchall()
+    assert len(rows) == count
+    return [str(row['id']) for row in rows]
+
+
+def test_add_meal_runs_the_same_statements_for_any_number_of_recipes(app, client):
+    # loading the user, the recipes of the form, the title check, BEGIN and the two INSERTs
+    with query_budget(app, 6, max_repeats=1) as traces:
+        response = client.post('/add-meal', data={'meal_title': 'Budget Lunch', 'meal_time': 'Lunch',
+                                                  'recipe_ids': _recipe_ids(app, 4)})
+    assert response.status_code == 302
+    assert len(traces) == 1
+    with app.app_context():
+        assert get_meal_by_name(1, 'Budget Lunch')
+
+
+def test_meal_page_runs_the_same_statements_for_any_number_of_recipes(app, client):
+    client.post('/add-meal', data={'meal_title': 'Budget Dinner', 'meal_time': 'Dinner',
+                                   'recipe_ids': _recipe_ids(app, 4)})
+    with app.app_context():
+        meal_id = get_meal_by_name(1, 'Budget Dinner')
+    client.get('/')
+
+    # the version for the ETag, the meal and its recipes in one query, and the user if it isn't cached
+    with query_budget(app, 4, max_repeats=1) as traces:
+        response = client.get(f'/meal/{meal_id}')
+    assert response.status_code == 200
+    assert b'Budget Dinner' in response.data
+    assert len(traces) == 1
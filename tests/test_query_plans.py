@@ -0,0 +1,23 @@
+# test_query_plans.py
+
+from pathlib import Path
+
+from website.query_plans import check_query_plans
+
+
+"""
+Every sql statement in database.py must be answered through an index (website/query_plans.py). Run from the project
+root with python -m pytest.
+"""
+
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+
+def test_every_statement_uses_an_index(monkeypatch):
+    # create_database reads ddl.sql and dml.sql relative to the working directory
+    monkeypatch.chdir(PROJECT_ROOT)
+    problems, skipped = check_query_plans()
+    assert not skipped, f"sql built at runtime in {skipped}, add sample values to query_plans.SAMPLE_VALUES"
+    assert not problems, '\n'.join(f"{func_name}: {line}\n    {' '.join(sql.split())}"
+                                   for func_name, line, sql in problems)
@@ -3,7 +3,16 @@ from datetime import datetime
 
 from flask import Flask
 from flask_login import LoginManager
-from .database import create_database, get_user_by_id
+from .database import (create_database, get_session_user, configure_user_cache, configure_ingredient_index, init_db_pool,
+                       get_pragma_profile, apply_database_pragmas, configure_render_cache)
+from .migrations import migrate, migrate_command
+from .photos import init_photo_pool, backfill_photos_command
+from .tracing import init_query_tracing
+from .metrics import init_metrics
+from .importer import import_command
+from .exporter import export_command
+from .jobs import init_jobs, jobs_worker_command
+from .passwords import init_password_pool
 
 
 """"
@@ -11,29 +20,122 @@ this script is for initialising the app. the script was taken from techwithtim's
 """
 
 
-def create_app():
+def create_app(config=None):
     app = Flask(__name__)
     app.config['SECRET_KEY'] = 'hjshjhdjah kjshkjdhjs'
 
+    # connection pool, one pooled connection is bound to each request (see database.get_db_connection)
+    app.config['DB_POOL_SIZE'] = 8
+    app.config['DB_POOL_TIMEOUT'] = 5.0
+    app.config['DB_STATEMENT_CACHE_SIZE'] = 128
+
+    # sqlite tuning, see PRAGMA_PROFILES in database.py. DB_PRAGMAS overrides single values of the profile
+    app.config['DB_PRAGMA_PROFILE'] = 'default'
+    app.config['DB_PRAGMAS'] = {}
+
+    # resized photo variants are rendered by this many processes (photo_variants jobs)
+    app.config['PHOTO_WORKERS'] = 2
+
+    # passwords are scrypt hashes with this cost (see passwords.py), hashed by PASSWORD_WORKERS processes (0 hashes in
+    # the request thread); at most PASSWORD_QUEUE_SIZE logins / sign ups wait up to PASSWORD_TIMEOUT seconds for one
+    app.config['PASSWORD_SCRYPT_N'] = 2 ** 15
+    app.config['PASSWORD_SCRYPT_R'] = 8
+    app.config['PASSWORD_SCRYPT_P'] = 1
+    app.config['PASSWORD_WORKERS'] = 2
+    app.config['PASSWORD_QUEUE_SIZE'] = 32
+    app.config['PASSWORD_TIMEOUT'] = 5.0
+
+    # cards per section on the home page, further pages are loaded on demand
+    app.config['PAGE_SIZE'] = 24
+
+    # users loaded for the session cookie are cached this long (seconds) in each process
+    app.config['USER_CACHE_SIZE'] = 1024
+    app.config['USER_CACHE_TTL'] = 30
+
+    # per-user ingredient autocomplete indexes kept in memory, rebuilt after this many seconds at the latest
+    app.config['INGREDIENT_INDEX_CACHE_SIZE'] = 256
+    app.config['INGREDIENT_INDEX_TTL'] = 300
+
+    # rendered home / recipe / meal / meal plan pages, 'memory' per process or 'redis' shared by all workers
+    app.config['RENDER_CACHE_BACKEND'] = 'memory'
+    app.config['RENDER_CACHE_MAX_BYTES'] = 32 * 1024 * 1024
+    app.config['RENDER_CACHE_TTL'] = 60
+    app.config['RENDER_CACHE_REDIS_URL'] = 'redis://localhost:6379/0'
+
+    # per-request sql tracing (see tracing.py): a Server-Timing header on every response, the same statement
+    # QUERY_TRACE_REPEATS times in one request (N+1) and statements slower than QUERY_TRACE_SLOW_MS get printed,
+    # QUERY_TRACE_LOG prints a summary line for every request
+    app.config['QUERY_TRACE'] = True
+    app.config['QUERY_TRACE_LOG'] = False
+    app.config['QUERY_TRACE_REPEATS'] = 3
+    app.config['QUERY_TRACE_SLOW_MS'] = 100
+    # statements kept per request trace, the ones after are only counted
+    app.config['QUERY_TRACE_MAX_STATEMENTS'] = 1000
+
+    # /metrics in the Prometheus text format (see metrics.py); the db metrics need QUERY_TRACE
+    app.config['METRICS'] = True
+
+    # records of /import and flask import-data written per transaction (see importer.py)
+    app.config['IMPORT_BATCH_SIZE'] = 500
+
+    # background jobs (see jobs.py): worker threads of each web process (0 leaves the jobs to flask jobs-worker),
+    # seconds between looks at the queue, runs of a failing job and the delay before the first retry (doubled for
+    # each further one), seconds after which a running job counts as abandoned, seconds finished jobs are kept
+    app.config['JOB_WORKERS'] = 2
+    app.config['JOB_POLL_INTERVAL'] = 1.0
+    app.config['JOB_MAX_ATTEMPTS'] = 3
+    app.config['JOB_RETRY_DELAY'] = 5
+    app.config['JOB_TIMEOUT'] = 3600
+    app.config['JOB_KEEP_SECONDS'] = 86400
+    # recipes / meals / meal plans / ingredients deleted per transaction when an account is deleted
+    app.config['ACCOUNT_DELETE_BATCH_SIZE'] = 500
+
+    # settings can be overridden with FLASK_ prefixed environment variables, e.g. FLASK_DB_POOL_SIZE=16
+    app.config.from_prefixed_env()
+    if config:
+        app.config.update(config)
+
     # IMPORTANT: Create database at startup
-    create_database()
+    pragmas = get_pragma_profile(app.config)
+    create_database(pragmas=pragmas)
+    # no-op (one pragma read) when the schema is up to date
+    applied = migrate(pragmas=pragmas)
+    if applied:
+        print(f"Applied database migrations {', '.join(map(str, applied))}")
+    effective = apply_database_pragmas(pragmas)
+    print(f"SQLite profile '{app.config['DB_PRAGMA_PROFILE']}': "
+          + ", ".join(f"{name}={value}" for name, value in effective.items()))
+    init_db_pool(app)
+    if app.config['QUERY_TRACE']:
+        init_query_tracing(app)
+    if app.config['METRICS']:
+        init_metrics(app)
+    init_photo_pool(app)
+    init_password_pool(app)
+    init_jobs(app)
+    configure_user_cache(app.config['USER_CACHE_SIZE'], app.config['USER_CACHE_TTL'])
+    configure_ingredient_index(app.config['INGREDIENT_INDEX_CACHE_SIZE'], app.config['INGREDIENT_INDEX_TTL'])
+    configure_render_cache(app.config['RENDER_CACHE_BACKEND'], app.config['RENDER_CACHE_MAX_BYTES'],
+                           app.config['RENDER_CACHE_TTL'], app.config['RENDER_CACHE_REDIS_URL'])
 
     from .views import views
     from .auth import auth
 
     def datetimeformat(value, fmt='%B %d, %Y at %I:%M %p'):
-        # expects an ISO-format string like '2025-04-30T17:06'
-        try:
-            dt = datetime.fromisoformat(value)
-        except ValueError:
-            dt = datetime.strptime(value, '%Y-%m-%dT%H:%M')
-        return dt.strftime(fmt)
+        # scheduled times are stored as 'YYYY-MM-DD HH:MM' (database.normalize_scheduled_datetime)
+        return datetime.fromisoformat(value).strftime(fmt)
 
     app.jinja_env.filters['datetimeformat'] = datetimeformat
 
     app.register_blueprint(views, url_prefix='/')
     app.register_blueprint(auth, url_prefix='/')
 
+    app.cli.add_command(migrate_command)
+    app.cli.add_command(backfill_photos_command)
+    app.cli.add_command(import_command)
+    app.cli.add_command(export_command)
+    app.cli.add_command(jobs_worker_command)
+
     login_manager = LoginManager()
     login_manager.login_view = 'auth.login'
     login_manager.init_app(app)
@@ -42,6 +144,6 @@ def create_app():
 
     @login_manager.user_loader
     def load_user(user_id):
-        return get_user_by_id(user_id)
+        return get_session_user(user_id)
 
     return app
@@ -1,17 +1,17 @@
 # auth.py
 
 from flask import Blueprint, render_template, request, flash, redirect, url_for
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import login_user, login_required, logout_user, current_user
-from .database import get_user_by_email, create_user, get_user_by_username
+from .database import get_user_by_email, create_user, get_user_by_username, update_user_password
+from .passwords import hash_password, verify_password, needs_rehash, PasswordPoolBusy
 import re
 
 
 """
 This script contains method for login and sign up. This was taken and adapted from techwithtim's flask tutorial which is cited in the README'
 
-The password in these methods down below are not hashed in order to support dml.sql. to use the app for actual use you need to uncomment
-line 33 and line 78 and remove line 79
+Passwords are stored as scrypt hashes, hashed and checked in a process pool (see passwords.py). The users of dml.sql
+have plain passwords; they still log in with them, and the password is replaced by its hash on their first login.
 """
 
 
@@ -29,9 +29,17 @@ def login():
 
         user = get_user_by_email(email)
 
-        if user:
-            # if check_password_hash(user.password, password):
-            if user.password == password:
+        if user and user.deleted_at:
+            flash('This account is being deleted.', category='error')
+        elif user:
+            try:
+                valid = verify_password(user.password, password)
+                if valid and needs_rehash(user.password):
+                    update_user_password(user.id, hash_password(password))
+            except PasswordPoolBusy:
+                flash('Too many logins right now, please try again in a moment.', category='error')
+                return render_template("login.html", user=current_user), 503
+            if valid:
                 flash('Logged in successfully!', category='success')
                 login_user(user, remember=True)
                 return redirect(url_for('views.home'))
@@ -75,8 +83,11 @@ def sign_up():
         elif len(password1) < 7:
             flash('Password must be at least 7 characters.', category='error')
         else:
-            # hashed_password = generate_password_hash(password1, method='scrypt')
-            hashed_password = password1
+            try:
+                hashed_password = hash_password(password1)
+            except PasswordPoolBusy:
+                flash('Too many sign ups right now, please try again in a moment.', category='error')
+                return render_template("sign_up.html", user=current_user), 503
             new_user = create_user(email = email, user_name=user_name, password=hashed_password)
             login_user(new_user, remember=True)
             flash('Account created!', category='success')
@@ -0,0 +1,288 @@
+# cache.py
+
+import bisect
+import threading
+import time
+from collections import OrderedDict
+
+
+"""
+This script contains a small in-process cache with LRU eviction and an optional time to live, a sorted prefix
+index for autocompletion and the render cache for whole pages.
+
+Each gunicorn worker has its own copy, so whatever is cached here can be stale in other workers until the ttl
+expires; keep the ttl short for data that other processes may change. The render cache can keep its pages and
+generations in redis instead (RedisBackend), then all workers share them.
+"""
+
+
+_MISSING = object()
+
+
+class TTLCache:
+    def __init__(self, maxsize: int = 1024, ttl: float = None):
+        """
+        Parameters:
+            maxsize (int): maximum number of entries, the least recently used entry is evicted first.
+            ttl (float, optional): seconds an entry stays valid, None keeps entries until they are evicted.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING or (item[1] is not None and item[1] < now):
+                if item is not _MISSING:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            item = self._data.pop(key, None)
+        return item[0] if item else None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def configure(self, maxsize: int = None, ttl: float = _MISSING):
+        with self._lock:
+            if maxsize is not None:
+                self.maxsize = maxsize
+            if ttl is not _MISSING:
+                self.ttl = ttl
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'size': len(self._data), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+
+class PrefixIndex:
+    def __init__(self, entries):
+        """
+        Read-only index answering "which keys start with ..." with two binary searches.
+
+        Parameters:
+            entries (iterable of (str, value)): search key and the value returned for it, a value may have several
+                keys (e.g. one per word).
+        """
+        entries = sorted(entries, key=lambda entry: entry[0])
+        self._keys = [key for key, _ in entries]
+        self._values = [value for _, value in entries]
+
+    def search(self, prefix: str, limit: int = 10) -> list:
+        """
+        Returns up to limit distinct values whose key starts with prefix, in key order.
+        """
+        start = bisect.bisect_left(self._keys, prefix)
+        # every key starting with prefix sorts before prefix + the highest code point
+        end = bisect.bisect_left(self._keys, prefix + '\U0010ffff', start)
+        results = []
+        for value in self._values[start:end]:
+            if value not in results:
+                results.append(value)
+                if len(results) == limit:
+                    break
+        return results
+
+    def __len__(self):
+        return len(self._keys)
+
+
+class MemoryBackend:
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, ttl: float = None):
+        """
+        In-process store of the render cache: pages in an LRU bounded by their total length, and one generation
+        counter per user.
+
+        Parameters:
+            max_bytes (int): the least recently used pages are evicted once the stored pages are longer than this.
+            ttl (float, optional): seconds a page stays valid, bounds how stale a page can be in another worker.
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._pages = OrderedDict()
+        self._size = 0
+        self._generations = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            item = self._pages.get(key)
+            if item is None or (item[1] is not None and item[1] < now):
+                if item is not None:
+                    self._size -= len(self._pages.pop(key)[0])
+                self.misses += 1
+                return None
+            self._pages.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key, value: str):
+        if len(value) > self.max_bytes:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            old = self._pages.pop(key, None)
+            if old is not None:
+                self._size -= len(old[0])
+            self._pages[key] = (value, expires)
+            self._size += len(value)
+            while self._size > self.max_bytes:
+                _, (evicted, _) = self._pages.popitem(last=False)
+                self._size -= len(evicted)
+
+    def generation(self, user_id) -> int:
+        # counters are never evicted, a reset would make pages of an old generation current again
+        return self._generations.get(user_id, 0)
+
+    def bump(self, user_id):
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+            self._size = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'size': len(self._pages), 'bytes': self._size, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses}
+
+
+class RedisBackend:
+    def __init__(self, url: str, ttl: float = None, prefix: str = 'render:'):
+        """
+        Render cache store in redis (or anything speaking its protocol, e.g. a local valkey), shared by all workers.
+        Needs the redis package. When the server can't be reached pages are rendered without the cache.
+
+        Parameters:
+            url (str): e.g. 'redis://localhost:6379/0'.
+            ttl (float, optional): seconds a page is kept, pages of old generations are only removed by this or by
+                the server's maxmemory policy.
+            prefix (str): prepended to every key.
+
+        Raises:
+            RuntimeError: If the redis package isn't installed.
+        """
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("The redis render cache backend needs the redis package: pip install redis") from e
+        self._client = redis.Redis.from_url(url)
+        self._errors = redis.RedisError
+        self.ttl = int(ttl) if ttl else None
+        # lookups of this process
+        self.hits = 0
+        self.misses = 0
+        self.prefix = prefix
+
+    def get(self, key):
+        try:
+            value = self._client.get(self.prefix + key)
+        except self._errors as e:
+            print("Render cache unavailable:", e)
+            return None
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value.decode('utf-8')
+
+    def set(self, key, value: str):
+        try:
+            self._client.set(self.prefix + key, value.encode('utf-8'), ex=self.ttl)
+        except self._errors as e:
+            print("Render cache unavailable:", e)
+
+    def generation(self, user_id):
+        key = f"{self.prefix}generation:{user_id}"
+        try:
+            value = self._client.get(key)
+            if value is None:
+                # a counter lost to eviction restarts at the current time in ms, above any value it had before
+                self._client.set(key, int(time.time() * 1000), nx=True)
+                value = self._client.get(key)
+        except self._errors as e:
+            print("Render cache unavailable:", e)
+            return None
+        return int(value)
+
+    def bump(self, user_id):
+        key = f"{self.prefix}generation:{user_id}"
+        try:
+            if not self._client.exists(key):
+                self._client.set(key, int(time.time() * 1000), nx=True)
+            self._client.incr(key)
+        except self._errors as e:
+            print("Render cache unavailable, pages of user", user_id, "may be stale until they expire:", e)
+
+    def clear(self):
+        try:
+            for key in self._client.scan_iter(self.prefix + '*'):
+                self._client.delete(key)
+        except self._errors as e:
+            print("Render cache unavailable:", e)
+
+    def stats(self) -> dict:
+        return {'backend': 'redis', 'hits': self.hits, 'misses': self.misses}
+
+
+class RenderCache:
+    def __init__(self, backend):
+        """
+        Rendered pages keyed by (user, page, generation of the user's data). Writes bump the generation, so the
+        pages rendered before are never looked up again and age out of the backend.
+
+        Parameters:
+            backend: MemoryBackend or RedisBackend.
+        """
+        self.backend = backend
+
+    def page(self, user_id, page: str, render):
+        """
+        Returns the cached page, or calls render() and caches what it returns if that is a str (a redirect or
+        other response is passed through).
+        """
+        generation = self.backend.generation(user_id)
+        if generation is None:
+            return render()
+        # the generation is read before render() queries the data: a write committed in between bumps it, so the
+        # page ends up under an old generation instead of serving stale data under the new one
+        key = f"{user_id}:{generation}:{page}"
+        html = self.backend.get(key)
+        if html is not None:
+            return html
+        html = render()
+        if isinstance(html, str):
+            self.backend.set(key, html)
+        return html
+
+    def bump(self, user_id):
+        self.backend.bump(user_id)
@@ -2,8 +2,16 @@
 
 import sqlite3
 import json
+import re
+import time
+from datetime import datetime
 from pathlib import Path
+from flask import current_app, g, has_app_context
 from .models import User
+from .cache import TTLCache, PrefixIndex, RenderCache, MemoryBackend, RedisBackend
+from .quantities import parse_ingredient, parse_amount, unit_code, format_ingredient
+from .pool import ConnectionPool, PooledConnection
+from .tracing import TracedConnection
 
 
 """
@@ -12,11 +20,17 @@ This script contains python code and raw sql queries that help us perform CRUD o
 The methods in this scripts are order top to down as follows:
 1) get connection
 2) create database
-3) User related CRUD queries
-4) Ingredients related CRUD queries
-5) Recipe ingredients related CRUD queries
-6) meals related CRUD queries
-7) meal plans related CRUD queries
+3) render cache generations
+4) User related CRUD queries
+5) Ingredients related CRUD queries
+6) Recipe ingredients related CRUD queries
+7) meals related CRUD queries
+8) meal plans related CRUD queries
+9) photo related queries
+10) recipe search
+11) bulk import
+12) export
+13) background jobs
 
 """
 
@@ -27,32 +41,205 @@ DDL_PATH = Path("website/sql/ddl.sql")
 DML_PATH = Path("website/sql/dml.sql")
 
 
-def get_db_connection(db_path=DB_PATH):
-    conn = sqlite3.connect(db_path, detect_types=sqlite3.PARSE_DECLTYPES)
+# Named pragma profiles, picked with the DB_PRAGMA_PROFILE setting. Single values can be overridden with DB_PRAGMAS.
+#   default - WAL journal so readers don't wait on writers, fsync only at checkpoints (an OS crash can lose the last
+#             commits but never corrupts the file), 64MB page cache, 256MB memory map
+#   durable - same, but fsync on every commit
+#   legacy  - sqlite's own defaults (rollback journal, fsync on every commit) with a busy timeout
+PRAGMA_PROFILES = {
+    'default': {
+        'journal_mode': 'wal',
+        'synchronous': 'normal',
+        'cache_size': -64000,
+        'mmap_size': 268435456,
+        'temp_store': 'memory',
+        'busy_timeout': 5000,
+    },
+    'durable': {
+        'journal_mode': 'wal',
+        'synchronous': 'full',
+        'cache_size': -64000,
+        'mmap_size': 268435456,
+        'temp_store': 'memory',
+        'busy_timeout': 5000,
+    },
+    'legacy': {
+        'journal_mode': 'delete',
+        'synchronous': 'full',
+        'busy_timeout': 5000,
+    },
+}
+
+# journal_mode is stored in the database file, the others only last for the connection they are set on
+_PER_CONNECTION_PRAGMAS = ('synchronous', 'cache_size', 'mmap_size', 'temp_store', 'busy_timeout')
+_PRAGMA_NAMES = ('journal_mode',) + _PER_CONNECTION_PRAGMAS
+
+
+def get_pragma_profile(config) -> dict:
+    """
+    Returns the pragmas of the profile named by config['DB_PRAGMA_PROFILE'] with config['DB_PRAGMAS'] applied on top.
+
+    Raises:
+        ValueError: If the profile or one of the pragma names / values is unknown.
+    """
+    name = config.get('DB_PRAGMA_PROFILE', 'default')
+    if name not in PRAGMA_PROFILES:
+        raise ValueError(f"Unknown DB_PRAGMA_PROFILE {name!r}, expected one of {', '.join(PRAGMA_PROFILES)}")
+
+    pragmas = dict(PRAGMA_PROFILES[name])
+    pragmas.update(config.get('DB_PRAGMAS') or {})
+    for key, value in pragmas.items():
+        # the values end up in the PRAGMA statement itself, so only allow plain words and numbers
+        if key not in _PRAGMA_NAMES or not re.fullmatch(r'-?\w+', str(value)):
+            raise ValueError(f"Invalid pragma setting {key} = {value!r}")
+    return pragmas
+
+def _apply_pragmas(conn, pragmas, names=_PER_CONNECTION_PRAGMAS):
+    for name in names:
+        if name in pragmas:
+            conn.execute(f"PRAGMA {name} = {pragmas[name]}")
+
+def _connect(db_path=DB_PATH, pragmas=None, **kwargs):
+    conn = sqlite3.connect(db_path, detect_types=sqlite3.PARSE_DECLTYPES, **kwargs)
     conn.row_factory = sqlite3.Row
     conn.execute("PRAGMA foreign_keys = ON")
+    if pragmas:
+        _apply_pragmas(conn, pragmas)
     return conn
 
-def create_database(db_path=DB_PATH):
+def apply_database_pragmas(pragmas, db_path=DB_PATH) -> dict:
+    """
+    Switches the database file to the profile's journal mode and returns the settings a new connection ends up
+    with, as reported by sqlite itself.
+    """
+    conn = _connect(db_path, pragmas)
+    _apply_pragmas(conn, pragmas, names=('journal_mode',))
+    effective = {name: conn.execute(f"PRAGMA {name}").fetchone()[0] for name in _PRAGMA_NAMES}
+    conn.close()
+    return effective
+
+def get_db_connection(db_path=DB_PATH):
+    """
+    Inside an app context this returns the connection bound to that context, taken from the app's pool on first
+    use; every helper called while handling one request shares it. Outside an app context (startup, scripts) a
+    plain connection is opened.
+    With QUERY_TRACE on, the statements run on it are recorded in the trace of the request (see tracing.py).
+    """
+    if db_path == DB_PATH and has_app_context() and 'db_pool' in current_app.extensions:
+        if 'db_conn' not in g:
+            g.db_conn = current_app.extensions['db_pool'].acquire()
+            g.db_conn.trace = g.get('query_trace')
+        return g.db_conn
+    return _connect(db_path)
+
+def release_db_connection(exception=None):
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        conn.trace = None
+        current_app.extensions['db_pool'].release(conn)
+
+def init_db_pool(app):
+    cache_size = app.config['DB_STATEMENT_CACHE_SIZE']
+    pragmas = get_pragma_profile(app.config)
+    factory = TracedConnection if app.config['QUERY_TRACE'] else PooledConnection
+    pool = ConnectionPool(
+        lambda: _connect(DB_PATH, pragmas, factory=factory, check_same_thread=False, cached_statements=cache_size),
+        max_size=app.config['DB_POOL_SIZE'],
+        timeout=app.config['DB_POOL_TIMEOUT'],
+    )
+    app.extensions['db_pool'] = pool
+    app.teardown_appcontext(release_db_connection)
+    return pool
+
+def get_pool_stats():
+    """
+    Returns size / in_use / wait time counters of the current app's pool (empty dict outside an app context).
+    """
+    if has_app_context() and 'db_pool' in current_app.extensions:
+        return current_app.extensions['db_pool'].stats()
+    return {}
+
+def get_cache_stats():
+    """
+    Returns the stats (hits, misses, ...) of the session user, ingredient index and render caches of this process.
+    """
+    return {
+        'session_user': _session_users.stats(),
+        'ingredient_index': _ingredient_indexes.stats(),
+        'render': _render_cache.backend.stats(),
+    }
+
+def create_database(db_path=DB_PATH, pragmas=None):
     if not db_path.exists():
         db_path.parent.mkdir(parents=True, exist_ok=True)
 
-        conn = get_db_connection()
+        conn = _connect(db_path, pragmas)
+        if pragmas:
+            _apply_pragmas(conn, pragmas, names=('journal_mode',))
         cursor = conn.cursor()
 
         for script in (DDL_PATH, DML_PATH):
             with script.open(encoding="utf-8") as f:
                 cursor.executescript(f.read())
         conn.commit()
+        conn.close()
         print("Database created and populated successfully")
 
+##############################################
+# ----------- Render Cache Related -----------#
+##############################################
+
+# rendered pages of the views, keyed by (user, page, generation of the user's data). Every write helper in this file
+# bumps the generation of the user whose rows it changed right after its commit, so a cached page is never served
+# once the data behind it changed.
+_render_cache = RenderCache(MemoryBackend())
+
+def configure_render_cache(backend='memory', max_bytes=32 * 1024 * 1024, ttl=None, redis_url=None):
+    """
+    Parameters:
+        backend (str): 'memory' (per process) or 'redis' (shared by all workers, needs redis_url).
+        max_bytes (int): size bound of the memory backend, redis is bounded by its own maxmemory.
+        ttl (float, optional): seconds a page is kept.
+
+    Raises:
+        ValueError: If backend is unknown.
+    """
+    if backend == 'memory':
+        _render_cache.backend = MemoryBackend(max_bytes=max_bytes, ttl=ttl)
+    elif backend == 'redis':
+        _render_cache.backend = RedisBackend(redis_url, ttl=ttl)
+    else:
+        raise ValueError(f"Unknown render cache backend {backend!r}, use 'memory' or 'redis'")
+
+def cached_page(user_id, page, render):
+    """
+    Returns the page of a user from the render cache, or the result of render() (see cache.RenderCache.page).
+    """
+    return _render_cache.page(int(user_id), page, render)
+
+def bump_user_generation(user_id):
+    if user_id is not None:
+        _render_cache.bump(int(user_id))
+
+def _recipe_owner(conn, recipe_id):
+    row = conn.execute("SELECT user_id FROM recipe WHERE id = ?", (recipe_id,)).fetchone()
+    return row['user_id'] if row else None
+
+def _meal_owner(conn, meal_id):
+    row = conn.execute("SELECT user_id FROM meal WHERE meal_id = ?", (meal_id,)).fetchone()
+    return row['user_id'] if row else None
+
+def _meal_plan_owner(conn, meal_plan_id):
+    row = conn.execute("SELECT user_id FROM meal_plan WHERE meal_plan_id = ?", (meal_plan_id,)).fetchone()
+    return row['user_id'] if row else None
+
 ######################################
 # ----------- User Related -----------
 ######################################
 
 # base query for get_user
 _BASE_USER_WITH_JSON = """
-    SELECT u.id, u.user_name, u.name, u.email, u.password, u.cooking_level, u.photo_data,
+    SELECT u.id, u.user_name, u.name, u.email, u.password, u.cooking_level, u.photo_hash, u.deleted_at,
         COALESCE(
             (SELECT json_group_array(preference)
                 FROM user_dietary_preference
@@ -94,10 +281,80 @@ def get_user_by_id(user_id):
     conn.close()
     return User(user_row) if user_row else None
 
-def create_user(email, user_name, password, photo_data = None, cooking_level=1):
+# flask-login loads the current user on every request. Only the columns needed for that are selected, User loads
+# the password, preferences and allergies on first access. Loaded users are kept for USER_CACHE_TTL seconds; other
+# processes don't see invalidate_session_user, so their copy can be that old.
+_SESSION_USER = """
+    SELECT id, user_name, email, cooking_level, photo_hash FROM users WHERE id = ? AND deleted_at IS NULL
+"""
+_session_users = TTLCache(maxsize=1024, ttl=30)
+
+def configure_user_cache(maxsize, ttl):
+    _session_users.configure(maxsize=maxsize, ttl=ttl)
+
+def get_session_user(user_id):
     """
-    - dietary_preferences: python list of strings
-    - allergies: python list of strings
+    user_loader for flask-login.
+
+    Parameters:
+        user_id (str): id stored in the session cookie.
+
+    Returns:
+        User or None: cached user with the identity columns, None if the user does not exist (anymore) or is being
+            deleted.
+    """
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+
+    user = _session_users.get(user_id)
+    if user is None:
+        conn = get_db_connection()
+        user_row = conn.execute(_SESSION_USER, (user_id,)).fetchone()
+        conn.close()
+        if user_row is None:
+            return None
+        user = User(user_row)
+        _session_users.set(user_id, user)
+    return user
+
+def invalidate_session_user(user_id):
+    _session_users.pop(int(user_id))
+
+def get_user_details(user_id):
+    """
+    Returns the dietary preferences and allergies of a user as JSON arrays.
+    """
+    conn = get_db_connection()
+    row = conn.execute("""
+        SELECT
+            (SELECT json_group_array(preference) FROM user_dietary_preference WHERE user_id = ?),
+            (SELECT json_group_array(allergy) FROM user_allergy WHERE user_id = ?)
+    """, (user_id, user_id)).fetchone()
+    conn.close()
+    return row[0], row[1]
+
+def get_user_password(user_id):
+    conn = get_db_connection()
+    row = conn.execute("SELECT password FROM users WHERE id = ?", (user_id,)).fetchone()
+    conn.close()
+    return row['password'] if row else None
+
+def update_user_password(user_id, password_hash):
+    """
+    Replaces the stored password, e.g. a plain one by its hash after a login (passwords.needs_rehash).
+    """
+    conn = get_db_connection()
+    conn.execute("UPDATE users SET password = ? WHERE id = ?", (password_hash, user_id))
+    conn.commit()
+    conn.close()
+    invalidate_session_user(user_id)
+
+def create_user(email, user_name, password, photo_hash = None, cooking_level=1):
+    """
+    - password: hash of the password (passwords.hash_password)
+    - photo_hash: digest returned by photos.save_photo
     """
 
     conn = get_db_connection()
@@ -105,15 +362,20 @@ def create_user(email, user_name, password, photo_data = None, cooking_level=1):
 
     # input data in user table
     cursor.execute('''
-        INSERT INTO users (email, user_name, password, cooking_level, photo_data)
+        INSERT INTO users (email, user_name, password, cooking_level, photo_hash)
         VALUES (?, ?, ?, ?, ?)
-    ''', (email, user_name, password, cooking_level, photo_data))
+    ''', (email, user_name, password, cooking_level, photo_hash))
     conn.commit()
     conn.close()
+    # ids of deleted users can be handed out again
+    bump_user_generation(cursor.lastrowid)
     user = get_user_by_email(email)
     return user
 
-def update_user_profile(user_id, email, user_name, photo_data, cooking_level, dietary_preferences, allergies):
+def update_user_profile(user_id, email, user_name, photo_hash, cooking_level, dietary_preferences, allergies):
+    """
+    photo_hash is the digest of a newly uploaded photo, None keeps the current photo.
+    """
 
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -125,9 +387,9 @@ def update_user_profile(user_id, email, user_name, photo_data, cooking_level, di
         # update user
         cursor.execute("""
             Update users 
-            set user_name = ?, email = ?, cooking_level = ?, photo_data = ?
+            set user_name = ?, email = ?, cooking_level = ?, photo_hash = COALESCE(?, photo_hash)
             where id = ?
-        """, (user_name, email, cooking_level, photo_data, user_id))
+        """, (user_name, email, cooking_level, photo_hash, user_id))
 
         cursor.execute(
             "DELETE FROM user_dietary_preference WHERE user_id = ?",
@@ -154,6 +416,8 @@ def update_user_profile(user_id, email, user_name, photo_data, cooking_level, di
         conn.rollback()
     finally:
         conn.close()
+        invalidate_session_user(user_id)
+        bump_user_generation(user_id)
         return get_user_by_id(user_id)
 
 def delete_user_by_id(user_id):
@@ -161,6 +425,58 @@ def delete_user_by_id(user_id):
     conn.execute('DELETE FROM users WHERE id = ?', (user_id,))
     conn.commit()
     conn.close()
+    invalidate_session_user(user_id)
+    invalidate_ingredient_index(user_id)
+    bump_user_generation(user_id)
+
+def mark_user_deleted(user_id: int, max_attempts: int = 3) -> int:
+    """
+    First step of deleting an account, the rest is the delete_user job (jobs.py, purge_user): from now on the user
+    can't log in and their sessions are no longer accepted.
+
+    The mark and the job are written in one transaction, so there is no account that is closed but never purged
+    (or purged while it can still log in). See jobs.enqueue_user_deletion, which also wakes up the workers.
+
+    Parameters:
+        user_id (int): the account to delete.
+        max_attempts (int): runs of the delete_user job before it counts as failed.
+
+    Returns:
+        int: ID of the delete_user job.
+    """
+    conn = get_db_connection()
+    try:
+        conn.execute("UPDATE users SET deleted_at = CURRENT_TIMESTAMP WHERE id = ?", (user_id,))
+        job_id = _insert_job(conn, 'delete_user', json.dumps({'user_id': user_id}), user_id, max_attempts, None)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    invalidate_session_user(user_id)
+    return job_id
+
+def purge_user(user_id, batch_size=500):
+    """
+    Deletes a user with all their rows like delete_user_by_id, but in many short transactions of batch_size
+    recipes, meals, meal plans or ingredients each, so other requests get the write lock in between.
+
+    Deleting the recipes takes the meals (trg_cleanup_orphan_meal) and with them the meal plans along; the rows
+    left after that are deleted by the ON DELETE CASCADEs of the user.
+    """
+    conn = get_db_connection()
+    for sql in (
+        "DELETE FROM recipe WHERE id IN (SELECT id FROM recipe WHERE user_id = ? LIMIT ?)",
+        "DELETE FROM meal WHERE meal_id IN (SELECT meal_id FROM meal WHERE user_id = ? LIMIT ?)",
+        "DELETE FROM meal_plan WHERE meal_plan_id IN (SELECT meal_plan_id FROM meal_plan WHERE user_id = ? LIMIT ?)",
+        "DELETE FROM ingredient WHERE id IN (SELECT id FROM ingredient WHERE user_id = ? LIMIT ?)",
+    ):
+        while conn.execute(sql, (user_id, batch_size)).rowcount:
+            conn.commit()
+        conn.commit()
+    conn.close()
+    delete_user_by_id(user_id)
 
 #############################################
 # ----------- Ingredient Related -----------#
@@ -176,7 +492,7 @@ def create_ingredient(user_id: int,
 
     Parameters:
         user_id (int): ID of the user adding the ingredient.
-        name (str): Unique name of the ingredient.
+        name (str): Unique name of the ingredient, unique ignoring case and spacing.
         store (str, optional): Preferred store name.
         unit (str, optional): Unit of measurement (e.g., 'g', 'cup').
         nutritional_label (dict, optional): Nutritional info stored as JSON.
@@ -197,11 +513,12 @@ def create_ingredient(user_id: int,
     cursor.execute(
         '''
         INSERT INTO Ingredient (
-            user_id, name, store, unit, seasonal_availability
-        ) VALUES (?, ?, ?, ?, ?)
+            user_id, name, name_key, store, unit, seasonal_availability
+        ) VALUES (?, ?, ?, ?, ?, ?)
         ''', (
             user_id,
-            name,
+            " ".join(name.split()),
+            normalize_ingredient_name(name),
             store,
             unit,
             seasonal_availability
@@ -210,34 +527,117 @@ def create_ingredient(user_id: int,
     conn.commit()
     ingredient_id = cursor.lastrowid
     conn.close()
+    invalidate_ingredient_index(user_id)
+    bump_user_generation(user_id)
     return ingredient_id
 
 def get_ingredients(user_id: int, name_query: str):
     """
-    Return the ingredient for a given user whose name matches name_query.
-
-    Uses a case‐insensitive LIKE search so you can pass part of the name.
+    Return the ingredient of a given user with this name, ignoring case and spacing.
 
     Parameters:
       user_id     – the ID of the user who owns the ingredients
-      name_query  – the ingredient name or fragment to look for
+      name_query  – the ingredient name
 
     Returns:
-      A list of sqlite3.Row objects, each representing one ingredient.
+      sqlite3.Row or None
     """
     conn = get_db_connection()
-    cursor = conn.cursor()
-    # Use LOWER() on both sides for case‐insensitive matching,
-    # and wrap name_query in % for partial matches.
-    sql = """
-        SELECT *
-        FROM ingredient
-        WHERE user_id = ? AND LOWER(name) LIKE LOWER(?)
-    """
-    pattern = f"%{name_query.strip()}%"
-    rows = cursor.execute(sql, (user_id, pattern)).fetchone()
+    row = conn.execute(
+        "SELECT * FROM ingredient WHERE user_id = ? AND name_key = ?",
+        (user_id, normalize_ingredient_name(name_query))
+    ).fetchone()
     conn.close()
-    return rows
+    return row
+
+def normalize_ingredient_name(name: str) -> str:
+    """
+    Key ingredients are matched on (ingredient.name_key): lower case, surrounding and repeated whitespace removed.
+    """
+    return " ".join(name.split()).lower()
+
+def resolve_ingredients(user_id: int, names: list[str], cursor=None) -> dict:
+    """
+    Looks up a whole list of ingredient names of a user and creates the missing ones, in one statement.
+
+    Parameters:
+        user_id (int): owner of the ingredients.
+        names (list[str]): ingredient names as typed, names that only differ in case or spacing share one ingredient.
+        cursor (sqlite3.Cursor, optional): run inside the caller's transaction; without it the new ingredients are
+            committed right away.
+
+    Returns:
+        dict: {name: ingredient id} for every name in names.
+    """
+    # display name of each key, the first spelling wins for new ingredients
+    wanted = {}
+    for name in names:
+        wanted.setdefault(normalize_ingredient_name(name), " ".join(name.split()))
+    wanted.pop('', None)
+    if not wanted:
+        return {}
+
+    own_connection = cursor is None
+    if own_connection:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+    try:
+        # the no-op DO UPDATE makes RETURNING report existing rows too (DO NOTHING would skip them)
+        rows = cursor.execute("""
+            INSERT INTO ingredient (user_id, name, name_key)
+            SELECT ?, json_extract(value, '$[1]'), json_extract(value, '$[0]') FROM json_each(?) WHERE true
+            ON CONFLICT (user_id, name_key) DO UPDATE SET name_key = excluded.name_key
+            RETURNING id, name_key
+        """, (user_id, json.dumps(list(wanted.items())))).fetchall()
+        if own_connection:
+            conn.commit()
+            invalidate_ingredient_index(user_id)
+            bump_user_generation(user_id)
+    except BaseException:
+        if own_connection:
+            conn.rollback()
+        raise
+    finally:
+        if own_connection:
+            conn.close()
+
+    ids = {row['name_key']: row['id'] for row in rows}
+    return {name: ids[normalize_ingredient_name(name)] for name in names if normalize_ingredient_name(name)}
+
+# autocomplete index of each user's ingredients, rebuilt on first use after it was invalidated. Writers invalidate
+# it in this process; other processes pick up new ingredients once their copy is INGREDIENT_INDEX_TTL seconds old.
+_ingredient_indexes = TTLCache(maxsize=256, ttl=300)
+
+def configure_ingredient_index(maxsize, ttl):
+    _ingredient_indexes.configure(maxsize=maxsize, ttl=ttl)
+
+def invalidate_ingredient_index(user_id):
+    _ingredient_indexes.pop(int(user_id))
+
+def _ingredient_index(user_id: int) -> PrefixIndex:
+    index = _ingredient_indexes.get(user_id)
+    if index is None:
+        conn = get_db_connection()
+        rows = conn.execute("SELECT name, name_key FROM ingredient WHERE user_id = ?", (user_id,)).fetchall()
+        conn.close()
+        entries = []
+        for row in rows:
+            # the whole name and every later word of it, so "oil" also finds "Olive Oil"
+            words = row['name_key'].split()
+            entries.extend((" ".join(words[i:]), row['name']) for i in range(len(words)))
+        index = PrefixIndex(entries)
+        _ingredient_indexes.set(user_id, index)
+    return index
+
+def suggest_ingredients(user_id: int, prefix: str, limit: int = 10) -> list[str]:
+    """
+    Names of the user's ingredients with a word starting with prefix (ignoring case and spacing), for autocompletion.
+    Only the first call after the index was invalidated reads the database.
+    """
+    prefix = normalize_ingredient_name(prefix)
+    if not prefix:
+        return []
+    return _ingredient_index(int(user_id)).search(prefix, limit)
 
 ####################################################
 # ----------- Recipe Ingredient Related -----------#
@@ -260,21 +660,30 @@ def create_recipe_ingredient(recipe_id: int,
     Raises:
         ValueError: If the link already exists.
     """
+    # typed copy of the quantity for sums and scaling, left empty for units quantities.py doesn't know
+    amount = parse_amount(quantity)
+    code = (unit_code(unit) if unit else 'piece') if amount is not None else None
+    if code is None:
+        amount = None
+
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
         cursor.execute(
             '''
             INSERT INTO recipe_ingredient (
-                recipe_id, ingredient_id, quantity, unit
-            ) VALUES (?, ?, ?, ?)
+                recipe_id, ingredient_id, quantity, unit, amount, unit_code
+            ) VALUES (?, ?, ?, ?, ?, ?)
             ''', (
                 recipe_id,
                 ingredient_id,
                 quantity,
-                unit
+                unit,
+                amount,
+                code
             )
         )
+        owner = _recipe_owner(conn, recipe_id)
         conn.commit()
     except sqlite3.IntegrityError as e:
         conn.rollback()
@@ -283,17 +692,33 @@ def create_recipe_ingredient(recipe_id: int,
         ) from e
     finally:
         conn.close()
+    bump_user_generation(owner)
+
+def get_recipe_ingredients(recipe_id: int, servings: int = None):
+    """
+    Ingredients of a recipe in the order they were entered.
 
-def get_recipe_ingredients(recipe_id: int):
+    Parameters:
+        recipe_id (int): the recipe.
+        servings (int, optional): scale the amounts from the recipe's serving_size to this many servings.
+
+    Returns:
+        list[sqlite3.Row]: name, quantity and unit as typed, amount (scaled, None if the quantity isn't a number in a
+            known unit) and unit_code.
+    """
     conn = get_db_connection()
     cursor = conn.cursor()
 
     ingredients = cursor.execute('''
-            SELECT ingredient.name
-            FROM ingredient
-            JOIN recipe_ingredient ON ingredient.id = recipe_ingredient.ingredient_id
+            SELECT ingredient.name, recipe_ingredient.quantity, recipe_ingredient.unit,
+                   recipe_ingredient.amount * COALESCE(? * 1.0 / NULLIF(recipe.serving_size, 0), 1) AS amount,
+                   recipe_ingredient.unit_code
+            FROM recipe_ingredient
+            JOIN ingredient ON ingredient.id = recipe_ingredient.ingredient_id
+            JOIN recipe ON recipe.id = recipe_ingredient.recipe_id
             WHERE recipe_ingredient.recipe_id = ?
-        ''', (recipe_id,)).fetchall()
+            ORDER BY recipe_ingredient.id
+        ''', (servings, recipe_id)).fetchall()
 
     conn.close()
     return ingredients
@@ -303,59 +728,108 @@ def delete_recipe_ingredient(recipe_id: int):
     conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute('DELETE FROM recipe_ingredient WHERE recipe_id = ?', (recipe_id,))
+    owner = _recipe_owner(conn, recipe_id)
     conn.commit()
     conn.close()
+    bump_user_generation(owner)
 
 #########################################
 # ----------- Recipe Related -----------#
 #########################################
-def create_recipe(user_id: int, name: str, preparation_steps: list, preparation_time: str, cooking_time: str,
-                  origin: str = 'To be known', difficulty: int = 1, serving_size: int = 1,
-                  source: str = 'Unknown', photo_data: list = None) -> int:
-
+def save_recipe(user_id: int, name: str, preparation_steps: list, ingredients: list, preparation_time: str,
+                cooking_time: str, origin: str = 'To be known', difficulty: int = 1, serving_size: int = 1,
+                source: str = 'Unknown', photo_hash: str = None, recipe_id: int = None):
     """
-     Insert a new recipe into the Recipe table.
+     Creates or updates a recipe together with its steps and ingredient links in one transaction, so a failure
+     leaves no half written recipe behind.
 
      Parameters:
-     - user_id: ID of the user creating the recipe
+     - user_id: ID of the user owning the recipe
      - name: Unique recipe name
-     - origin: Recipe origin text
-     - difficulty: Difficulty level (1-5)
-     - preparation_steps: List of preparation steps
-     - preparation_time: Prep time in HH:MM:SS format
-     - cooking_time: Cooking time in HH:MM:SS format
-     - serving_size: Number of servings
-     - source: Recipe source (e.g., 'AI' or 'self')
-     - photos: List of up to 4 photo URLs or identifiers -- update-- only 1 photo per recipe now
+     - preparation_steps: List of preparation steps, stored in this order
+     - ingredients: List of ingredient entries as typed ("1 1/2 cups rice", "salt"), split by
+       quantities.parse_ingredient; missing ingredients are created for the user
+     - preparation_time / cooking_time: minutes
+     - origin, difficulty (1-5), serving_size, source: recipe columns
+     - photo_hash: digest of the recipe photo in the photo store (photos.save_photo), None keeps the current photo
+     - recipe_id: recipe to update, None creates a new one
+
+     Returns:
+     - (recipe_id, ingredient_ids): id of the saved recipe and ids of its ingredients in the given order
+
+     Raises:
+     - ValueError: if recipe_id is not a recipe of this user
+     - sqlite3.Error: the transaction is rolled back
      """
 
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute(
-        '''INSERT INTO recipe (
-                        user_id, name, origin, difficulty,
-                        preparation_time, cooking_time,
-                        serving_size, source, photo
-                   ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-    (user_id, name, origin, difficulty, preparation_time, cooking_time, serving_size, source,
-        photo_data)
-    )
-    recipe_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-
-    for idx, step in enumerate(preparation_steps, start=1):
-                insert_recipe_steps(recipe_id, idx, step)
-
-    return recipe_id
+    try:
+        if not conn.in_transaction:
+            # take the write lock up front instead of failing to upgrade a read lock halfway through
+            cursor.execute("BEGIN IMMEDIATE")
+
+        if recipe_id is None:
+            cursor.execute(
+                '''INSERT INTO recipe (
+                                user_id, name, origin, difficulty,
+                                preparation_time, cooking_time,
+                                serving_size, source, photo_hash
+                           ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                (user_id, name, origin, difficulty, preparation_time, cooking_time, serving_size, source,
+                 photo_hash)
+            )
+            recipe_id = cursor.lastrowid
+        else:
+            cursor.execute('''
+                UPDATE recipe
+                SET name = ?, origin = ?, difficulty = ?, preparation_time = ?, cooking_time = ?,
+                    serving_size = ?, source = ?, photo_hash = COALESCE(?, photo_hash)
+                WHERE id = ? AND user_id = ?
+            ''', (name, origin, difficulty, preparation_time, cooking_time, serving_size, source,
+                  photo_hash, recipe_id, user_id))
+            if cursor.rowcount == 0:
+                raise ValueError(f"Recipe {recipe_id} not found.")
+            cursor.execute("DELETE FROM recipe_step WHERE recipe_id = ?", (recipe_id,))
+            cursor.execute("DELETE FROM recipe_ingredient WHERE recipe_id = ?", (recipe_id,))
+
+        cursor.executemany(
+            "INSERT INTO recipe_step (recipe_id, step_number, description) VALUES (?, ?, ?)",
+            [(recipe_id, idx, step) for idx, step in enumerate(preparation_steps, start=1)]
+        )
 
+        entries = [parse_ingredient(entry) for entry in ingredients]
+        ids = resolve_ingredients(user_id, [entry['name'] for entry in entries], cursor=cursor)
+        # the same ingredient listed twice is linked once, with the first quantity
+        links = {}
+        for entry in entries:
+            links.setdefault(ids[entry['name']], entry)
+        cursor.executemany(
+            """
+            INSERT INTO recipe_ingredient (recipe_id, ingredient_id, quantity, unit, amount, unit_code)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            [(recipe_id, ingredient_id, entry['quantity'], entry['unit'], entry['amount'], entry['unit_code'])
+             for ingredient_id, entry in links.items()]
+        )
+        ingredient_ids = list(links)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    # after the commit, so a concurrent rebuild can't cache the old list
+    invalidate_ingredient_index(user_id)
+    bump_user_generation(user_id)
+    return recipe_id, ingredient_ids
 
 
 def get_all_recipes(user_id):
     conn = get_db_connection()
     cursor = conn.cursor()
     recipes = cursor.execute("""
-        SELECT r.id, r.name, r.origin, r.photo
+        SELECT r.id, r.name, r.origin, r.photo_hash
         FROM recipe AS r
         WHERE r.user_id = ?
         ORDER BY r.id
@@ -363,16 +837,59 @@ def get_all_recipes(user_id):
     conn.close()
     return recipes
 
+def _keyset_page(rows, limit, key):
+    # one row more than asked for tells whether there is a next page
+    if len(rows) > limit:
+        return rows[:limit], rows[limit - 1][key]
+    return rows, None
+
+def get_recipes_page(user_id, after_id=0, limit=24):
+    """
+    One page of a user's recipes for the dashboard. Pages are addressed by the last id of the previous page
+    (keyset pagination), so every page is one index range read on (user_id, id) however many recipes the user has.
+
+    Parameters:
+        user_id (int): owner of the recipes.
+        after_id (int): last recipe id of the previous page, 0 for the first page.
+        limit (int): page size.
+
+    Returns:
+        (list[sqlite3.Row], int or None): the recipes and the after_id of the next page, None on the last page.
+    """
+    conn = get_db_connection()
+    rows = conn.execute("""
+        SELECT r.id, r.name, r.origin, r.photo_hash
+        FROM recipe AS r
+        WHERE r.user_id = ? AND r.id > ?
+        ORDER BY r.id
+        LIMIT ?
+    """, (user_id, after_id, limit + 1)).fetchall()
+    conn.close()
+    return _keyset_page(rows, limit, 'id')
+
 def get_recipe(recipe_id, user_id):
     conn = get_db_connection()
     cursor = conn.cursor()
     recipe = cursor.execute("""
-        SELECT * FROM recipe 
+        SELECT id, user_id, name, origin, difficulty, preparation_time, cooking_time,
+               serving_size, source, photo_hash
+        FROM recipe
         WHERE id = ? and user_id = ?
         """, (recipe_id, user_id)).fetchone()
     conn.close()
     return recipe
 
+def get_recipe_version(recipe_id, user_id):
+    """
+    version and updated_at of a recipe of the user (None if it isn't theirs), maintained by the triggers of migrations
+    0007 / 0010 on every change of the recipe, its steps or its ingredients.
+    """
+    conn = get_db_connection()
+    row = conn.execute("SELECT version, updated_at FROM recipe WHERE id = ? AND user_id = ?",
+                       (recipe_id, user_id)).fetchone()
+    conn.close()
+    return row
+
 def get_recipe_by_name(user_id, name):
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -388,62 +905,10 @@ def get_recipe_by_name(user_id, name):
 def delete_recipe(recipe_id):
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('DELETE FROM recipe WHERE id = ?', (recipe_id,))
-    conn.commit()
-    conn.close()
-
-def update_recipe(name, origin, difficulty, preparation_steps, preparation_time, cooking_time,
-                  serving_size, source, photo_data:bytes, recipe_id):
-
-    # need to handle ingredient update
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    if photo_data is not None:
-            # user uploaded a new image → overwrite
-            cursor.execute('''
-                UPDATE recipe
-                SET name = ?, origin = ?, difficulty = ?, preparation_time = ?, cooking_time = ?, 
-                    serving_size = ?, source = ?, photo = ?
-                WHERE id = ?
-            ''', (name, origin, difficulty, preparation_time, cooking_time, serving_size, source,
-                  photo_data, recipe_id)
-            )
-    else:
-        # no new image → leave photo untouched
-        cursor.execute('''
-            UPDATE recipe
-                SET name = ?, origin = ?, difficulty = ?, preparation_time = ?, cooking_time = ?, 
-                    serving_size = ?, source = ?
-                WHERE id = ?
-            ''', (name, origin, difficulty, preparation_time, cooking_time, serving_size,
-            source, recipe_id)
-        )
-    conn.commit()
-
-    delete_recipe_steps(recipe_id)
-
-    for idx, step in enumerate(preparation_steps, start=1):
-        insert_recipe_steps(recipe_id, idx, step)
-
-    conn.close()
-
-def insert_recipe_steps(recipe_id, step_number, description):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO recipe_step (recipe_id, step_number, description)
-        VALUES (?, ?, ?)""", (recipe_id, step_number, description))
-    conn.commit()
-    conn.close()
-
-def delete_recipe_steps(recipe_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        Delete FROM recipe_step where recipe_id = ?""", (recipe_id,))
+    owner = cursor.execute('DELETE FROM recipe WHERE id = ? RETURNING user_id', (recipe_id,)).fetchone()
     conn.commit()
     conn.close()
+    bump_user_generation(owner['user_id'] if owner else None)
 
 def get_recipe_steps(recipe_id: int):
     conn = get_db_connection()
@@ -461,7 +926,7 @@ def get_recipe_in_meal(meal_id):
     conn = get_db_connection()
     cursor = conn.cursor()
     rows = cursor.execute("""
-        Select r.id, r.name, r.origin, r.photo, r.difficulty, r.cooking_time, r.serving_size, r.source
+        Select r.id, r.name, r.origin, r.photo_hash, r.difficulty, r.cooking_time, r.serving_size, r.source
         FROM recipe AS r
         Join meal_recipe AS mr ON r.id = mr.recipe_id
         WHERE mr.meal_id = ?
@@ -469,6 +934,53 @@ def get_recipe_in_meal(meal_id):
     conn.close()
     return rows
 
+# recipes with their ordered steps and ingredient names as JSON arrays, one row per recipe. The inner ORDER BY
+# subqueries feed json_group_array in step / insertion order
+_BASE_RECIPE_WITH_DETAILS = """
+    SELECT r.id, r.name, r.origin, r.photo_hash, r.difficulty, r.preparation_time, r.cooking_time, r.serving_size,
+           r.source,
+        (SELECT json_group_array(description)
+            FROM (SELECT description FROM recipe_step WHERE recipe_id = r.id ORDER BY step_number)
+        ) AS preparation_steps,
+        (SELECT json_group_array(name)
+            FROM (SELECT i.name
+                    FROM recipe_ingredient AS ri
+                    JOIN ingredient AS i ON i.id = ri.ingredient_id
+                   WHERE ri.recipe_id = r.id
+                   ORDER BY ri.id)
+        ) AS ingredients
+    FROM recipe AS r
+"""
+
+def _recipe_details(rows) -> list[dict]:
+    recipes = []
+    for row in rows:
+        recipe = dict(row)
+        recipe['preparation_steps'] = json.loads(recipe['preparation_steps'])
+        recipe['ingredients'] = json.loads(recipe['ingredients'])
+        recipes.append(recipe)
+    return recipes
+
+def get_recipes_with_details(user_id: int, recipe_ids: list[int]) -> list[dict]:
+    """
+    Loads several recipes of a user with their steps and ingredients in one query.
+
+    Parameters:
+        user_id (int): owner, recipes of other users are left out.
+        recipe_ids (list[int]): recipes to load.
+
+    Returns:
+        list[dict]: recipe columns plus 'preparation_steps' and 'ingredients' (lists of str), ordered by id.
+    """
+    conn = get_db_connection()
+    # the ids go in as one JSON parameter so the statement text (and its cached plan) is the same for any count
+    rows = conn.execute(
+        _BASE_RECIPE_WITH_DETAILS + " WHERE r.id IN (SELECT value FROM json_each(?)) AND r.user_id = ? ORDER BY r.id",
+        (json.dumps(list(recipe_ids)), user_id)
+    ).fetchall()
+    conn.close()
+    return _recipe_details(rows)
+
 def get_recipe_ids_for_meal(meal_id: int) -> list[int]:
     conn = get_db_connection()
     rows = conn.execute(
@@ -484,8 +996,10 @@ def delete_recipes_from_meal(meal_id: int) -> None:
         "DELETE FROM meal_recipe WHERE meal_id = ?",
         (meal_id,)
     )
+    owner = _meal_owner(conn, meal_id)
     conn.commit()
     conn.close()
+    bump_user_generation(owner)
 
 def delete_recipe_from_meal_recipe(meal_id: int, recipe_id:int):
     conn = get_db_connection()
@@ -493,8 +1007,10 @@ def delete_recipe_from_meal_recipe(meal_id: int, recipe_id:int):
     cursor.execute("""
         DELETE FROM meal_recipe WHERE meal_id = ? and recipe_id = ?
     """, (meal_id, recipe_id))
+    owner = _meal_owner(conn, meal_id)
     conn.commit()
     conn.close()
+    bump_user_generation(owner)
 
 def add_recipe_to_meal(meal_id: int, recipe_id: int) -> None:
     conn = get_db_connection()
@@ -502,8 +1018,10 @@ def add_recipe_to_meal(meal_id: int, recipe_id: int) -> None:
         "INSERT INTO meal_recipe (meal_id, recipe_id) VALUES (?, ?)",
         (meal_id, recipe_id)
     )
+    owner = _meal_owner(conn, meal_id)
     conn.commit()
     conn.close()
+    bump_user_generation(owner)
 
 #########################################
 # ----------- Meals Related -----------#
@@ -522,22 +1040,34 @@ def create_meal(user_id: int, meal_title: str, recipe_ids: list[int], meal_time:
 
     Returns:
         int: ID of the newly created meal.
+
+    The meal and its recipe links are written in one transaction, a failure leaves no meal with only some of its
+    recipes behind.
+
+    Raises:
+        sqlite3.Error: the transaction is rolled back
     """
 
     conn = get_db_connection()
     cursor = conn.cursor()
-
-    cursor.execute(''' 
-            INSERT INTO Meal (user_id, meal_title, meal_time)
-            VALUES (?, ?, ?)
-        ''', (user_id, meal_title, meal_time))
-    conn.commit()
-    meal_id = cursor.lastrowid
-    conn.close()
-
-    for rid in recipe_ids:
-        add_recipe_to_meal(meal_id, rid)
-
+    try:
+        if not conn.in_transaction:
+            cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute('''
+                INSERT INTO Meal (user_id, meal_title, meal_time)
+                VALUES (?, ?, ?)
+            ''', (user_id, meal_title, meal_time))
+        meal_id = cursor.lastrowid
+        # a recipe listed twice is linked once
+        cursor.executemany("INSERT INTO meal_recipe (meal_id, recipe_id) VALUES (?, ?)",
+                           [(meal_id, recipe_id) for recipe_id in dict.fromkeys(recipe_ids)])
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    bump_user_generation(user_id)
     return meal_id
 
 
@@ -550,9 +1080,10 @@ def delete_meal(meal_id: int) -> None:
     """
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('DELETE FROM Meal WHERE meal_id = ?', (meal_id,))
+    owner = cursor.execute('DELETE FROM Meal WHERE meal_id = ? RETURNING user_id', (meal_id,)).fetchone()
     conn.commit()
     conn.close()
+    bump_user_generation(owner['user_id'] if owner else None)
 
 def update_meal(meal_id: int,
                 recipe_ids: list = None,
@@ -596,14 +1127,16 @@ def update_meal(meal_id: int,
     set_clause = ", ".join(updates)
     params.append(meal_id)  # Always append the meal_id as the last parameter
 
-    cursor.execute(f'''
+    owner = cursor.execute(f'''
         UPDATE Meal
         SET {set_clause}
         WHERE meal_id = ?
-    ''', tuple(params))
+        RETURNING user_id
+    ''', tuple(params)).fetchone()
 
     conn.commit()
     conn.close()
+    bump_user_generation(owner['user_id'] if owner else None)
 
 def view_meal(meal_id: int):
     """
@@ -641,6 +1174,21 @@ def get_all_meals(user_id):
 
     return meals
 
+def get_meals_page(user_id, after_id=0, limit=24):
+    """
+    One page of a user's meals, see get_recipes_page.
+    """
+    conn = get_db_connection()
+    rows = conn.execute("""
+        SELECT meal_id, meal_title, meal_time
+        FROM meal
+        WHERE user_id = ? AND meal_id > ?
+        ORDER BY meal_id
+        LIMIT ?
+    """, (user_id, after_id, limit + 1)).fetchall()
+    conn.close()
+    return _keyset_page(rows, limit, 'meal_id')
+
 def get_meal(meal_id: int):
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -657,6 +1205,50 @@ def get_meal(meal_id: int):
 
     return dict(meal)
 
+def get_meal_with_recipes(meal_id: int, user_id: int):
+    """
+    Loads a meal for its detail page in two queries, however many recipes it has.
+
+    Parameters:
+        meal_id (int): ID of the meal.
+        user_id (int): owner, other users' meals are not found.
+
+    Returns:
+        dict or None: the meal columns plus
+            'recipes': list of recipe dicts as returned by get_recipes_with_details,
+            'ingredients': names of all ingredients of the meal without duplicates, in recipe order.
+    """
+    conn = get_db_connection()
+    meal = conn.execute(
+        "SELECT * FROM meal WHERE meal_id = ? AND user_id = ?", (meal_id, user_id)
+    ).fetchone()
+    if meal is None:
+        conn.close()
+        return None
+
+    rows = conn.execute(
+        _BASE_RECIPE_WITH_DETAILS + " JOIN meal_recipe AS mr ON mr.recipe_id = r.id WHERE mr.meal_id = ? ORDER BY r.id",
+        (meal_id,)
+    ).fetchall()
+    conn.close()
+
+    meal = dict(meal)
+    meal['recipes'] = _recipe_details(rows)
+    meal['ingredients'] = list(dict.fromkeys(
+        name for recipe in meal['recipes'] for name in recipe['ingredients']
+    ))
+    return meal
+
+def get_meal_version(meal_id, user_id):
+    """
+    version and updated_at of a meal of the user (None if it isn't theirs), they change with the meal's recipes too.
+    """
+    conn = get_db_connection()
+    row = conn.execute("SELECT version, updated_at FROM meal WHERE meal_id = ? AND user_id = ?",
+                       (meal_id, user_id)).fetchone()
+    conn.close()
+    return row
+
 def get_meal_by_name(user_id, meal_title: str):
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -676,12 +1268,29 @@ def get_meal_by_name(user_id, meal_title: str):
 #########################################
 # ----------- Meal Plan Related -----------#
 #########################################
+
+# scheduled_datetime is stored as 'YYYY-MM-DD HH:MM', that sorts like the time itself and is what the
+# (user_id, scheduled_datetime) index of meal_plan_meal is ordered by
+SCHEDULE_FORMAT = '%Y-%m-%d %H:%M'
+
+def normalize_scheduled_datetime(value) -> str:
+    """
+    Brings a scheduled time as it comes from a form ('2025-05-02T08:00', '2025-05-02 08:00:00', a datetime) into
+    the stored form '2025-05-02 08:00'.
+
+    Raises:
+        ValueError: If value isn't a date and time.
+    """
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(str(value).strip().replace('T', ' '))
+    return value.strftime(SCHEDULE_FORMAT)
+
 def create_meal_plan(user_id, title, start_date, end_date, goals):
     conn = get_db_connection()
     cursor = conn.cursor()
 
     cursor.execute("""
-        INSERT INTO MealPlan
+        INSERT INTO meal_plan
         (user_id, title, start_date, end_date, goals)
         VALUES (?, ?, ?, ?, ?)""", (user_id, title, start_date, end_date, goals)
     )
@@ -689,23 +1298,27 @@ def create_meal_plan(user_id, title, start_date, end_date, goals):
     conn.commit()
     plan_id = cursor.lastrowid
     conn.close()
+    bump_user_generation(user_id)
     return plan_id
 
 def create_meal_plan_with_schedule(user_id, title, start_date, end_date, goals, schedule_map):
     conn = get_db_connection()
     try:
         cursor = conn.cursor()
+        if not conn.in_transaction:
+            cursor.execute("BEGIN IMMEDIATE")
         cursor.execute("""
             INSERT INTO meal_plan (user_id, title, start_date, end_date, goals)
             VALUES (?, ?, ?, ?, ?)""", (user_id, title, start_date, end_date, goals)
         )
         plan_id = cursor.lastrowid
 
-        for meal_id, sched in schedule_map.items():
-            cursor.execute("""
+        cursor.executemany("""
             INSERT INTO meal_plan_meal(meal_plan_id, meal_id, scheduled_datetime)
-            VALUES (?,?, ?)""", (plan_id, meal_id, sched))
+            VALUES (?,?, ?)""", [(plan_id, meal_id, normalize_scheduled_datetime(sched))
+                                 for meal_id, sched in schedule_map.items()])
         conn.commit()
+        bump_user_generation(user_id)
         return plan_id
     except Exception:
         conn.rollback()
@@ -720,9 +1333,11 @@ def add_meal_to_plan(meal_plan_id, meal_id, scheduled_datetime):
     cursor.execute("""
         INSERT INTO meal_plan_meal
         (meal_plan_id, meal_id, scheduled_datetime)
-        VALUES (?, ?, ?)""", (meal_plan_id, meal_id, scheduled_datetime))
+        VALUES (?, ?, ?)""", (meal_plan_id, meal_id, normalize_scheduled_datetime(scheduled_datetime)))
+    owner = _meal_plan_owner(conn, meal_plan_id)
     conn.commit()
     conn.close()
+    bump_user_generation(owner)
 
 def get_meal_plan(meal_plan_id, user_id):
     conn = get_db_connection()
@@ -732,15 +1347,27 @@ def get_meal_plan(meal_plan_id, user_id):
         'SELECT * FROM meal_plan WHERE meal_plan_id = ? and user_id = ?',
         (meal_plan_id, user_id)
     ).fetchone()
+    conn.close()
 
     if not plan_row:
         return None
     return dict(plan_row)
 
+def get_meal_plan_version(meal_plan_id, user_id):
+    """
+    version and updated_at of a meal plan of the user (None if it isn't theirs), they change with its schedule and
+    the titles of its meals too.
+    """
+    conn = get_db_connection()
+    row = conn.execute("SELECT version, updated_at FROM meal_plan WHERE meal_plan_id = ? AND user_id = ?",
+                       (meal_plan_id, user_id)).fetchone()
+    conn.close()
+    return row
+
 def get_meal_plan_by_title(title):
     conn = get_db_connection()
     row = conn.execute(
-      'SELECT meal_plan_id, user_id FROM MealPlan WHERE title = ?',
+      'SELECT meal_plan_id, user_id FROM meal_plan WHERE title = ?',
       (title,)
     ).fetchone()
     conn.close()
@@ -758,9 +1385,106 @@ def get_meal_plan_meals_and_schedules(meal_plan_id):
                 WHERE ppm.meal_plan_id = ?
                 ORDER BY ppm.scheduled_datetime
             """, (meal_plan_id,)).fetchall()
+    conn.close()
 
     return row
 
+# shopping list over the meals in the CTE "scheduled" (one row per scheduled occurrence of a meal): every ingredient
+# once per base unit (g, ml, piece, ...) with all its amounts converted through the unit table and summed up.
+# Quantities that couldn't be parsed end up in the line with unit '' and quantity NULL.
+_SHOPPING_LIST_AGGREGATE = """
+    SELECT i.store, i.id AS ingredient_id, i.name, COALESCE(u.base_code, '') AS unit,
+           SUM(ri.amount * u.to_base) AS quantity,
+           COUNT(*) AS uses
+    FROM scheduled AS s
+    JOIN meal_recipe AS mr ON mr.meal_id = s.meal_id
+    JOIN recipe_ingredient AS ri ON ri.recipe_id = mr.recipe_id
+    JOIN ingredient AS i ON i.id = ri.ingredient_id
+    LEFT JOIN unit AS u ON u.code = ri.unit_code
+    GROUP BY i.id, u.base_code
+    ORDER BY i.store IS NULL, i.store, i.name, unit
+"""
+
+def _group_by_store(rows) -> dict:
+    stores = {}
+    for row in rows:
+        stores.setdefault(row['store'], []).append(dict(row))
+    return stores
+
+def get_shopping_list_for_plan(meal_plan_id: int, user_id: int) -> dict:
+    """
+    Everything to buy for a meal plan, computed in one query.
+
+    Parameters:
+        meal_plan_id (int): the plan.
+        user_id (int): owner, other users' plans give an empty list.
+
+    Returns:
+        dict: {store (None for ingredients without one): [{'ingredient_id', 'name', 'unit', 'quantity', 'uses'}]},
+            stores in alphabetical order.
+    """
+    conn = get_db_connection()
+    rows = conn.execute("""
+        WITH scheduled AS (
+            SELECT mpm.meal_id
+            FROM meal_plan AS mp
+            JOIN meal_plan_meal AS mpm ON mpm.meal_plan_id = mp.meal_plan_id
+            WHERE mp.meal_plan_id = ? AND mp.user_id = ?
+        )
+    """ + _SHOPPING_LIST_AGGREGATE, (meal_plan_id, user_id)).fetchall()
+    conn.close()
+    return _group_by_store(rows)
+
+def get_shopping_list_for_dates(user_id: int, start_date: str, end_date: str) -> dict:
+    """
+    Everything to buy for the meals a user scheduled between two dates, over all of their meal plans. A meal
+    scheduled in several plans counts once per plan.
+
+    Parameters:
+        user_id (int): owner of the plans.
+        start_date, end_date (str): first and last day, YYYY-MM-DD, both included.
+
+    Returns:
+        dict: same as get_shopping_list_for_plan.
+    """
+    conn = get_db_connection()
+    # scheduled_datetime starts with the date, so everything before the day after end_date is in range
+    rows = conn.execute("""
+        WITH scheduled AS (
+            SELECT meal_id
+            FROM meal_plan_meal
+            WHERE user_id = ? AND scheduled_datetime >= ? AND scheduled_datetime < date(?, '+1 day')
+        )
+    """ + _SHOPPING_LIST_AGGREGATE, (user_id, start_date, end_date)).fetchall()
+    conn.close()
+    return _group_by_store(rows)
+
+def get_scheduled_meals_between(user_id: int, start_date: str, end_date: str) -> list:
+    """
+    The meals a user scheduled between two dates over all of their meal plans, read as one range of the
+    (user_id, scheduled_datetime) index so only the rows of the window are touched.
+
+    Parameters:
+        user_id (int): owner of the plans.
+        start_date, end_date (str): first and last day, YYYY-MM-DD, both included.
+
+    Returns:
+        list: dicts with meal_plan_id, plan_title, meal_id, meal_title, meal_time and scheduled_datetime,
+            in order of time.
+    """
+    conn = get_db_connection()
+    rows = conn.execute("""
+        SELECT mpm.meal_plan_id, mp.title AS plan_title, mpm.meal_id, m.meal_title, m.meal_time,
+               mpm.scheduled_datetime
+        FROM meal_plan_meal AS mpm
+        JOIN meal_plan AS mp ON mp.meal_plan_id = mpm.meal_plan_id
+        JOIN meal AS m ON m.meal_id = mpm.meal_id
+        WHERE mpm.user_id = ? AND mpm.scheduled_datetime >= ? AND mpm.scheduled_datetime < date(?, '+1 day')
+        ORDER BY mpm.scheduled_datetime
+    """, (user_id, start_date, end_date)).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
 def get_meal_plan_by_user_and_title(user_id: int, title: str):
     conn = get_db_connection()
     row = conn.execute(
@@ -773,12 +1497,14 @@ def get_meal_plan_by_user_and_title(user_id: int, title: str):
 def delete_meal_plan_and_meal_plan_meals_by_id(meal_plan_id: int):
     conn = get_db_connection()
     cur = conn.cursor()
+    owner = _meal_plan_owner(conn, meal_plan_id)
     # first remove all the schedule entries
     cur.execute('DELETE FROM meal_plan_meal WHERE meal_plan_id = ?', (meal_plan_id,))
     # then remove the plan itself
     cur.execute('DELETE FROM meal_plan WHERE meal_plan_id = ?', (meal_plan_id,))
     conn.commit()
     conn.close()
+    bump_user_generation(owner)
 
 def get_all_meal_plans(user_id):
     conn = get_db_connection()
@@ -788,37 +1514,507 @@ def get_all_meal_plans(user_id):
     conn.close()
     return rows
 
+def get_meal_plans_page(user_id, after_id=0, limit=24):
+    """
+    One page of a user's meal plans, see get_recipes_page.
+    """
+    conn = get_db_connection()
+    rows = conn.execute("""
+        SELECT meal_plan_id, title, start_date, end_date
+        FROM meal_plan
+        WHERE user_id = ? AND meal_plan_id > ?
+        ORDER BY meal_plan_id
+        LIMIT ?
+    """, (user_id, after_id, limit + 1)).fetchall()
+    conn.close()
+    return _keyset_page(rows, limit, 'meal_plan_id')
+
 def update_meal_plan(title, start_date, end_date, goals, meal_plan_id):
     conn = get_db_connection()
     cursor = conn.cursor()
 
-    cursor.execute('''
+    owner = cursor.execute('''
                UPDATE meal_plan
                   SET title = ?, start_date = ?, end_date = ?, goals = ?
                 WHERE meal_plan_id = ?
-           ''', (title, start_date, end_date, goals, meal_plan_id))
+                RETURNING user_id
+           ''', (title, start_date, end_date, goals, meal_plan_id)).fetchone()
 
     conn.commit()
     conn.close()
+    bump_user_generation(owner['user_id'] if owner else None)
 
 def update_meal_plan_meal_schedule(meal_plan_id: int, meal_id: int, scheduled_datetime: str):
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute("""
+    # meal_plan_meal carries the owner of its plan (migration 0006), no extra lookup per scheduled meal
+    row = cursor.execute("""
         UPDATE meal_plan_meal
         SET scheduled_datetime = ?
-        WHERE meal_plan_id = ? and meal_id = ?""",
-        (scheduled_datetime, meal_plan_id, meal_id)
-    )
+        WHERE meal_plan_id = ? and meal_id = ?
+        RETURNING user_id""",
+        (normalize_scheduled_datetime(scheduled_datetime), meal_plan_id, meal_id)
+    ).fetchone()
     conn.commit()
     conn.close()
+    bump_user_generation(row['user_id'] if row else None)
 
 def delete_meal_plan_meal(meal_plan_id, meal_id):
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('DELETE FROM meal_plan_meal WHERE meal_plan_id = ? and meal_id = ?',
-                   (meal_plan_id, meal_id)
-    )
+    row = cursor.execute('DELETE FROM meal_plan_meal WHERE meal_plan_id = ? and meal_id = ? RETURNING user_id',
+                         (meal_plan_id, meal_id)
+    ).fetchone()
+    conn.commit()
+    conn.close()
+    bump_user_generation(row['user_id'] if row else None)
+
+#########################################
+# ----------- Photo Related -----------#
+#########################################
+
+def get_all_photo_hashes() -> list[str]:
+    conn = get_db_connection()
+    rows = conn.execute("""
+        SELECT photo_hash FROM recipe WHERE photo_hash IS NOT NULL
+        UNION
+        SELECT photo_hash FROM users WHERE photo_hash IS NOT NULL
+    """).fetchall()
+    conn.close()
+    return [r['photo_hash'] for r in rows]
+
+#########################################
+# ----------- Search Related -----------#
+#########################################
+
+# search_recipes marks matched words with these characters, views turns them into <mark> after escaping the text
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+
+_SEARCH_TERM = re.compile(r'\w+')
+
+def _recipe_search_query(user_id: int, text: str):
+    """
+    Turns what the user typed into an FTS5 query: every word is quoted (so no FTS syntax gets through) and matched
+    as a prefix, restricted to the user's recipes.
+    """
+    terms = _SEARCH_TERM.findall(text)
+    if not terms:
+        return None
+    words = " ".join(f'"{term}"*' for term in terms)
+    return f"owner : u{int(user_id)} AND {{name origin steps ingredients}} : ({words})"
+
+def search_recipes(user_id: int, text: str, limit: int = 50) -> list[dict]:
+    """
+    Full-text search over the names, origins, steps and ingredients of a user's recipes (recipe_fts, see migration
+    0004), best matches first.
+
+    Parameters:
+        user_id (int): owner of the recipes.
+        text (str): search words, each one also matches words it is the beginning of ("chick" finds "chicken").
+        limit (int): maximum number of results.
+
+    Returns:
+        list[dict]: id, name, origin, photo_hash, plus
+            'name_highlighted': the name with matched words between HIGHLIGHT_START and HIGHLIGHT_END,
+            'snippet': the part of the ingredients or steps around a match, marked the same way ('' if neither matched).
+    """
+    query = _recipe_search_query(user_id, text)
+    if query is None:
+        return []
+
+    conn = get_db_connection()
+    # bm25 weights per column: owner (not ranked), name, origin, steps, ingredients
+    rows = conn.execute("""
+        SELECT r.id, r.name, r.origin, r.photo_hash,
+               highlight(recipe_fts, 1, ?, ?) AS name_highlighted,
+               snippet(recipe_fts, 4, ?, ?, '…', 10) AS ingredients_snippet,
+               snippet(recipe_fts, 3, ?, ?, '…', 12) AS steps_snippet
+        FROM recipe_fts
+        JOIN recipe AS r ON r.id = recipe_fts.rowid
+        WHERE recipe_fts MATCH ? AND r.user_id = ?
+        ORDER BY bm25(recipe_fts, 0.0, 10.0, 2.0, 1.0, 4.0)
+        LIMIT ?
+    """, (HIGHLIGHT_START, HIGHLIGHT_END) * 3 + (query, user_id, limit)).fetchall()
+    conn.close()
+
+    results = []
+    for row in rows:
+        result = dict(row)
+        ingredients_snippet = result.pop('ingredients_snippet')
+        steps_snippet = result.pop('steps_snippet')
+        result['snippet'] = next(
+            (s for s in (ingredients_snippet, steps_snippet) if s and HIGHLIGHT_START in s), ''
+        )
+        results.append(result)
+    return results
+
+#########################################
+# ----------- Bulk Import Related -----------#
+#########################################
+
+def _names_in(cursor, sql, user_id, names) -> dict:
+    if not names:
+        return {}
+    return {row[0]: row[1] for row in cursor.execute(sql, (user_id, json.dumps(sorted(names))))}
+
+# parsed ingredient lines import_batch keeps between the batches of one import
+IMPORT_PARSED_LINES = 50000
+
+def import_batch(user_id: int, records: list, known: dict = None, lines: dict = None) -> dict:
+    """
+    Inserts one batch of parsed import records (see importer.py) for a user in one transaction. Each record gets a
+    savepoint, so a record that fails is reported and skipped while the rest of the batch goes in.
+
+    Recipes are written children first: steps and ingredient links go in before the recipe row itself (foreign keys
+    are checked at commit), so the search index row is built once from all of them (migration 0008). The ingredient
+    names of the whole batch are resolved in one statement.
+
+    Parameters:
+        user_id (int): owner of the imported rows.
+        records (list): (line, record) tuples, record being a dict with 'type' 'recipe', 'meal' or 'meal_plan'.
+        known (dict, optional): {(type, name or title): id} of the rows imported by earlier batches of the same
+            import, updated with the rows of this one. Meals refer to recipes and plans to meals by name.
+        lines (dict, optional): {ingredient line: parse_ingredient(line)} shared by the batches of the same import.
+
+    Returns:
+        dict: {'recipe': n, 'meal': n, 'meal_plan': n, 'errors': [(line, message), ...]}
+    """
+    known = {} if known is None else known
+    result = {'recipe': 0, 'meal': 0, 'meal_plan': 0, 'errors': []}
+
+    recipe_names = {r['name'] for _, r in records if r['type'] == 'recipe'}
+    recipe_names |= {name for _, r in records if r['type'] == 'meal' for name in r['recipes']}
+    meal_titles = {r['title'] for _, r in records if r['type'] == 'meal'}
+    meal_titles |= {title for _, r in records if r['type'] == 'meal_plan' for title, _ in r['meals']}
+    plan_titles = {r['title'] for _, r in records if r['type'] == 'meal_plan'}
+    # the same ingredient lines come up in many recipes, each is parsed once per import
+    lines = {} if lines is None else lines
+    if len(lines) > IMPORT_PARSED_LINES:
+        lines.clear()
+    entries = {}
+    for _, r in records:
+        if r['type'] == 'recipe':
+            for entry in r['ingredients']:
+                if entry not in lines:
+                    lines[entry] = parse_ingredient(entry)
+                entries[entry] = lines[entry]
+    parsed = {line: [entries[entry] for entry in r['ingredients']] for line, r in records if r['type'] == 'recipe'}
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("PRAGMA defer_foreign_keys = ON")
+
+        existing_recipes = _names_in(cursor, """
+            SELECT name, max(id) FROM recipe
+            WHERE user_id = ? AND name IN (SELECT value FROM json_each(?))
+            GROUP BY name
+        """, user_id, recipe_names)
+        existing_meals = _names_in(cursor, """
+            SELECT meal_title, meal_id FROM meal
+            WHERE user_id = ? AND meal_title IN (SELECT value FROM json_each(?))
+        """, user_id, meal_titles)
+        existing_plans = _names_in(cursor, """
+            SELECT title, meal_plan_id FROM meal_plan
+            WHERE user_id = ? AND title IN (SELECT value FROM json_each(?))
+        """, user_id, plan_titles)
+        ingredient_ids = resolve_ingredients(
+            user_id, [entry['name'] for entry in entries.values()], cursor=cursor)
+        # ids are handed out here because the children go in before the recipe; the write lock is held
+        next_recipe_id = cursor.execute("SELECT COALESCE(max(id), 0) + 1 FROM recipe").fetchone()[0]
+
+        for line, record in records:
+            kind = record['type']
+            cursor.execute("SAVEPOINT import_record")
+            try:
+                if kind == 'recipe':
+                    if record['name'] in existing_recipes or ('recipe', record['name']) in known:
+                        raise ValueError(f"A recipe named {record['name']!r} already exists")
+                    recipe_id = next_recipe_id
+                    next_recipe_id += 1
+                    cursor.executemany(
+                        "INSERT INTO recipe_step (recipe_id, step_number, description) VALUES (?, ?, ?)",
+                        [(recipe_id, idx, step) for idx, step in enumerate(record['steps'], start=1)]
+                    )
+                    # the same ingredient listed twice is linked once, with the first quantity (as save_recipe)
+                    links = {}
+                    for entry in parsed[line]:
+                        links.setdefault(ingredient_ids[entry['name']], entry)
+                    cursor.executemany("""
+                        INSERT INTO recipe_ingredient (recipe_id, ingredient_id, quantity, unit, amount, unit_code)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    """, [(recipe_id, ingredient_id, entry['quantity'], entry['unit'], entry['amount'],
+                           entry['unit_code']) for ingredient_id, entry in links.items()])
+                    cursor.execute("""
+                        INSERT INTO recipe (id, user_id, name, origin, difficulty, preparation_time, cooking_time,
+                                            serving_size, source)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """, (recipe_id, user_id, record['name'], record['origin'], record['difficulty'],
+                          record['preparation_time'], record['cooking_time'], record['serving_size'],
+                          record['source']))
+                    known[('recipe', record['name'])] = recipe_id
+
+                elif kind == 'meal':
+                    if record['title'] in existing_meals or ('meal', record['title']) in known:
+                        raise ValueError(f"A meal titled {record['title']!r} already exists")
+                    recipe_ids = []
+                    for name in record['recipes']:
+                        recipe_id = known.get(('recipe', name)) or existing_recipes.get(name)
+                        if recipe_id is None:
+                            raise ValueError(f"Unknown recipe {name!r}")
+                        if recipe_id not in recipe_ids:
+                            recipe_ids.append(recipe_id)
+                    meal_id = cursor.execute(
+                        "INSERT INTO meal (user_id, meal_title, meal_time) VALUES (?, ?, ?)",
+                        (user_id, record['title'], record['meal_time'])
+                    ).lastrowid
+                    cursor.executemany("INSERT INTO meal_recipe (meal_id, recipe_id) VALUES (?, ?)",
+                                       [(meal_id, recipe_id) for recipe_id in recipe_ids])
+                    known[('meal', record['title'])] = meal_id
+
+                else:
+                    if record['title'] in existing_plans or ('meal_plan', record['title']) in known:
+                        raise ValueError(f"A meal plan titled {record['title']!r} already exists")
+                    schedule = {}
+                    for title, scheduled in record['meals']:
+                        meal_id = known.get(('meal', title)) or existing_meals.get(title)
+                        if meal_id is None:
+                            raise ValueError(f"Unknown meal {title!r}")
+                        schedule.setdefault(meal_id, normalize_scheduled_datetime(scheduled))
+                    plan_id = cursor.execute("""
+                        INSERT INTO meal_plan (user_id, title, start_date, end_date, goals) VALUES (?, ?, ?, ?, ?)
+                    """, (user_id, record['title'], record['start_date'], record['end_date'], record['goals'])
+                    ).lastrowid
+                    cursor.executemany(
+                        "INSERT INTO meal_plan_meal (meal_plan_id, meal_id, scheduled_datetime) VALUES (?, ?, ?)",
+                        [(plan_id, meal_id, scheduled) for meal_id, scheduled in schedule.items()]
+                    )
+                    known[('meal_plan', record['title'])] = plan_id
+
+                cursor.execute("RELEASE import_record")
+                result[kind] += 1
+            except (ValueError, sqlite3.IntegrityError) as e:
+                cursor.execute("ROLLBACK TO import_record")
+                cursor.execute("RELEASE import_record")
+                result['errors'].append((line, str(e)))
+
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    invalidate_ingredient_index(user_id)
+    bump_user_generation(user_id)
+    return result
+
+#########################################
+# ----------- Export Related -----------#
+#########################################
+
+def iter_export_records(user_id: int):
+    """
+    Yields all recipes, meals and meal plans of a user, in that order, as records in the form the bulk import reads
+    (see importer.py), so an export can be imported again. Recipes also have 'photo' (the photo hash or None).
+
+    The rows are read one at a time from the cursors, so memory doesn't grow with the size of the library, and in
+    one read transaction, so meals and plans refer to the recipes and meals of the same snapshot. The transaction
+    (and the connection) is held until the generator is exhausted or closed.
+    """
+    conn = get_db_connection()
+    try:
+        conn.execute("BEGIN")
+        for row in conn.execute("""
+            SELECT r.name, r.origin, r.difficulty, r.preparation_time, r.cooking_time, r.serving_size, r.source,
+                   r.photo_hash,
+                (SELECT json_group_array(description)
+                    FROM (SELECT description FROM recipe_step WHERE recipe_id = r.id ORDER BY step_number)
+                ) AS steps,
+                (SELECT json_group_array(json_array(name, quantity, unit))
+                    FROM (SELECT i.name, ri.quantity, ri.unit
+                            FROM recipe_ingredient AS ri
+                            JOIN ingredient AS i ON i.id = ri.ingredient_id
+                           WHERE ri.recipe_id = r.id
+                           ORDER BY ri.id)
+                ) AS ingredients
+            FROM recipe AS r
+            WHERE r.user_id = ?
+            ORDER BY r.id
+        """, (user_id,)):
+            yield {
+                'type': 'recipe', 'name': row['name'], 'origin': row['origin'], 'difficulty': row['difficulty'],
+                'preparation_time': row['preparation_time'], 'cooking_time': row['cooking_time'],
+                'serving_size': row['serving_size'], 'source': row['source'],
+                'steps': json.loads(row['steps']),
+                'ingredients': [format_ingredient(name, quantity, unit)
+                                for name, quantity, unit in json.loads(row['ingredients'])],
+                'photo': row['photo_hash'],
+            }
+
+        for row in conn.execute("""
+            SELECT m.meal_title, m.meal_time,
+                (SELECT json_group_array(name)
+                    FROM (SELECT r.name
+                            FROM meal_recipe AS mr
+                            JOIN recipe AS r ON r.id = mr.recipe_id
+                           WHERE mr.meal_id = m.meal_id
+                           ORDER BY r.id)
+                ) AS recipes
+            FROM meal AS m
+            WHERE m.user_id = ?
+            ORDER BY m.meal_id
+        """, (user_id,)):
+            yield {'type': 'meal', 'title': row['meal_title'], 'meal_time': row['meal_time'],
+                   'recipes': json.loads(row['recipes'])}
+
+        for row in conn.execute("""
+            SELECT p.title, p.start_date, p.end_date, p.goals,
+                (SELECT json_group_array(json_object('meal', meal_title, 'scheduled', scheduled_datetime))
+                    FROM (SELECT m.meal_title, mpm.scheduled_datetime
+                            FROM meal_plan_meal AS mpm
+                            JOIN meal AS m ON m.meal_id = mpm.meal_id
+                           WHERE mpm.meal_plan_id = p.meal_plan_id
+                           ORDER BY mpm.scheduled_datetime)
+                ) AS meals
+            FROM meal_plan AS p
+            WHERE p.user_id = ?
+            ORDER BY p.meal_plan_id
+        """, (user_id,)):
+            yield {'type': 'meal_plan', 'title': row['title'], 'start_date': row['start_date'],
+                   'end_date': row['end_date'], 'goals': row['goals'], 'meals': json.loads(row['meals'])}
+    finally:
+        conn.rollback()
+        conn.close()
+
+def iter_export_photo_hashes(user_id: int):
+    """
+    Yields the hashes of the photos of a user's recipes and profile, each once.
+    """
+    conn = get_db_connection()
+    try:
+        for row in conn.execute("""
+            SELECT photo_hash FROM recipe WHERE user_id = ? AND photo_hash IS NOT NULL
+            UNION
+            SELECT photo_hash FROM users WHERE id = ? AND photo_hash IS NOT NULL
+        """, (user_id, user_id)):
+            yield row['photo_hash']
+    finally:
+        conn.close()
+
+#########################################
+# ----------- Job Related --------------#
+#########################################
+
+_JOB_COLUMNS = """
+    id, kind, payload, user_id, status, attempts, max_attempts, run_after, worker, result, error, created_at,
+    started_at, finished_at
+"""
+
+def create_job(kind: str, payload: str, user_id: int = None, max_attempts: int = 3, run_after: float = None) -> int:
+    """
+    Queues a background job (see jobs.enqueue).
+
+    Parameters:
+        kind (str): name of the handler.
+        payload (str): JSON arguments of the handler.
+        user_id (int, optional): user the job belongs to, who may look at its status.
+        max_attempts (int): runs before the job counts as failed.
+        run_after (float, optional): unix time before which the job isn't run, now if not given.
+    """
+    conn = get_db_connection()
+    job_id = _insert_job(conn, kind, payload, user_id, max_attempts, run_after)
+    conn.commit()
+    conn.close()
+    return job_id
+
+def _insert_job(conn, kind, payload, user_id, max_attempts, run_after):
+    # the INSERT of create_job, for helpers that queue a job in the transaction of their own writes
+    now = time.time()
+    return conn.execute("""
+        INSERT INTO job (kind, payload, user_id, max_attempts, run_after, created_at) VALUES (?, ?, ?, ?, ?, ?)
+    """, (kind, payload, user_id, max_attempts, now if run_after is None else run_after, now)).lastrowid
+
+def claim_job(worker: str, now: float):
+    """
+    Marks the next due job as running for worker and returns it, None if there is none. The job is picked and
+    claimed by one statement, so two workers (threads or processes) never get the same one.
+
+    Idle workers poll this every JOB_POLL_INTERVAL, so an empty queue is answered by a read first: only when a job is
+    due is the UPDATE run, which takes the write lock the requests' writes wait for.
+    """
+    conn = get_db_connection()
+    due = conn.execute("SELECT 1 FROM job WHERE status = 'queued' AND run_after <= ? LIMIT 1", (now,)).fetchone()
+    if due is None:
+        conn.close()
+        return None
+    job = conn.execute(f"""
+        UPDATE job SET status = 'running', worker = ?, attempts = attempts + 1, started_at = ?
+        WHERE id = (SELECT id FROM job WHERE status = 'queued' AND run_after <= ? ORDER BY run_after, id LIMIT 1)
+        RETURNING {_JOB_COLUMNS}
+    """, (worker, now, now)).fetchone()
+    conn.commit()
+    conn.close()
+    return job
+
+def finish_job(job_id: int, result: str = None):
+    conn = get_db_connection()
+    conn.execute("UPDATE job SET status = 'done', result = ?, error = NULL, finished_at = ? WHERE id = ?",
+                 (result, time.time(), job_id))
+    conn.commit()
+    conn.close()
+
+def fail_job(job_id: int, error: str, retry_at: float = None):
+    """
+    Records the error of a run. With retry_at the job is queued again to run from then on, otherwise it failed.
+    """
+    conn = get_db_connection()
+    if retry_at is None:
+        conn.execute("UPDATE job SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                     (error, time.time(), job_id))
+    else:
+        conn.execute("UPDATE job SET status = 'queued', error = ?, run_after = ?, worker = NULL WHERE id = ?",
+                     (error, retry_at, job_id))
     conn.commit()
     conn.close()
 
+def get_job(job_id: int, user_id: int):
+    conn = get_db_connection()
+    job = conn.execute(f"SELECT {_JOB_COLUMNS} FROM job WHERE id = ? AND user_id = ?", (job_id, user_id)).fetchone()
+    conn.close()
+    return job
+
+def get_jobs(user_id: int, limit: int = 20) -> list:
+    conn = get_db_connection()
+    jobs = conn.execute(f"SELECT {_JOB_COLUMNS} FROM job WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+                        (user_id, limit)).fetchall()
+    conn.close()
+    return jobs
+
+def requeue_stale_jobs(started_before: float) -> int:
+    """
+    Jobs still running since before started_before belong to a worker that died (or hangs): they are queued again, or
+    failed if they have used all their attempts. Returns how many were found.
+    """
+    conn = get_db_connection()
+    count = conn.execute("""
+        UPDATE job
+           SET status = CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END,
+               error = 'worker ' || COALESCE(worker, 'unknown') || ' stopped while running the job',
+               finished_at = CASE WHEN attempts < max_attempts THEN NULL ELSE ? END,
+               worker = NULL
+         WHERE status = 'running' AND started_at < ?
+    """, (time.time(), started_before)).rowcount
+    conn.commit()
+    conn.close()
+    return count
+
+def prune_jobs(finished_before: float) -> int:
+    conn = get_db_connection()
+    count = conn.execute("""
+        DELETE FROM job WHERE status IN ('done', 'failed') AND finished_at < ?
+    """, (finished_before,)).rowcount
+    conn.commit()
+    conn.close()
+    return count
@@ -0,0 +1,186 @@
+# exporter.py
+
+import json
+import mimetypes
+import tarfile
+import tempfile
+import time
+import zipfile
+
+import click
+
+from .database import iter_export_records, iter_export_photo_hashes, get_user_by_email
+from .photos import photo_path, guess_mimetype
+
+
+"""
+This script contains the export of a user's recipes, meals and meal plans.
+
+The export is produced as a generator of byte chunks, so it can be streamed to the client (GET /export in views.py)
+or written to a file (flask --app main export-data) while the rows are still being read; memory stays the same
+whatever the size of the library.
+
+    ndjson  one record per line, in the format of the bulk import (importer.py) so it can be imported again;
+            recipes also carry the hash of their photo
+    zip     export.ndjson plus the photos of the recipes and the profile under photos/<hash>.<ext>
+    tar     the same as an uncompressed tar
+
+Archives are written on the fly, chunk by chunk. zipfile writes into a sink that is emptied after every chunk; a zip
+written to a stream has no sizes in its local headers (they follow the data). The tar members are written directly
+(header, data, padding), and since a tar header needs the size of its member first, the records are spooled to a
+temporary file before (in memory up to EXPORT_SPOOL_BYTES, on disk beyond).
+"""
+
+
+EXPORT_FORMATS = ('ndjson', 'zip', 'tar')
+MIMETYPES = {'ndjson': 'application/x-ndjson', 'zip': 'application/zip', 'tar': 'application/x-tar'}
+CHUNK_SIZE = 64 * 1024
+EXPORT_SPOOL_BYTES = 1024 * 1024
+RECORDS_NAME = 'export.ndjson'
+
+
+class _Sink:
+    """
+    Write-only file the archive modules write into, drain() hands out what was written since the last call.
+    Without tell() / seek() zipfile writes a streamable zip.
+    """
+    def __init__(self):
+        self._chunks = []
+        self.size = 0
+
+    def write(self, data):
+        if data:
+            self._chunks.append(bytes(data))
+            self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        self.size = 0
+        return data
+
+
+def export_filename(fmt: str) -> str:
+    return f"foodbook-export-{time.strftime('%Y-%m-%d')}.{fmt}"
+
+
+def iter_ndjson(user_id: int):
+    """
+    Yields the records of a user as NDJSON, about CHUNK_SIZE bytes at a time.
+    """
+    buffer, size = [], 0
+    for record in iter_export_records(user_id):
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode('utf-8')
+        buffer.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield b''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def _photos(user_id: int):
+    """
+    Yields (archive name, path) of the user's photos that are in the photo store.
+    """
+    for digest in iter_export_photo_hashes(user_id):
+        path = photo_path(digest)
+        if path.exists():
+            extension = mimetypes.guess_extension(guess_mimetype(path)) or ''
+            yield f"photos/{digest}{extension}", path
+
+
+def iter_zip(user_id: int):
+    """
+    Yields a zip with the records and photos of a user, written on the fly.
+    """
+    sink = _Sink()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as archive:
+        with archive.open(RECORDS_NAME, 'w', force_zip64=True) as member:
+            for chunk in iter_ndjson(user_id):
+                member.write(chunk)
+                if sink.size >= CHUNK_SIZE:
+                    yield sink.drain()
+
+        for name, path in _photos(user_id):
+            # photos are compressed already
+            info = zipfile.ZipInfo(name, time.localtime(path.stat().st_mtime)[:6])
+            info.compress_type = zipfile.ZIP_STORED
+            with archive.open(info, 'w', force_zip64=True) as member, path.open('rb') as photo:
+                while chunk := photo.read(CHUNK_SIZE):
+                    member.write(chunk)
+                    if sink.size:
+                        yield sink.drain()
+    yield sink.drain()
+
+
+def _tar_member(info: tarfile.TarInfo, fileobj):
+    # header, the data in chunks, then zeros up to the next 512 byte block
+    yield info.tobuf(tarfile.PAX_FORMAT, 'utf-8', 'surrogateescape')
+    while chunk := fileobj.read(CHUNK_SIZE):
+        yield chunk
+    if info.size % tarfile.BLOCKSIZE:
+        yield tarfile.NUL * (tarfile.BLOCKSIZE - info.size % tarfile.BLOCKSIZE)
+
+
+def iter_tar(user_id: int):
+    """
+    Yields an uncompressed tar with the records and photos of a user, written on the fly.
+    """
+    written = 0
+    with tempfile.SpooledTemporaryFile(EXPORT_SPOOL_BYTES) as records:
+        for chunk in iter_ndjson(user_id):
+            records.write(chunk)
+        info = tarfile.TarInfo(RECORDS_NAME)
+        info.size = records.tell()
+        info.mtime = time.time()
+        records.seek(0)
+        for chunk in _tar_member(info, records):
+            written += len(chunk)
+            yield chunk
+
+    for name, path in _photos(user_id):
+        with path.open('rb') as photo:
+            info = tarfile.TarInfo(name)
+            info.size = path.stat().st_size
+            info.mtime = path.stat().st_mtime
+            for chunk in _tar_member(info, photo):
+                written += len(chunk)
+                yield chunk
+
+    # two empty blocks end the archive, which is padded to whole records like tarfile does
+    end = 2 * tarfile.BLOCKSIZE
+    yield tarfile.NUL * (end + (-(written + end) % tarfile.RECORDSIZE))
+
+
+def iter_export(user_id: int, fmt: str):
+    """
+    Returns the generator of byte chunks of an export in fmt ('ndjson', 'zip' or 'tar').
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown format {fmt!r}, expected one of {', '.join(EXPORT_FORMATS)}")
+    return {'ndjson': iter_ndjson, 'zip': iter_zip, 'tar': iter_tar}[fmt](user_id)
+
+
+@click.command('export-data')
+@click.option('--user', 'email', required=True, help="email of the user whose data is exported")
+@click.option('--format', 'fmt', type=click.Choice(EXPORT_FORMATS), default='ndjson', show_default=True,
+              help="zip and tar include the photos")
+@click.option('--output', '-o', type=click.File('wb'), default='-', help="file to write, - for stdout")
+def export_command(email, fmt, output):
+    """Export the recipes, meals and meal plans of a user as NDJSON, or with their photos as zip or tar."""
+    user = get_user_by_email(email)
+    if user is None:
+        raise click.UsageError(f"No user with the email {email}")
+    written = 0
+    for chunk in iter_export(user.id, fmt):
+        output.write(chunk)
+        written += len(chunk)
+    output.flush()
+    if output.name != '<stdout>':
+        click.echo(f"Wrote {written} bytes to {output.name}", err=True)
@@ -0,0 +1,307 @@
+# importer.py
+
+import csv
+import io
+import json
+import shutil
+import tempfile
+import time
+from datetime import date
+from itertools import islice
+from pathlib import Path
+
+import click
+from flask import current_app
+
+from .database import import_batch, get_user_by_email
+from .jobs import job_handler
+
+
+"""
+This script contains the bulk import of recipes, meals and meal plans from NDJSON or CSV.
+
+The input is read as a stream, one record at a time, and written in batches of batch_size records per transaction
+(database.import_batch), so files of any size go in without being held in memory. A record that is invalid or can't
+be inserted (e.g. a meal with an unknown recipe) is reported with its line number and skipped.
+
+NDJSON, one object per line ('type' defaults to 'recipe'):
+    {"name": "Dal", "steps": ["Rinse the lentils", "Simmer"], "ingredients": ["1 cup lentils", "salt"],
+     "preparation_time": "10", "cooking_time": "30", "origin": "Indian", "difficulty": 2, "serving_size": 4}
+    {"type": "meal", "title": "Dal night", "meal_time": "Dinner", "recipes": ["Dal", "Rice"]}
+    {"type": "meal_plan", "title": "Week 1", "start_date": "2025-01-06", "end_date": "2025-01-12",
+     "meals": [{"meal": "Dal night", "scheduled": "2025-01-06 19:00"}]}
+
+CSV has a header with the same names; list columns (steps, ingredients, recipes, meals) separate their items with
+'|', a scheduled meal is written as title@YYYY-MM-DD HH:MM.
+
+Meals can refer to recipes and plans to meals of the same file (written before them) or that the user already has.
+
+Over HTTP: POST /import (views.py), which streams the progress back, or with ?background=1 spools the file to
+IMPORTS_PATH and runs it as an import job (jobs.py). From the command line, run from the project root:
+    flask --app main import-data recipes.ndjson --user aarav@example.com
+"""
+
+
+FORMATS = ('ndjson', 'csv')
+RECORD_TYPES = ('recipe', 'meal', 'meal_plan')
+MEAL_TIMES = ('Breakfast', 'Lunch', 'Dinner', 'Snack')
+LIST_SEPARATOR = '|'
+IMPORTS_PATH = Path("instance/imports")
+# errors kept in the result of an import job, the others are only counted
+JOB_ERRORS = 100
+
+
+def guess_format(filename: str = None, mimetype: str = None):
+    """
+    Returns 'ndjson', 'csv' or None from a file name or content type.
+    """
+    name = (filename or '').lower()
+    if name.endswith(('.ndjson', '.jsonl', '.json')) or mimetype in ('application/x-ndjson', 'application/jsonl'):
+        return 'ndjson'
+    if name.endswith('.csv') or mimetype == 'text/csv':
+        return 'csv'
+    return None
+
+
+def _list(value) -> list:
+    if value is None or value == '':
+        return []
+    if isinstance(value, str):
+        value = value.split(LIST_SEPARATOR)
+    return [str(item).strip() for item in value if str(item).strip()]
+
+
+def _text(record, key, default=None):
+    value = record.get(key)
+    if value is None or str(value).strip() == '':
+        return default
+    return str(value).strip()
+
+
+def _int(record, key, default, low=None, high=None):
+    value = _text(record, key)
+    if value is None:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f"{key} must be a whole number, got {value!r}")
+    if (low is not None and number < low) or (high is not None and number > high):
+        raise ValueError(f"{key} must be between {low} and {high}, got {number}")
+    return number
+
+
+def _date(record, key):
+    value = _text(record, key)
+    if value is not None:
+        try:
+            value = date.fromisoformat(value).isoformat()
+        except ValueError:
+            raise ValueError(f"{key} must be a date (YYYY-MM-DD), got {value!r}")
+    return value
+
+
+def _scheduled_meal(item):
+    if isinstance(item, dict):
+        title, scheduled = _text(item, 'meal'), _text(item, 'scheduled')
+    else:
+        title, _, scheduled = str(item).rpartition('@')
+        title, scheduled = title.strip(), scheduled.strip()
+    if not title or not scheduled:
+        raise ValueError(f"Scheduled meals need a meal title and a date/time, got {item!r}")
+    return title, scheduled
+
+
+def normalize_record(raw: dict) -> dict:
+    """
+    Checks a raw record and returns it in the form database.import_batch expects.
+
+    Raises:
+        ValueError: with a message for the user if the record is incomplete or has invalid values.
+    """
+    if not isinstance(raw, dict):
+        raise ValueError("Every record must be an object")
+    kind = _text(raw, 'type', 'recipe')
+    if kind not in RECORD_TYPES:
+        raise ValueError(f"Unknown type {kind!r}, expected one of {', '.join(RECORD_TYPES)}")
+
+    if kind == 'recipe':
+        record = {
+            'type': kind,
+            'name': _text(raw, 'name'),
+            'steps': _list(raw.get('steps')),
+            'ingredients': _list(raw.get('ingredients')),
+            'preparation_time': _text(raw, 'preparation_time'),
+            'cooking_time': _text(raw, 'cooking_time'),
+            'origin': _text(raw, 'origin', 'To be known'),
+            'difficulty': _int(raw, 'difficulty', 1, 1, 5),
+            'serving_size': _int(raw, 'serving_size', 1, 1),
+            'source': _text(raw, 'source', 'Unknown'),
+        }
+        if not record['name'] or not record['steps'] or not record['ingredients']:
+            raise ValueError("Recipes need a name, steps and ingredients")
+        return record
+
+    if kind == 'meal':
+        record = {
+            'type': kind,
+            'title': _text(raw, 'title'),
+            'meal_time': _text(raw, 'meal_time'),
+            'recipes': _list(raw.get('recipes')),
+        }
+        if not record['title'] or not record['recipes']:
+            raise ValueError("Meals need a title and recipes")
+        if record['meal_time'] is not None and record['meal_time'] not in MEAL_TIMES:
+            raise ValueError(f"meal_time must be one of {', '.join(MEAL_TIMES)}")
+        return record
+
+    meals = raw.get('meals')
+    if isinstance(meals, str):
+        meals = _list(meals)
+    record = {
+        'type': kind,
+        'title': _text(raw, 'title'),
+        'start_date': _date(raw, 'start_date'),
+        'end_date': _date(raw, 'end_date'),
+        'goals': _text(raw, 'goals', ''),
+        'meals': [_scheduled_meal(item) for item in meals or []],
+    }
+    if not record['title'] or not record['meals']:
+        raise ValueError("Meal plans need a title and scheduled meals")
+    return record
+
+
+def iter_records(stream, fmt: str):
+    """
+    Reads records from a binary or text stream one at a time.
+
+    Yields:
+        (line, record, error): record is normalized (normalize_record) and error None, or record is None and error
+            says what is wrong with the line.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt!r}, expected one of {', '.join(FORMATS)}")
+    if not isinstance(stream, io.TextIOBase):
+        stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='' if fmt == 'csv' else None)
+
+    if fmt == 'ndjson':
+        for line, text in enumerate(stream, start=1):
+            if not text.strip():
+                continue
+            try:
+                yield line, normalize_record(json.loads(text)), None
+            except json.JSONDecodeError as e:
+                yield line, None, f"Invalid JSON: {e.msg}"
+            except ValueError as e:
+                yield line, None, str(e)
+        return
+
+    reader = csv.DictReader(stream)
+    # line of the header is 1, rows are numbered by the line they start on
+    line = reader.line_num + 1
+    for row in reader:
+        try:
+            yield line, normalize_record(row), None
+        except ValueError as e:
+            yield line, None, str(e)
+        line = reader.line_num + 1
+
+
+def import_batches(user_id: int, stream, fmt: str, batch_size: int = 500):
+    """
+    Imports every record of a stream for a user, batch_size records per transaction.
+
+    Yields:
+        (report, errors) after each batch: the running report with 'rows' read, 'recipe' / 'meal' / 'meal_plan'
+            imported, 'errors' [(line, message)] and 'seconds', and the errors of that batch.
+    """
+    started = time.perf_counter()
+    report = {'rows': 0, 'recipe': 0, 'meal': 0, 'meal_plan': 0, 'errors': [], 'seconds': 0.0}
+    known, lines = {}, {}
+    records = iter_records(stream, fmt)
+    while True:
+        chunk = list(islice(records, batch_size))
+        if not chunk:
+            break
+        errors = [(line, error) for line, _, error in chunk if error]
+        batch = [(line, record) for line, record, error in chunk if not error]
+        if batch:
+            result = import_batch(user_id, batch, known, lines)
+            for kind in RECORD_TYPES:
+                report[kind] += result[kind]
+            errors = sorted(errors + result['errors'])
+        report['rows'] += len(chunk)
+        report['errors'].extend(errors)
+        report['seconds'] = round(time.perf_counter() - started, 3)
+        yield report, errors
+
+
+def import_stream(user_id: int, stream, fmt: str, batch_size: int = 500, progress=None) -> dict:
+    """
+    Same as import_batches, returns the final report.
+
+    Parameters:
+        progress (callable, optional): called after each batch with the report so far and the errors of that batch.
+    """
+    report = {'rows': 0, 'recipe': 0, 'meal': 0, 'meal_plan': 0, 'errors': [], 'seconds': 0.0}
+    for report, errors in import_batches(user_id, stream, fmt, batch_size):
+        if progress:
+            progress(report, errors)
+    return report
+
+
+def spool_import(stream) -> Path:
+    """
+    Copies an uploaded file or request body to IMPORTS_PATH for an import job and returns its path.
+    """
+    IMPORTS_PATH.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile('wb', dir=IMPORTS_PATH, suffix='.import', delete=False) as spool:
+        shutil.copyfileobj(stream, spool)
+    return Path(spool.name)
+
+
+@job_handler('import', max_attempts=1)
+def import_job(payload):
+    # not retried: the batches committed before a failure would be imported twice
+    path = Path(payload['path'])
+    try:
+        with path.open('rb') as stream:
+            report = import_stream(payload['user_id'], stream, payload['format'],
+                                   current_app.config['IMPORT_BATCH_SIZE'])
+    finally:
+        path.unlink(missing_ok=True)
+    report['skipped'] = len(report['errors'])
+    report['errors'] = report['errors'][:JOB_ERRORS]
+    return report
+
+
+@click.command('import-data')
+@click.argument('file', type=click.File('rb'))
+@click.option('--user', 'email', required=True, help="email of the user the data is imported for")
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), help="guessed from the file name if not given")
+@click.option('--batch-size', type=click.IntRange(1),
+              help="records written per transaction, IMPORT_BATCH_SIZE if not given")
+def import_command(file, email, fmt, batch_size):
+    """Import recipes, meals and meal plans from an NDJSON or CSV file (- reads stdin)."""
+    fmt = fmt or guess_format(file.name)
+    batch_size = batch_size or current_app.config['IMPORT_BATCH_SIZE']
+    if fmt is None:
+        raise click.UsageError("Can't tell the format from the file name, pass --format")
+    user = get_user_by_email(email)
+    if user is None:
+        raise click.UsageError(f"No user with the email {email}")
+
+    def progress(report, errors):
+        for line, error in errors:
+            click.echo(f"line {line}: {error}", err=True)
+        click.echo(f"{report['rows']} rows, {report['recipe']} recipes, {report['meal']} meals, "
+                   f"{report['meal_plan']} meal plans in {report['seconds']}s")
+
+    try:
+        report = import_stream(user.id, file, fmt, batch_size, progress)
+    except (UnicodeDecodeError, csv.Error) as e:
+        # the batches before are committed
+        raise click.ClickException(f"Can't read the file: {e}")
+    rate = report['rows'] / report['seconds'] if report['seconds'] else 0
+    click.echo(f"Imported {report['recipe']} recipes, {report['meal']} meals and {report['meal_plan']} meal plans "
+               f"({rate:.0f} rows/s), {len(report['errors'])} rows skipped")
@@ -0,0 +1,244 @@
+# jobs.py
+
+import json
+import os
+import signal
+import socket
+import threading
+import time
+import traceback
+from datetime import datetime, timezone
+
+import click
+from flask import current_app
+
+from .tracing import detach_trace
+from .database import (create_job, claim_job, finish_job, fail_job, requeue_stale_jobs, prune_jobs, purge_user,
+                       mark_user_deleted)
+
+
+"""
+This script contains the background jobs.
+
+Work that is too slow for a request (deleting a big account, rendering photo variants, large imports) is queued in
+the job table (migration 0009) with enqueue() and the request returns right away; GET /jobs/<id> tells its status.
+The queue is durable: jobs survive restarts, and a job whose worker died is queued again after JOB_TIMEOUT.
+
+Handlers are registered with @job_handler('kind') next to the code they run (photos.py, importer.py, and the
+account deletion here). A handler gets the payload given to enqueue and runs in an app context of its own, so it
+can use the database helpers like a request. It returns what is stored as the result (anything JSON can encode);
+an exception fails the run, which is retried JOB_MAX_ATTEMPTS times with a delay of JOB_RETRY_DELAY seconds,
+doubled for each attempt.
+
+Jobs are run by JobWorkers, threads that claim one job at a time:
+    - inside the web process, JOB_WORKERS threads started with the first request (after gunicorn forked)
+    - in worker processes of their own, started from the project root with
+        flask --app main jobs-worker --threads 4
+      run several of them for more processes; with JOB_WORKERS = 0 only they run jobs.
+Enqueueing wakes up the workers of the same process, the others find the job within JOB_POLL_INTERVAL seconds.
+"""
+
+
+JOB_HANDLERS = {}
+
+_wakeup = threading.Condition()
+
+
+def job_handler(kind: str, max_attempts: int = None):
+    """
+    Registers the decorated function as the handler of the jobs of a kind.
+
+    Parameters:
+        max_attempts (int, optional): runs before a job of this kind fails, JOB_MAX_ATTEMPTS if not given. 1 for
+            handlers that must not run twice.
+    """
+    def register(fn):
+        JOB_HANDLERS[kind] = (fn, max_attempts)
+        return fn
+    return register
+
+
+def enqueue(kind: str, payload: dict = None, user_id: int = None, delay: float = 0) -> int:
+    """
+    Queues a job and returns its id.
+
+    Parameters:
+        kind (str): a registered handler.
+        payload (dict, optional): arguments of the handler, must be JSON serializable.
+        user_id (int, optional): user who may see the job's status.
+        delay (float): seconds before the job may run.
+
+    Raises:
+        ValueError: If no handler is registered for kind.
+    """
+    job_id = create_job(kind, json.dumps(payload or {}), user_id, _max_attempts(kind), time.time() + delay)
+    _notify_workers()
+    return job_id
+
+
+def enqueue_user_deletion(user_id: int) -> int:
+    """
+    Closes an account and queues the delete_user job that purges its rows, in one transaction
+    (database.mark_user_deleted). Returns the id of the job.
+    """
+    job_id = mark_user_deleted(user_id, _max_attempts('delete_user'))
+    _notify_workers()
+    return job_id
+
+
+def _max_attempts(kind):
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind {kind!r}")
+    return JOB_HANDLERS[kind][1] or current_app.config['JOB_MAX_ATTEMPTS']
+
+
+def _notify_workers():
+    with _wakeup:
+        _wakeup.notify()
+
+
+def _timestamp(value):
+    return datetime.fromtimestamp(value, timezone.utc).isoformat(timespec='seconds') if value else None
+
+
+def job_status(job) -> dict:
+    """
+    Returns a job row as the dict GET /jobs/<id> answers with.
+    """
+    return {
+        'id': job['id'],
+        'kind': job['kind'],
+        'status': job['status'],
+        'attempts': job['attempts'],
+        'max_attempts': job['max_attempts'],
+        'created_at': _timestamp(job['created_at']),
+        'started_at': _timestamp(job['started_at']),
+        'finished_at': _timestamp(job['finished_at']),
+        'retry_at': _timestamp(job['run_after']) if job['status'] == 'queued' and job['attempts'] else None,
+        'result': json.loads(job['result']) if job['result'] else None,
+        'error': job['error'],
+    }
+
+
+def run_job(job):
+    """
+    Runs a claimed job and records its result, or its error and whether it is retried.
+    """
+    config = current_app.config
+    # jobs are bulk work, none of their statements belongs to a request trace
+    detach_trace()
+    try:
+        handler = JOB_HANDLERS[job['kind']][0]
+    except KeyError:
+        fail_job(job['id'], f"Unknown job kind {job['kind']!r}")
+        return
+    try:
+        result = handler(json.loads(job['payload']))
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        retry_at = None
+        if job['attempts'] < job['max_attempts']:
+            retry_at = time.time() + config['JOB_RETRY_DELAY'] * 2 ** (job['attempts'] - 1)
+        fail_job(job['id'], error, retry_at)
+        print(f"Job {job['id']} ({job['kind']}) attempt {job['attempts']}/{job['max_attempts']} failed: {error}")
+        traceback.print_exc()
+        return
+    finish_job(job['id'], json.dumps(result) if result is not None else None)
+
+
+class JobWorkers:
+    """
+    Threads that claim and run jobs until stop() is called. One of them also does the housekeeping every
+    JOB_POLL_INTERVAL * 60 seconds: jobs running longer than JOB_TIMEOUT are queued again, finished ones older than
+    JOB_KEEP_SECONDS are deleted.
+    """
+    def __init__(self, app, threads: int):
+        self.app = app
+        self.threads = threads
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self._stopping = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            for number in range(self.threads):
+                thread = threading.Thread(target=self._run, args=(number,), name=f"job-worker-{number}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout: float = None):
+        """
+        Lets the workers finish the job they are running and waits for them.
+        """
+        self._stopping.set()
+        with _wakeup:
+            _wakeup.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _housekeeping(self):
+        config = self.app.config
+        now = time.time()
+        stale = requeue_stale_jobs(now - config['JOB_TIMEOUT'])
+        if stale:
+            print(f"Queued {stale} jobs again whose worker stopped")
+        prune_jobs(now - config['JOB_KEEP_SECONDS'])
+
+    def _run(self, number):
+        worker = f"{self.name}/{number}"
+        poll_interval = self.app.config['JOB_POLL_INTERVAL']
+        next_housekeeping = 0
+        while not self._stopping.is_set():
+            try:
+                with self.app.app_context():
+                    if number == 0 and time.monotonic() >= next_housekeeping:
+                        self._housekeeping()
+                        next_housekeeping = time.monotonic() + poll_interval * 60
+                    job = claim_job(worker, time.time())
+                    if job is not None:
+                        run_job(job)
+                        continue
+            except Exception:
+                # e.g. the database is locked for longer than busy_timeout, try again after the pause
+                traceback.print_exc()
+            with _wakeup:
+                if not self._stopping.is_set():
+                    _wakeup.wait(poll_interval)
+
+
+def init_jobs(app):
+    """
+    Sets up the workers of the web process; they start with the first request, so a process that only runs a
+    cli command (and a gunicorn master before it forks) doesn't run jobs.
+    """
+    workers = app.extensions['job_workers'] = JobWorkers(app, app.config['JOB_WORKERS'])
+    if workers.threads:
+        app.before_request(workers.start)
+
+
+@job_handler('delete_user')
+def delete_user_job(payload):
+    purge_user(payload['user_id'], current_app.config['ACCOUNT_DELETE_BATCH_SIZE'])
+
+
+@click.command('jobs-worker')
+@click.option('--threads', type=click.IntRange(1), default=2, show_default=True, help="jobs run at the same time")
+def jobs_worker_command(threads):
+    """Run background jobs until interrupted (Ctrl+C or SIGTERM), the running ones are finished first."""
+    workers = JobWorkers(current_app._get_current_object(), threads)
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    workers.start()
+    click.echo(f"Job worker {workers.name} running {threads} threads")
+    try:
+        while not stop.wait(1):
+            pass
+    except KeyboardInterrupt:
+        pass
+    click.echo("Stopping, waiting for the running jobs")
+    workers.stop()
@@ -0,0 +1,289 @@
+# metrics.py
+
+import bisect
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from flask import Response, g, request
+
+from .database import get_pool_stats, get_cache_stats
+
+
+"""
+This script contains the metrics served at /metrics in the Prometheus text format.
+
+    foodbook_http_request_duration_seconds  histogram per endpoint of the views and auth blueprints
+    foodbook_http_requests_total            requests per endpoint and status
+    foodbook_db_statements_total            sql statements / their time / rows per endpoint, from the request traces
+    foodbook_db_statement_seconds_total     (tracing.py, so they need QUERY_TRACE)
+    foodbook_db_rows_total
+    foodbook_db_repeated_statements_total   statements flagged as N+1 (QUERY_TRACE_REPEATS)
+    foodbook_db_connections_opened_total    connections the pool opened, plus its size and wait counters
+    foodbook_upload_bytes                   histogram of uploaded photo sizes
+    foodbook_cache_hits_total               hits / misses / hit ratio of the session user, ingredient index and
+    foodbook_cache_misses_total             render caches
+    foodbook_cache_hit_ratio
+
+Counters and histograms are kept per thread, so recording never takes a lock: each thread adds to its own dict, the
+scrape sums them up. A thread allocates its dict once per metric and its entries once per label set; when threads
+end their numbers are folded into one shared dict, so a server starting a thread per request doesn't grow them.
+
+Like the caches, every process has its own numbers; with several gunicorn workers each scrape sees the worker that
+answered it.
+"""
+
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _ThreadMetric(ABC):
+    """
+    Base of Counter and Histogram: one dict of label values -> value per thread. Subclasses say how two values of
+    the same label set add up (_merge) and how they are written out (expose).
+    """
+    kind = None
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # thread -> its dict, and the folded numbers of threads that ended
+        self._shards = {}
+        self._retired = {}
+        _registry.append(self)
+
+    def _shard(self) -> dict:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._retire_dead_threads()
+                self._shards[threading.current_thread()] = shard
+            return shard
+
+    def _retire_dead_threads(self):
+        for thread in [thread for thread in self._shards if not thread.is_alive()]:
+            for key, value in self._shards.pop(thread).items():
+                self._merge(self._retired, key, value)
+
+    @abstractmethod
+    def _merge(self, into, key, value):
+        """
+        Adds value to the value of key in into, or sets it if into has none yet (without keeping a reference to a
+        mutable value, the shards keep changing theirs).
+        """
+
+    @abstractmethod
+    def expose(self):
+        """
+        Yields the lines of the metric in the Prometheus text format, without HELP and TYPE.
+        """
+
+    def collect(self) -> dict:
+        totals = {}
+        with self._lock:
+            self._retire_dead_threads()
+            shards = [self._retired] + list(self._shards.values())
+        for shard in shards:
+            # list() copies in one step, the owning thread may add a label set meanwhile
+            for key, value in list(shard.items()):
+                self._merge(totals, key, value)
+        return totals
+
+
+class Counter(_ThreadMetric):
+    kind = 'counter'
+
+    def inc(self, labels: tuple = (), amount=1):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def _merge(self, into, key, value):
+        into[key] = into.get(key, 0) + value
+
+    def expose(self):
+        for labels, value in sorted(self.collect().items()):
+            yield f"{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}"
+
+
+class Histogram(_ThreadMetric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, buckets: tuple, labels: tuple = ()):
+        """
+        Parameters:
+            buckets (tuple): upper bounds in increasing order, +Inf is added.
+        """
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, labels: tuple = ()):
+        shard = self._shard()
+        counts = shard.get(labels)
+        if counts is None:
+            # one count per bucket (not cumulative), the +Inf bucket, then the sum
+            counts = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def _merge(self, into, key, value):
+        total = into.get(key)
+        if total is None:
+            into[key] = list(value)
+        else:
+            for i, count in enumerate(value):
+                total[i] += count
+
+    def expose(self):
+        for labels, counts in sorted(self.collect().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="' + _format_value(float(bound)) + '"'
+                yield f"{self.name}_bucket{_format_labels(self.labels, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labels, labels)} {_format_value(counts[-1])}"
+            yield f"{self.name}_count{_format_labels(self.labels, labels)} {cumulative}"
+
+
+class Collected:
+    """
+    Metric whose values are read at scrape time, collect() returns {label values: value}.
+    """
+    def __init__(self, name: str, help: str, kind: str, labels: tuple, collect):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labels = tuple(labels)
+        self.collect = collect
+        _registry.append(self)
+
+    def expose(self):
+        for labels, value in sorted(self.collect().items()):
+            yield f"{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}"
+
+
+# ----------- the app's metrics -----------
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+UPLOAD_BUCKETS = (16 * 1024, 64 * 1024, 256 * 1024, 1024 * 1024, 4 * 1024 * 1024, 16 * 1024 * 1024)
+
+# blueprints whose requests are measured
+MEASURED_BLUEPRINTS = ('views', 'auth')
+
+request_duration = Histogram('foodbook_http_request_duration_seconds', "Time spent handling a request.",
+                             LATENCY_BUCKETS, ('endpoint', 'method'))
+requests_total = Counter('foodbook_http_requests_total', "Requests handled.", ('endpoint', 'method', 'status'))
+db_statements = Counter('foodbook_db_statements_total', "SQL statements run while handling requests.", ('endpoint',))
+db_seconds = Counter('foodbook_db_statement_seconds_total', "Time spent in SQL statements, fetching included.",
+                     ('endpoint',))
+db_rows = Counter('foodbook_db_rows_total', "Rows returned by SQL statements.", ('endpoint',))
+db_repeated = Counter('foodbook_db_repeated_statements_total',
+                      "Statements that ran QUERY_TRACE_REPEATS times or more in one request (N+1).", ('endpoint',))
+upload_bytes = Histogram('foodbook_upload_bytes', "Size of uploaded photos.", UPLOAD_BUCKETS)
+
+
+def _pool(key):
+    def collect():
+        stats = get_pool_stats()
+        return {(): stats[key]} if stats else {}
+    return collect
+
+
+def _caches(key):
+    def collect():
+        values = {}
+        for name, stats in get_cache_stats().items():
+            if key == 'ratio':
+                lookups = stats['hits'] + stats['misses']
+                values[(name,)] = stats['hits'] / lookups if lookups else 0.0
+            else:
+                values[(name,)] = stats[key]
+        return values
+    return collect
+
+
+Collected('foodbook_db_connections_opened_total', "Connections the pool opened.", 'counter', (), _pool('opened'))
+Collected('foodbook_db_pool_connections', "Open connections of the pool.", 'gauge', (), _pool('size'))
+Collected('foodbook_db_pool_connections_in_use', "Connections handed out right now.", 'gauge', (), _pool('in_use'))
+Collected('foodbook_db_pool_waits_total', "Acquires that had to wait for a free connection.", 'counter', (),
+          _pool('waits'))
+Collected('foodbook_db_pool_timeouts_total', "Acquires that gave up waiting.", 'counter', (), _pool('timeouts'))
+Collected('foodbook_db_pool_wait_seconds_total', "Time spent waiting for a connection.", 'counter', (),
+          _pool('wait_time_total'))
+Collected('foodbook_cache_hits_total', "Cache lookups that found an entry.", 'counter', ('cache',), _caches('hits'))
+Collected('foodbook_cache_misses_total', "Cache lookups that found nothing.", 'counter', ('cache',),
+          _caches('misses'))
+Collected('foodbook_cache_hit_ratio', "hits / (hits + misses) since the process started.", 'gauge', ('cache',),
+          _caches('ratio'))
+
+
+def expose() -> str:
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.expose())
+    return "\n".join(lines) + "\n"
+
+
+# ----------- flask hooks -----------
+
+def _start_timer():
+    g.metrics_started = time.perf_counter()
+
+
+def _record_request(response):
+    started = g.get('metrics_started')
+    if started is not None and request.blueprint in MEASURED_BLUEPRINTS:
+        request_duration.observe(time.perf_counter() - started, (request.endpoint, request.method))
+        requests_total.inc((request.endpoint, request.method, response.status_code))
+    return response
+
+
+def _record_trace(trace, repeats):
+    # a request that matched no route still has its trace
+    labels = (trace.endpoint or 'unmatched',)
+    db_statements.inc(labels, trace.count)
+    db_seconds.inc(labels, trace.duration)
+    db_rows.inc(labels, sum(query.rows for query in trace.statements))
+    repeated = trace.repeated(repeats)
+    if repeated:
+        db_repeated.inc(labels, len(repeated))
+
+
+def metrics_view():
+    return Response(expose(), mimetype='text/plain; version=0.0.4')
+
+
+def init_metrics(app):
+    """
+    Registers /metrics and the hooks feeding it. Call after init_query_tracing, the db metrics come from the
+    request traces.
+    """
+    app.before_request(_start_timer)
+    app.after_request(_record_request)
+    if 'query_trace_listeners' in app.extensions:
+        repeats = app.config['QUERY_TRACE_REPEATS']
+        app.extensions['query_trace_listeners'].append(lambda trace: _record_trace(trace, repeats))
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
@@ -0,0 +1,142 @@
+# migrations.py
+
+import importlib.util
+import re
+import sqlite3
+from pathlib import Path
+
+import click
+
+from .database import DB_PATH, _connect
+
+
+"""
+This script contains the schema migrations.
+
+ddl.sql is the baseline schema (version 0). Every change after it is a numbered file in website/sql/migrations:
+    0001_some_name.sql  - plain sql statements
+    0002_some_name.py   - a module with an upgrade(conn) function, for changes that need python (moving data etc.)
+
+The version of a database is kept in PRAGMA user_version. migrate() runs at startup: when the database is up to
+date this is a single pragma read, otherwise all pending migrations are applied in one IMMEDIATE transaction together
+with the new user_version. Readers keep working while it runs (WAL), and if any migration fails nothing is applied.
+Migration files must not contain BEGIN / COMMIT themselves.
+
+Migrations are applied whenever the app is created, so to roll them out before restarting the workers run from the
+project root:
+    flask --app main migrate
+"""
+
+
+MIGRATIONS_PATH = Path("website/sql/migrations")
+
+_MIGRATION_FILE = re.compile(r'^(\d{4})_\w+\.(sql|py)$')
+
+
+def discover_migrations(path=MIGRATIONS_PATH):
+    """
+    Returns a list of (version, path) tuples sorted by version.
+
+    Raises:
+        ValueError: If two files share a version number.
+    """
+    migrations = {}
+    for file in path.iterdir():
+        match = _MIGRATION_FILE.match(file.name)
+        if not match:
+            continue
+        version = int(match.group(1))
+        if version in migrations:
+            raise ValueError(f"Duplicate migration version {version}: {migrations[version].name}, {file.name}")
+        migrations[version] = file
+    return sorted(migrations.items())
+
+
+def latest_version(path=MIGRATIONS_PATH) -> int:
+    migrations = discover_migrations(path)
+    return migrations[-1][0] if migrations else 0
+
+
+def get_schema_version(conn) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def split_statements(script: str) -> list[str]:
+    """
+    Splits a sql script into single statements (trigger bodies stay in one piece).
+
+    Raises:
+        ValueError: If the script ends with an incomplete statement.
+    """
+    statements = []
+    buffer = ''
+    for line in script.splitlines(keepends=True):
+        buffer += line
+        if sqlite3.complete_statement(buffer):
+            statements.append(buffer.strip())
+            buffer = ''
+    leftover = [line for line in buffer.splitlines() if line.strip() and not line.strip().startswith('--')]
+    if leftover:
+        raise ValueError(f"Incomplete sql statement at end of script: {' '.join(leftover)[:80]}")
+    return statements
+
+
+def _run_migration(conn, path: Path):
+    if path.suffix == '.sql':
+        for statement in split_statements(path.read_text(encoding='utf-8')):
+            conn.execute(statement)
+    else:
+        spec = importlib.util.spec_from_file_location(f"migration_{path.stem}", path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        module.upgrade(conn)
+
+
+def migrate(db_path=DB_PATH, pragmas=None, path=MIGRATIONS_PATH) -> list[int]:
+    """
+    Applies all pending migrations to the database in one transaction.
+
+    Returns:
+        list[int]: versions that were applied, empty when the database was already up to date.
+    """
+    migrations = discover_migrations(path)
+    target = migrations[-1][0] if migrations else 0
+
+    conn = _connect(db_path, pragmas)
+    try:
+        current = get_schema_version(conn)
+        if current >= target:
+            if current > target:
+                print(f"Database schema version {current} is newer than this code ({target})")
+            return []
+
+        # manual transaction control, the sqlite3 module would otherwise commit before some statements
+        conn.isolation_level = None
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # another process may have migrated while we were waiting for the write lock
+            current = get_schema_version(conn)
+            pending = [(version, file) for version, file in migrations if version > current]
+            for version, file in pending:
+                _run_migration(conn, file)
+            if pending:
+                conn.execute(f"PRAGMA user_version = {int(pending[-1][0])}")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return [version for version, _ in pending]
+    finally:
+        conn.close()
+
+
+@click.command('migrate')
+def migrate_command():
+    """Apply pending database migrations and print the schema version."""
+    applied = migrate()
+    if applied:
+        click.echo(f"Applied migrations {', '.join(map(str, applied))}")
+    conn = _connect(DB_PATH)
+    version = get_schema_version(conn)
+    conn.close()
+    click.echo(f"Database schema version {version} (latest {latest_version()})")
@@ -5,30 +5,61 @@ import json
 
 """
 This script contains a User class. Part of the script, before adapting it to this application, was taken from techwithtim's flask tutorial which is cited in the ReadMe.'
+
+A User can be built from a row with only the identity columns (see database.get_session_user); the password,
+dietary preferences and allergies are then loaded from the database the first time they are read.
 """
 
 
+def _json_list(value):
+    try:
+        # lists are stored as JSON strings
+        return json.loads(value) if value else []
+    except:
+        return []
+
+
 class User(UserMixin):
     def __init__(self, user_row):
+        columns = user_row.keys()
         self.id = user_row['id']
         self.user_name = user_row['user_name']
         self.email = user_row['email']
-        self.password = user_row['password']
-        try:
-            # dietary_preferences is stored as JSON string
-            self.dietary_preferences = json.loads(user_row['dietary_preferences']) if user_row['dietary_preferences'] else []
-        except:
-            self.dietary_preferences = []
         self.cooking_level = user_row['cooking_level']
-        try:
-            self.allergies = json.loads(user_row['allergies']) if user_row['allergies'] else []
-        except:
-            self.allergies = []
-        self.photo_data = user_row['photo_data']
+        self.photo_hash = user_row['photo_hash']
+        # set while the account is being deleted (database.mark_user_deleted)
+        self.deleted_at = user_row['deleted_at'] if 'deleted_at' in columns else None
+        self._password = user_row['password'] if 'password' in columns else None
+        self._details = None
+        if 'dietary_preferences' in columns:
+            self._details = (_json_list(user_row['dietary_preferences']), _json_list(user_row['allergies']))
+
+    def _load_details(self):
+        if self._details is None:
+            from .database import get_user_details
+            preferences, allergies = get_user_details(self.id)
+            self._details = (_json_list(preferences), _json_list(allergies))
+        return self._details
+
+    @property
+    def password(self):
+        if self._password is None:
+            from .database import get_user_password
+            self._password = get_user_password(self.id)
+        return self._password
+
+    @property
+    def dietary_preferences(self):
+        return self._load_details()[0]
+
+    @property
+    def allergies(self):
+        return self._load_details()[1]
 
     @property
     def profile_image(self):
-        return self.photo_data
+        # digest of the profile photo in the photo store, None when the user has none
+        return self.photo_hash
 
     @property
     def is_authenticated(self):
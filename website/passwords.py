@@ -0,0 +1,115 @@
+# passwords.py
+
+import hmac
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+"""
+This script contains the hashing and checking of passwords.
+
+Passwords are stored as werkzeug scrypt hashes (scrypt:<n>:<r>:<p>$<salt>$<hash>). One hash takes tens of
+milliseconds of CPU and 128 * n * r bytes of memory (32 MiB with the defaults), which would hold the request thread
+(and the GIL) for every login and sign up. So hashing runs in a process pool of PASSWORD_WORKERS processes, and at
+most PASSWORD_QUEUE_SIZE more requests wait for it; a request that can't get a place within PASSWORD_TIMEOUT seconds
+gets PasswordPoolBusy instead of piling up behind the others.
+
+The cost is PASSWORD_SCRYPT_N / _R / _P. Hashes with another cost, and the plaintext passwords of rows from before
+hashing (dml.sql, the benchmark data), are still accepted and replaced by a hash with the current cost on the next
+successful login (needs_rehash). python -m benchmarks.passwords measures the logins per second and core a cost allows.
+"""
+
+
+HASH_PREFIXES = ('scrypt:', 'pbkdf2:')
+
+
+class PasswordPoolBusy(Exception):
+    """
+    Raised when every hashing process is busy and PASSWORD_QUEUE_SIZE requests already wait for one.
+    """
+
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = None
+_timeout = 5.0
+_method = 'scrypt:32768:8:1'
+
+
+def scrypt_method(n: int, r: int, p: int) -> str:
+    """
+    Returns the werkzeug method string of a scrypt cost, e.g. 'scrypt:32768:8:1'.
+
+    Raises:
+        ValueError: If n isn't a power of two above 1, or r or p is below 1.
+    """
+    if n < 2 or n & (n - 1) or r < 1 or p < 1:
+        raise ValueError(f"Invalid scrypt cost n={n} r={r} p={p}, n must be a power of two")
+    return f"scrypt:{n}:{r}:{p}"
+
+
+def init_password_pool(app):
+    """
+    Starts the hashing processes (PASSWORD_WORKERS, 0 hashes in the request thread) with the cost of the config.
+    """
+    global _executor, _slots, _timeout, _method
+    config = app.config
+    _method = scrypt_method(config['PASSWORD_SCRYPT_N'], config['PASSWORD_SCRYPT_R'], config['PASSWORD_SCRYPT_P'])
+    _timeout = config['PASSWORD_TIMEOUT']
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+        workers = config['PASSWORD_WORKERS']
+        _executor = ProcessPoolExecutor(max_workers=workers) if workers else None
+        # the running hashes plus the waiting ones
+        _slots = threading.BoundedSemaphore(max(workers, 1) + config['PASSWORD_QUEUE_SIZE'])
+
+
+def _run(fn, *args):
+    if _slots is None:
+        return fn(*args)
+    if not _slots.acquire(timeout=_timeout):
+        raise PasswordPoolBusy(f"No password hashing process free within {_timeout} seconds")
+    try:
+        if _executor is None:
+            return fn(*args)
+        return _executor.submit(fn, *args).result()
+    finally:
+        _slots.release()
+
+
+def hash_password(password: str) -> str:
+    """
+    Returns the hash of a password to store, with the configured cost.
+
+    Raises:
+        PasswordPoolBusy: If the pool is saturated.
+    """
+    return _run(generate_password_hash, password, _method)
+
+
+def is_hashed(stored: str) -> bool:
+    return stored.startswith(HASH_PREFIXES) and stored.count('$') == 2
+
+
+def verify_password(stored: str, password: str) -> bool:
+    """
+    Checks a password against what the users table holds: a hash, or the plain password of an old row.
+
+    Raises:
+        PasswordPoolBusy: If the pool is saturated.
+    """
+    if not stored or password is None:
+        return False
+    if not is_hashed(stored):
+        return hmac.compare_digest(stored.encode('utf-8'), password.encode('utf-8'))
+    return _run(check_password_hash, stored, password)
+
+
+def needs_rehash(stored: str) -> bool:
+    """
+    True for plain passwords and hashes with another method or cost than the configured one.
+    """
+    return not stored.startswith(_method + '$')
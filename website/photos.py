@@ -0,0 +1,197 @@
+# photos.py
+
+import hashlib
+import io
+import os
+import re
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import click
+from PIL import Image, ImageOps
+
+from .database import get_all_photo_hashes
+from .metrics import upload_bytes
+from .jobs import job_handler, enqueue
+
+
+"""
+This script contains the photo store.
+
+Uploaded photos are kept on disk under instance/photos, named after the sha256 of their content
+(instance/photos/ab/abcdef...). The database only keeps the hash (recipe.photo_hash, users.photo_hash). Since the
+content of a hash never changes, the photo route can let browsers cache photos forever, and two uploads of the same
+picture share one file.
+
+Next to the original, each photo gets resized JPEG variants (see VARIANTS) named <digest>.<variant>.jpg. They are
+rendered by a photo_variants background job (jobs.py) in a small process pool after the upload, so request threads
+never decode images; until a variant exists the photo route falls back to the original. flask --app main
+backfill-photos renders missing variants of photos uploaded before.
+"""
+
+
+PHOTOS_PATH = Path("instance/photos")
+
+# variant name -> longest edge in pixels
+VARIANTS = {
+    'card': 400,
+    'detail': 1024,
+}
+VARIANT_QUALITY = 82
+
+_DIGEST = re.compile(r'^[0-9a-f]{64}$')
+
+# first bytes of the image formats browsers display
+_SIGNATURES = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'BM', 'image/bmp'),
+)
+
+
+def is_valid_digest(digest: str) -> bool:
+    return bool(digest) and bool(_DIGEST.match(digest))
+
+
+def photo_path(digest: str, root=PHOTOS_PATH) -> Path:
+    return root / digest[:2] / digest
+
+
+def variant_path(digest: str, variant: str, root=PHOTOS_PATH) -> Path:
+    return root / digest[:2] / f"{digest}.{variant}.jpg"
+
+
+def save_photo(data, root=PHOTOS_PATH) -> str:
+    """
+    Stores a photo and returns its sha256 hex digest.
+
+    Parameters:
+        data (bytes or file-like): photo content, file objects (e.g. an uploaded FileStorage) are copied in chunks.
+    """
+    stream = io.BytesIO(data) if isinstance(data, (bytes, bytearray, memoryview)) else data
+    root.mkdir(parents=True, exist_ok=True)
+
+    sha = hashlib.sha256()
+    size = 0
+    fd, tmp_name = tempfile.mkstemp(dir=root, prefix='.upload-')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            for chunk in iter(lambda: stream.read(64 * 1024), b''):
+                sha.update(chunk)
+                tmp.write(chunk)
+                size += len(chunk)
+        digest = sha.hexdigest()
+        upload_bytes.observe(size)
+
+        target = photo_path(digest, root)
+        if target.exists():
+            os.remove(tmp_name)
+        else:
+            target.parent.mkdir(exist_ok=True)
+            # atomic, a concurrent upload of the same photo just replaces it with identical bytes
+            os.replace(tmp_name, target)
+    except BaseException:
+        if os.path.exists(tmp_name):
+            os.remove(tmp_name)
+        raise
+    return digest
+
+
+def guess_mimetype(path: Path) -> str:
+    with path.open('rb') as f:
+        head = f.read(12)
+    for signature, mimetype in _SIGNATURES:
+        if head.startswith(signature):
+            return mimetype
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'application/octet-stream'
+
+
+def render_variants(digest: str, root=PHOTOS_PATH) -> list[str]:
+    """
+    Decodes the original once and writes every missing variant. Runs in the worker processes, so it only takes
+    and returns plain values.
+
+    Returns:
+        list[str]: names of the variants that were written, empty if the file is not an image Pillow can read.
+    """
+    root = Path(root)
+    missing = [name for name in VARIANTS if not variant_path(digest, name, root).exists()]
+    if not missing:
+        return []
+
+    try:
+        with Image.open(photo_path(digest, root)) as original:
+            image = ImageOps.exif_transpose(original)
+            if image.mode not in ('RGB', 'L'):
+                # jpeg has no alpha channel, put transparent images on white
+                background = Image.new('RGB', image.size, 'white')
+                background.paste(image.convert('RGBA'), mask=image.convert('RGBA').getchannel('A'))
+                image = background
+
+            written = []
+            # largest first, each smaller variant is resized from the previous one
+            for name in sorted(missing, key=VARIANTS.get, reverse=True):
+                fd, tmp_name = tempfile.mkstemp(dir=root, prefix='.variant-')
+                with os.fdopen(fd, 'wb') as tmp:
+                    if original.format == 'JPEG' and max(original.size) <= VARIANTS[name]:
+                        # already small enough, re-encoding would only make it bigger
+                        with photo_path(digest, root).open('rb') as f:
+                            shutil.copyfileobj(f, tmp)
+                    else:
+                        image.thumbnail((VARIANTS[name], VARIANTS[name]), Image.LANCZOS)
+                        image.save(tmp, 'JPEG', quality=VARIANT_QUALITY, optimize=True, progressive=True)
+                os.replace(tmp_name, variant_path(digest, name, root))
+                written.append(name)
+            return written
+    except (OSError, Image.DecompressionBombError, ValueError):
+        return []
+
+
+# ----------- variant worker pool -----------
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def init_photo_pool(app):
+    """
+    Sets the size of the process pool (PHOTO_WORKERS) the photo_variants jobs render in.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+        _executor = ProcessPoolExecutor(max_workers=app.config['PHOTO_WORKERS'])
+
+
+@job_handler('photo_variants')
+def render_variants_job(payload):
+    # the job worker thread only waits, decoding and resizing happen in the process pool
+    if _executor is None:
+        return render_variants(payload['digest'])
+    return _executor.submit(render_variants, payload['digest'], PHOTOS_PATH).result()
+
+
+def schedule_variants(digest: str, user_id: int = None) -> int:
+    """
+    Queues rendering of the variants of a stored photo as a background job (see jobs.py), returns the job id.
+    """
+    return enqueue('photo_variants', {'digest': digest}, user_id)
+
+
+@click.command('backfill-photos')
+def backfill_photos_command():
+    """Render missing variants of all stored recipe and profile photos."""
+    digests = [digest for digest in get_all_photo_hashes() if photo_path(digest).exists()]
+    rendered = 0
+    with ProcessPoolExecutor() as executor:
+        for written in executor.map(render_variants, digests, [PHOTOS_PATH] * len(digests), chunksize=8):
+            rendered += bool(written)
+    click.echo(f"Rendered variants for {rendered} of {len(digests)} photos")
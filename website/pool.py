@@ -0,0 +1,151 @@
+# pool.py
+
+import queue
+import sqlite3
+import threading
+import time
+
+
+"""
+This script contains a small sqlite connection pool.
+
+Connections are opened lazily up to max_size and handed out one per app context (see get_db_connection in
+database.py). Keeping the connections alive between requests means we pay for sqlite3.connect and the pragmas only
+once per connection, and sqlite's prepared statement cache survives across requests.
+"""
+
+
+class PooledConnection(sqlite3.Connection):
+    """
+    Connection class used for pooled connections.
+
+    The helpers in database.py call close() when they are done. For a pooled connection that only rolls back
+    whatever the helper left uncommitted (same as a real close would do); the connection itself goes back to the
+    pool when the app context is torn down.
+    """
+    pooled = False
+    waited = False
+
+    def close(self):
+        if not self.pooled:
+            super().close()
+        elif self.in_transaction:
+            self.rollback()
+
+    def dispose(self):
+        self.pooled = False
+        super().close()
+
+
+class ConnectionPool:
+    def __init__(self, connect, max_size: int = 8, timeout: float = 5.0):
+        """
+        Parameters:
+            connect (callable): returns a new PooledConnection.
+            max_size (int): maximum number of open connections.
+            timeout (float): seconds to wait for a free connection before giving up.
+        """
+        self._connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+
+        # LIFO so the most recently used (warmest) connection is handed out first
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+
+        self._size = 0
+        self._opened = 0
+        self._in_use = 0
+        self._acquired = 0
+        self._timeouts = 0
+        self._waits = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+
+    def acquire(self) -> PooledConnection:
+        start = time.perf_counter()
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._open_or_wait()
+        waited = time.perf_counter() - start
+
+        with self._lock:
+            self._in_use += 1
+            self._acquired += 1
+            if conn.waited:
+                self._waits += 1
+            self._wait_time_total += waited
+            self._wait_time_max = max(self._wait_time_max, waited)
+        conn.waited = False
+        return conn
+
+    def _open_or_wait(self) -> PooledConnection:
+        with self._lock:
+            can_open = self._size < self.max_size
+            if can_open:
+                self._size += 1
+
+        if can_open:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._lock:
+                    self._size -= 1
+                raise
+            conn.pooled = True
+            conn.waited = False
+            with self._lock:
+                self._opened += 1
+            return conn
+
+        try:
+            conn = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            with self._lock:
+                self._timeouts += 1
+            raise sqlite3.OperationalError(
+                f"connection pool exhausted: {self.max_size} connections in use for {self.timeout}s"
+            )
+        conn.waited = True
+        return conn
+
+    def release(self, conn: PooledConnection) -> None:
+        with self._lock:
+            self._in_use -= 1
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # broken connection, drop it so the next acquire opens a fresh one
+            with self._lock:
+                self._size -= 1
+            conn.dispose()
+            return
+        self._idle.put(conn)
+
+    def close_all(self) -> None:
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._size -= 1
+            conn.dispose()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'size': self._size,
+                'max_size': self.max_size,
+                'opened': self._opened,
+                'in_use': self._in_use,
+                'idle': self._size - self._in_use,
+                'acquired': self._acquired,
+                'waits': self._waits,
+                'timeouts': self._timeouts,
+                'wait_time_total': self._wait_time_total,
+                'wait_time_avg': self._wait_time_total / self._acquired if self._acquired else 0.0,
+                'wait_time_max': self._wait_time_max,
+            }
@@ -0,0 +1,148 @@
+# quantities.py
+
+import re
+from fractions import Fraction
+
+
+"""
+This script contains the parsing of ingredient quantities.
+
+Recipe forms take ingredients as free text ("1 1/2 cups rice", "200g flour", "2 eggs", "salt"). parse_ingredient
+splits such an entry into the ingredient name, the quantity and unit as typed (kept for display) and a numeric amount
+with a canonical unit code. UNITS is the conversion table: each canonical unit belongs to a dimension and converts
+to the base unit of that dimension with one factor. It is stored in the unit table (migration 0005) so sql can sum
+and scale amounts directly.
+"""
+
+
+# canonical unit -> (dimension, factor to the base unit of the dimension, aliases)
+UNITS = {
+    # mass, base gram
+    'g': ('mass', 1.0, ('g', 'gr', 'gram', 'grams', 'gramme', 'grammes')),
+    'kg': ('mass', 1000.0, ('kg', 'kgs', 'kilo', 'kilos', 'kilogram', 'kilograms')),
+    'mg': ('mass', 0.001, ('mg', 'milligram', 'milligrams')),
+    'oz': ('mass', 28.349523125, ('oz', 'ounce', 'ounces')),
+    'lb': ('mass', 453.59237, ('lb', 'lbs', 'pound', 'pounds')),
+    # volume, base millilitre
+    'ml': ('volume', 1.0, ('ml', 'milliliter', 'milliliters', 'millilitre', 'millilitres')),
+    'cl': ('volume', 10.0, ('cl', 'centiliter', 'centiliters', 'centilitre', 'centilitres')),
+    'dl': ('volume', 100.0, ('dl', 'deciliter', 'deciliters', 'decilitre', 'decilitres')),
+    'l': ('volume', 1000.0, ('l', 'liter', 'liters', 'litre', 'litres')),
+    'tsp': ('volume', 4.92892159375, ('tsp', 'tsps', 'teaspoon', 'teaspoons')),
+    'tbsp': ('volume', 14.78676478125, ('tbsp', 'tbsps', 'tbs', 'tbl', 'tablespoon', 'tablespoons')),
+    'fl oz': ('volume', 29.5735295625, ('fl oz', 'fl. oz', 'fluid ounce', 'fluid ounces')),
+    'cup': ('volume', 236.5882365, ('cup', 'cups')),
+    'pint': ('volume', 473.176473, ('pt', 'pint', 'pints')),
+    'quart': ('volume', 946.352946, ('qt', 'quart', 'quarts')),
+    # counted, each its own dimension because a can and a clove don't add up
+    'piece': ('piece', 1.0, ('piece', 'pieces', 'pc', 'pcs')),
+    'clove': ('clove', 1.0, ('clove', 'cloves')),
+    'slice': ('slice', 1.0, ('slice', 'slices')),
+    'can': ('can', 1.0, ('can', 'cans', 'tin', 'tins')),
+    'bunch': ('bunch', 1.0, ('bunch', 'bunches')),
+    'pinch': ('pinch', 1.0, ('pinch', 'pinches')),
+}
+
+# base unit of each dimension
+BASE_UNITS = {'mass': 'g', 'volume': 'ml', **{dimension: code for code, (dimension, _, _) in UNITS.items()
+                                              if dimension not in ('mass', 'volume')}}
+
+_ALIASES = {alias: code for code, (_, _, aliases) in UNITS.items() for alias in aliases}
+# longest first so "fl oz" wins over "oz" and "tbsp" over "tbs"
+_UNIT_PATTERN = '|'.join(re.escape(alias) for alias in sorted(_ALIASES, key=len, reverse=True))
+
+_VULGAR_FRACTIONS = {'½': Fraction(1, 2), '⅓': Fraction(1, 3), '⅔': Fraction(2, 3), '¼': Fraction(1, 4),
+                     '¾': Fraction(3, 4), '⅛': Fraction(1, 8)}
+_NUMBER = r'\d+(?:[.,]\d+)?'
+_SINGLE = (rf'(?:{_NUMBER}\s*[{"".join(_VULGAR_FRACTIONS)}]|{_NUMBER}\s+\d+/\d+|\d+/\d+|{_NUMBER}'
+           rf'|[{"".join(_VULGAR_FRACTIONS)}])')
+# "2-3 apples" is a range, the upper end is what has to be bought
+_QUANTITY = rf'{_SINGLE}(?:\s*[-–]\s*{_SINGLE})?'
+
+_ENTRY = re.compile(
+    rf'^\s*(?P<quantity>{_QUANTITY})\s*(?:(?P<unit>{_UNIT_PATTERN})(?![\w]))?\.?\s*(?:of\s+)?(?P<name>.*)$',
+    re.IGNORECASE,
+)
+
+
+def parse_amount(text):
+    """
+    Returns the value of a quantity as written ("1 1/2", "1.5", "½", "1½", "200", "2-3"), or None if it isn't a
+    number.
+    """
+    text = (text or '').strip()
+    if not text or not re.fullmatch(_QUANTITY, text):
+        return None
+    if re.search('[-–]', text):
+        ends = [parse_amount(part) for part in re.split('[-–]', text)]
+        return None if None in ends else max(ends)
+    total = Fraction(0)
+    for part in re.findall(rf'\d+/\d+|{_NUMBER}|[{"".join(_VULGAR_FRACTIONS)}]', text):
+        if part in _VULGAR_FRACTIONS:
+            total += _VULGAR_FRACTIONS[part]
+        elif '/' in part:
+            numerator, denominator = part.split('/')
+            if int(denominator) == 0:
+                return None
+            total += Fraction(int(numerator), int(denominator))
+        else:
+            total += Fraction(part.replace(',', '.'))
+    return float(total)
+
+
+def unit_code(text):
+    """
+    Canonical code of a unit as written ("cups" -> "cup"), None for unknown units.
+    """
+    return _ALIASES.get(' '.join((text or '').lower().split()))
+
+
+def parse_ingredient(entry: str) -> dict:
+    """
+    Splits one ingredient entry of a recipe form.
+
+    Returns:
+        dict: name, quantity and unit (the text as typed, None when missing), amount (float or None) and unit_code.
+            A number without a unit counts pieces ("2 eggs"); an unknown unit leaves amount and unit_code empty.
+    """
+    entry = ' '.join(entry.split())
+    parsed = {'name': entry, 'quantity': None, 'unit': None, 'amount': None, 'unit_code': None}
+    match = _ENTRY.match(entry)
+    if not match or not match.group('name'):
+        return parsed
+
+    parsed['name'] = match.group('name').strip()
+    parsed['quantity'] = ' '.join(match.group('quantity').split())
+    parsed['unit'] = match.group('unit')
+    parsed['amount'] = parse_amount(parsed['quantity'])
+    if parsed['amount'] is not None:
+        parsed['unit_code'] = unit_code(parsed['unit']) if parsed['unit'] else 'piece'
+    return parsed
+
+
+def format_amount(amount) -> str:
+    """
+    1.5 -> '1.5', 2.0 -> '2', 0.3333 -> '0.33'
+    """
+    return f"{round(amount, 2):g}"
+
+
+def humanize(amount, code):
+    """
+    Moves large amounts in a base unit to the bigger metric unit: (1500, 'g') -> (1.5, 'kg').
+    """
+    if code == 'g' and amount >= 1000:
+        return amount / 1000, 'kg'
+    if code == 'ml' and amount >= 1000:
+        return amount / 1000, 'l'
+    return amount, code
+
+
+def format_ingredient(name, quantity=None, unit=None, amount=None) -> str:
+    """
+    One ingredient line as it would be typed: "1 1/2 cups Rice". With amount (e.g. scaled to other servings) the
+    number is printed from it instead of the quantity as typed.
+    """
+    if amount is not None:
+        quantity = format_amount(amount)
+    return ' '.join(part for part in (quantity, unit, name) if part)
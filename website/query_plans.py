@@ -0,0 +1,216 @@
+# query_plans.py
+
+import ast
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+
+from . import database
+from .migrations import migrate
+
+
+"""
+This script checks the query plan of every sql statement in database.py.
+
+The statements are collected straight from the source of database.py (string literals, module level constants and
+local variables passed to execute / executemany), run through EXPLAIN QUERY PLAN against a fresh copy of the schema
+and reported when sqlite would answer them with a full table SCAN, or, for the queries in REQUIRED_INDEXES, without
+a range of the index they depend on. f-strings are filled in from the module's constants and SAMPLE_VALUES; a
+statement that is built at runtime some other way is listed as skipped. tests/test_query_plans.py runs the check.
+
+Run it from the project root, it exits with status 1 when a query regressed:
+    python -m website.query_plans
+"""
+
+
+# (function name, table) pairs that are allowed to scan
+ALLOWED_SCANS = {
+    # looks a title up across all users, no route uses it
+    ('get_meal_plan_by_title', 'meal_plan'),
+    # backfill-photos walks every photo on purpose
+    ('get_all_photo_hashes', 'recipe'),
+    ('get_all_photo_hashes', 'users'),
+}
+
+# {function name: {name: sample value}} for the parts of f-string sql that are built at runtime, so their statements
+# are checked like the others
+SAMPLE_VALUES = {
+    'update_meal': {'set_clause': 'meal_title = ?, meal_time = ?'},
+}
+
+# (function name, table as named in the plan): (index, column) the plan must search the table with, for queries that
+# are only fast as one range of an index; a SEARCH on the user alone would read all of the user's rows
+REQUIRED_INDEXES = {
+    ('get_shopping_list_for_dates', 'meal_plan_meal'): ('idx_meal_plan_meal_user_schedule', 'scheduled_datetime'),
+    ('get_scheduled_meals_between', 'mpm'): ('idx_meal_plan_meal_user_schedule', 'scheduled_datetime'),
+}
+
+
+def _string_value(node, names):
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    if isinstance(node, ast.Name):
+        return names.get(node.id)
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
+        left, right = _string_value(node.left, names), _string_value(node.right, names)
+        if left is not None and right is not None:
+            return left + right
+    if isinstance(node, ast.JoinedStr):
+        parts = [_string_value(part.value, names) if isinstance(part, ast.FormattedValue)
+                 and part.conversion == -1 and part.format_spec is None else _string_value(part, names)
+                 for part in node.values]
+        return None if None in parts else ''.join(parts)
+    return None
+
+
+def _is_pragma(node):
+    if isinstance(node, ast.JoinedStr):
+        node = node.values[0]
+    return isinstance(node, ast.Constant) and str(node.value).lstrip().upper().startswith('PRAGMA')
+
+
+def _assigned_strings(body, names):
+    names = dict(names)
+    for node in body:
+        if isinstance(node, ast.Assign):
+            value = _string_value(node.value, names)
+            for target in node.targets:
+                if isinstance(target, ast.Name) and value is not None:
+                    names[target.id] = value
+    return names
+
+
+def _loop_strings(func, names):
+    # {name: [sql, ...]} of the loops over a tuple or list of statements, e.g. purge_user's for sql in (...)
+    loops = {}
+    for node in ast.walk(func):
+        if (isinstance(node, ast.For) and isinstance(node.target, ast.Name)
+                and isinstance(node.iter, (ast.Tuple, ast.List))):
+            values = [_string_value(element, names) for element in node.iter.elts]
+            if values and None not in values:
+                loops[node.target.id] = values
+    return loops
+
+
+def _is_statement(sql):
+    # pragmas and other statements have no plan
+    return sql is None or sql.lstrip().upper().startswith(('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'REPLACE'))
+
+
+def _is_table_scan(words) -> bool:
+    # SCAN CONSTANT ROW is a SELECT without FROM, SCAN (subquery-N) reads rows a subquery already produced and
+    # json_each / other virtual tables only walk their argument
+    return (words[0] == 'SCAN' and words[1:3] != ['CONSTANT', 'ROW'] and not words[1].startswith('(')
+            and 'VIRTUAL' not in words)
+
+
+def _searches(plan, table, index, column) -> bool:
+    # e.g. SEARCH mpm USING INDEX idx_meal_plan_meal_user_schedule (user_id=? AND scheduled_datetime>? AND ...)
+    for line in plan:
+        words = line.split()
+        if words[:2] == ['SEARCH', table] and index in words and column in line.partition('(')[2]:
+            return True
+    return False
+
+
+def collect_statements(source_path=None):
+    """
+    Returns a list of (function name, sql) tuples, sql is None for statements that are built at runtime.
+
+    sql a helper gets as an argument (e.g. _names_in) is collected from the calls of the helper, under its name.
+    """
+    source_path = source_path or database.__file__
+    tree = ast.parse(Path(source_path).read_text(encoding='utf-8'))
+    module_names = _assigned_strings(tree.body, {})
+    functions = [node for node in tree.body if isinstance(node, ast.FunctionDef)]
+
+    statements = []
+    # {function name: position of its sql parameter}
+    sql_parameters = {}
+    function_names = {}
+    for func in functions:
+        names = function_names[func.name] = {**_assigned_strings(ast.walk(func), module_names),
+                                             **SAMPLE_VALUES.get(func.name, {})}
+        loops = _loop_strings(func, names)
+        parameters = [arg.arg for arg in func.args.args]
+        for node in ast.walk(func):
+            if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                    and node.func.attr in ('execute', 'executemany') and node.args):
+                sql = node.args[0]
+                if _is_pragma(sql):
+                    continue
+                if isinstance(sql, ast.Name) and sql.id in loops:
+                    found = loops[sql.id]
+                elif isinstance(sql, ast.Name) and sql.id in parameters and sql.id not in names:
+                    sql_parameters[func.name] = parameters.index(sql.id)
+                    continue
+                else:
+                    found = [_string_value(sql, names)]
+                statements.extend((func.name, statement) for statement in found if _is_statement(statement))
+
+    for func in functions:
+        for node in ast.walk(func):
+            if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in sql_parameters
+                    and len(node.args) > sql_parameters[node.func.id]):
+                sql = _string_value(node.args[sql_parameters[node.func.id]], function_names[func.name])
+                if _is_statement(sql):
+                    statements.append((node.func.id, sql))
+    return statements
+
+
+def explain(conn, sql):
+    # EXPLAIN only prepares the statement, the bound values don't matter
+    rows = conn.execute('EXPLAIN QUERY PLAN ' + sql, (1,) * sql.count('?')).fetchall()
+    return [row[3] for row in rows]
+
+
+def check_query_plans(statements=None):
+    """
+    Returns (problems, skipped): problems is a list of (function name, plan line or error, sql) for statements
+    that scan a whole table or don't compile, skipped lists the functions with runtime built sql.
+    """
+    statements = statements if statements is not None else collect_statements()
+    problems, skipped = [], []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / 'plans.db'
+        database.create_database(db_path)
+        migrate(db_path)
+        # foreign keys on, so the plans include the ON DELETE CASCADE lookups
+        conn = database._connect(db_path)
+        for func_name, sql in statements:
+            if sql is None:
+                skipped.append(func_name)
+                continue
+            try:
+                plan = explain(conn, sql)
+            except sqlite3.Error as e:
+                problems.append((func_name, f"ERROR {e}", sql))
+                continue
+            for line in plan:
+                words = line.split()
+                if _is_table_scan(words) and (func_name, words[1]) not in ALLOWED_SCANS:
+                    problems.append((func_name, line, sql))
+            for (required_func, table), (index, column) in REQUIRED_INDEXES.items():
+                if required_func == func_name and not _searches(plan, table, index, column):
+                    problems.append((func_name, f"no SEARCH {table} USING INDEX {index} ({column}...)", sql))
+        conn.close()
+    return problems, skipped
+
+
+def main():
+    problems, skipped = check_query_plans()
+    for func_name in skipped:
+        print(f"skipped {func_name}: sql is built at runtime")
+    for func_name, line, sql in problems:
+        print(f"{func_name}: {line}\n    {' '.join(sql.split())}")
+    if problems:
+        print(f"{len(problems)} query plan problem(s)")
+        return 1
+    print("all query plans use an index")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,21 @@
+-- 0001_hot_path_indexes.sql
+
+-- secondary indexes for the lookups in database.py that the PRIMARY KEY / UNIQUE constraints in ddl.sql don't cover.
+-- IF NOT EXISTS because databases created before migrations existed may already have them.
+-- python -m website.query_plans checks every query in database.py against the migrated schema.
+
+-- reverse side of the junction tables: the ON DELETE CASCADE of recipe, meal and ingredient
+-- (and the orphan clean-up triggers) look rows up by these columns
+CREATE INDEX IF NOT EXISTS idx_meal_recipe_recipe ON meal_recipe (recipe_id);
+CREATE INDEX IF NOT EXISTS idx_meal_plan_meal_meal ON meal_plan_meal (meal_id);
+CREATE INDEX IF NOT EXISTS idx_recipe_ingredient_ingredient ON recipe_ingredient (ingredient_id);
+
+-- schedule of a plan in date order (get_meal_plan_meals_and_schedules)
+CREATE INDEX IF NOT EXISTS idx_meal_plan_meal_schedule ON meal_plan_meal (meal_plan_id, scheduled_datetime);
+
+-- covering index for the ordered steps of a recipe (get_recipe_steps)
+CREATE INDEX IF NOT EXISTS idx_recipe_step_order ON recipe_step (recipe_id, step_number, description);
+
+-- per-user lists in id order (get_all_meals, get_all_meal_plans); recipe is covered by UNIQUE (user_id, id, name)
+CREATE INDEX IF NOT EXISTS idx_meal_user ON meal (user_id, meal_id);
+CREATE INDEX IF NOT EXISTS idx_meal_plan_user ON meal_plan (user_id, meal_plan_id);
@@ -0,0 +1,29 @@
+# 0002_photo_store.py
+
+from website.photos import save_photo
+
+
+"""
+Moves recipe and profile photos out of the database into the photo store (website/photos.py).
+
+Adds recipe.photo_hash and users.photo_hash, writes every existing blob to the store and clears the blob columns.
+The blob columns are kept so older code can still read the schema; run VACUUM afterwards to give the space back.
+"""
+
+
+def _move_photos(conn, table, blob_column):
+    # only the ids up front, the blobs are read one at a time so memory holds a single photo
+    ids = [row_id for row_id, in conn.execute(f"SELECT id FROM {table} WHERE {blob_column} IS NOT NULL")]
+    for row_id in ids:
+        blob, = conn.execute(f"SELECT {blob_column} FROM {table} WHERE id = ?", (row_id,)).fetchone()
+        if isinstance(blob, str):
+            blob = blob.encode('utf-8')
+        digest = save_photo(blob)
+        conn.execute(f"UPDATE {table} SET photo_hash = ?, {blob_column} = NULL WHERE id = ?", (digest, row_id))
+
+
+def upgrade(conn):
+    conn.execute("ALTER TABLE recipe ADD COLUMN photo_hash TEXT")
+    conn.execute("ALTER TABLE users ADD COLUMN photo_hash TEXT")
+    _move_photos(conn, 'recipe', 'photo')
+    _move_photos(conn, 'users', 'photo_data')
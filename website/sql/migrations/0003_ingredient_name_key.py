@@ -0,0 +1,33 @@
+# 0003_ingredient_name_key.py
+
+
+"""
+Adds ingredient.name_key, the ingredient name in lower case with whitespace collapsed, and makes it unique per user
+so ingredients can be resolved by exact name through an index (see database.resolve_ingredients).
+
+Ingredients of a user whose names only differ in case or spacing are merged into the oldest one; their recipe links
+are moved over unless the recipe already uses the kept ingredient.
+"""
+
+
+def _name_key(name):
+    # same as database.normalize_ingredient_name at the time of this migration
+    return " ".join(name.split()).lower()
+
+
+def upgrade(conn):
+    conn.execute("ALTER TABLE ingredient ADD COLUMN name_key TEXT")
+
+    kept = {}
+    for ingredient_id, user_id, name in conn.execute("SELECT id, user_id, name FROM ingredient ORDER BY id").fetchall():
+        key = (user_id, _name_key(name))
+        if key not in kept:
+            kept[key] = ingredient_id
+            conn.execute("UPDATE ingredient SET name_key = ? WHERE id = ?", (key[1], ingredient_id))
+            continue
+        # duplicate: relink its recipes, links that would collide go away with the ingredient (ON DELETE CASCADE)
+        conn.execute("UPDATE OR IGNORE recipe_ingredient SET ingredient_id = ? WHERE ingredient_id = ?",
+                     (kept[key], ingredient_id))
+        conn.execute("DELETE FROM ingredient WHERE id = ?", (ingredient_id,))
+
+    conn.execute("CREATE UNIQUE INDEX idx_ingredient_user_name_key ON ingredient (user_id, name_key)")
@@ -0,0 +1,95 @@
+-- 0004_recipe_search.sql
+
+-- full-text index of the recipes for database.search_recipes, one row per recipe (rowid = recipe.id).
+-- owner holds 'u<user_id>' so a search only walks the postings of one user: owner : u1 AND (...)
+-- steps and ingredients are the recipe's step descriptions / ingredient names joined with spaces.
+-- prefix='2 3' keeps prefix indexes so the typed-ahead "chic"* queries don't expand over the whole term list.
+CREATE VIRTUAL TABLE recipe_fts USING fts5(
+    owner, name, origin, steps, ingredients,
+    prefix = '2 3',
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+
+-- the triggers below keep recipe_fts in sync with every write path (save_recipe, deletes, ON DELETE CASCADE)
+
+CREATE TRIGGER recipe_fts_recipe_insert AFTER INSERT ON recipe
+BEGIN
+    INSERT INTO recipe_fts (rowid, owner, name, origin, steps, ingredients)
+    VALUES (new.id, 'u' || new.user_id, new.name, new.origin, '', '');
+END;
+
+CREATE TRIGGER recipe_fts_recipe_update AFTER UPDATE OF user_id, name, origin ON recipe
+BEGIN
+    UPDATE recipe_fts SET owner = 'u' || new.user_id, name = new.name, origin = new.origin WHERE rowid = new.id;
+END;
+
+CREATE TRIGGER recipe_fts_recipe_delete AFTER DELETE ON recipe
+BEGIN
+    DELETE FROM recipe_fts WHERE rowid = old.id;
+END;
+
+CREATE TRIGGER recipe_fts_step_insert AFTER INSERT ON recipe_step
+BEGIN
+    UPDATE recipe_fts
+       SET steps = (SELECT group_concat(description, ' ') FROM recipe_step WHERE recipe_id = new.recipe_id)
+     WHERE rowid = new.recipe_id;
+END;
+
+CREATE TRIGGER recipe_fts_step_update AFTER UPDATE OF description ON recipe_step
+BEGIN
+    UPDATE recipe_fts
+       SET steps = (SELECT group_concat(description, ' ') FROM recipe_step WHERE recipe_id = new.recipe_id)
+     WHERE rowid = new.recipe_id;
+END;
+
+CREATE TRIGGER recipe_fts_step_delete AFTER DELETE ON recipe_step
+BEGIN
+    UPDATE recipe_fts
+       SET steps = COALESCE((SELECT group_concat(description, ' ') FROM recipe_step WHERE recipe_id = old.recipe_id), '')
+     WHERE rowid = old.recipe_id;
+END;
+
+CREATE TRIGGER recipe_fts_ingredient_link_insert AFTER INSERT ON recipe_ingredient
+BEGIN
+    UPDATE recipe_fts
+       SET ingredients = (SELECT group_concat(i.name, ' ')
+                            FROM recipe_ingredient AS ri JOIN ingredient AS i ON i.id = ri.ingredient_id
+                           WHERE ri.recipe_id = new.recipe_id)
+     WHERE rowid = new.recipe_id;
+END;
+
+CREATE TRIGGER recipe_fts_ingredient_link_update AFTER UPDATE OF recipe_id, ingredient_id ON recipe_ingredient
+BEGIN
+    UPDATE recipe_fts
+       SET ingredients = COALESCE((SELECT group_concat(i.name, ' ')
+                                     FROM recipe_ingredient AS ri JOIN ingredient AS i ON i.id = ri.ingredient_id
+                                    WHERE ri.recipe_id = recipe_fts.rowid), '')
+     WHERE rowid IN (old.recipe_id, new.recipe_id);
+END;
+
+CREATE TRIGGER recipe_fts_ingredient_link_delete AFTER DELETE ON recipe_ingredient
+BEGIN
+    UPDATE recipe_fts
+       SET ingredients = COALESCE((SELECT group_concat(i.name, ' ')
+                                     FROM recipe_ingredient AS ri JOIN ingredient AS i ON i.id = ri.ingredient_id
+                                    WHERE ri.recipe_id = old.recipe_id), '')
+     WHERE rowid = old.recipe_id;
+END;
+
+-- a renamed ingredient changes the text of every recipe using it
+CREATE TRIGGER recipe_fts_ingredient_rename AFTER UPDATE OF name ON ingredient
+BEGIN
+    UPDATE recipe_fts
+       SET ingredients = (SELECT group_concat(i.name, ' ')
+                            FROM recipe_ingredient AS ri JOIN ingredient AS i ON i.id = ri.ingredient_id
+                           WHERE ri.recipe_id = recipe_fts.rowid)
+     WHERE rowid IN (SELECT recipe_id FROM recipe_ingredient WHERE ingredient_id = new.id);
+END;
+
+INSERT INTO recipe_fts (rowid, owner, name, origin, steps, ingredients)
+SELECT r.id, 'u' || r.user_id, r.name, r.origin,
+       COALESCE((SELECT group_concat(description, ' ') FROM recipe_step WHERE recipe_id = r.id), ''),
+       COALESCE((SELECT group_concat(i.name, ' ')
+                   FROM recipe_ingredient AS ri JOIN ingredient AS i ON i.id = ri.ingredient_id
+                  WHERE ri.recipe_id = r.id), '')
+  FROM recipe AS r;
@@ -0,0 +1,38 @@
+# 0005_structured_quantities.py
+
+from website.quantities import UNITS, BASE_UNITS, parse_amount, unit_code
+
+
+"""
+Adds typed quantities to recipe_ingredient: amount (REAL) and unit_code, a canonical unit from the new unit table.
+
+unit holds the conversion table of website/quantities.py: the dimension of each unit, its factor to the base unit of
+that dimension and the base unit itself, so sql can sum amount * to_base per base_code. The free text quantity and
+unit columns stay as typed; existing rows are parsed into the new columns.
+"""
+
+
+def upgrade(conn):
+    conn.execute("""
+        CREATE TABLE unit (
+            code TEXT PRIMARY KEY,
+            dimension TEXT NOT NULL,
+            to_base REAL NOT NULL,
+            base_code TEXT NOT NULL
+        ) WITHOUT ROWID
+    """)
+    conn.executemany("INSERT INTO unit (code, dimension, to_base, base_code) VALUES (?, ?, ?, ?)",
+                     [(code, dimension, factor, BASE_UNITS[dimension])
+                      for code, (dimension, factor, _) in UNITS.items()])
+
+    conn.execute("ALTER TABLE recipe_ingredient ADD COLUMN amount REAL")
+    conn.execute("ALTER TABLE recipe_ingredient ADD COLUMN unit_code TEXT REFERENCES unit (code)")
+
+    updates = []
+    for row_id, quantity, unit in conn.execute(
+            "SELECT id, quantity, unit FROM recipe_ingredient WHERE quantity IS NOT NULL").fetchall():
+        amount = parse_amount(quantity)
+        code = unit_code(unit) if unit and unit.strip() else 'piece'
+        if amount is not None and code is not None:
+            updates.append((amount, code, row_id))
+    conn.executemany("UPDATE recipe_ingredient SET amount = ?, unit_code = ? WHERE id = ?", updates)
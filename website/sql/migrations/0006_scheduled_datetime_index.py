@@ -0,0 +1,48 @@
+# 0006_scheduled_datetime_index.py
+
+from datetime import datetime
+
+
+"""
+Normalizes meal_plan_meal.scheduled_datetime to 'YYYY-MM-DD HH:MM' and copies the owner of the plan into
+meal_plan_meal.user_id, so the meals a user scheduled in any plan can be read as one range of the index
+(user_id, scheduled_datetime) (see database.get_scheduled_meals_between).
+
+user_id is filled by a trigger on insert, the write paths don't have to know about it. Values that can't be parsed
+as a date are left as they are.
+"""
+
+
+def _canonical(value):
+    # same as database.normalize_scheduled_datetime at the time of this migration
+    return datetime.fromisoformat(value.strip().replace('T', ' ')).strftime('%Y-%m-%d %H:%M')
+
+
+def upgrade(conn):
+    updates = []
+    for plan_id, meal_id, value in conn.execute(
+            "SELECT meal_plan_id, meal_id, scheduled_datetime FROM meal_plan_meal"
+            " WHERE scheduled_datetime IS NOT NULL").fetchall():
+        try:
+            canonical = _canonical(value)
+        except ValueError:
+            continue
+        if canonical != value:
+            updates.append((canonical, plan_id, meal_id))
+    conn.executemany("UPDATE meal_plan_meal SET scheduled_datetime = ? WHERE meal_plan_id = ? AND meal_id = ?",
+                     updates)
+
+    conn.execute("ALTER TABLE meal_plan_meal ADD COLUMN user_id INTEGER")
+    conn.execute("""
+        UPDATE meal_plan_meal
+           SET user_id = (SELECT user_id FROM meal_plan WHERE meal_plan_id = meal_plan_meal.meal_plan_id)
+    """)
+    conn.execute("""
+        CREATE TRIGGER meal_plan_meal_owner AFTER INSERT ON meal_plan_meal
+        BEGIN
+            UPDATE meal_plan_meal
+               SET user_id = (SELECT user_id FROM meal_plan WHERE meal_plan_id = new.meal_plan_id)
+             WHERE meal_plan_id = new.meal_plan_id AND meal_id = new.meal_id;
+        END
+    """)
+    conn.execute("CREATE INDEX idx_meal_plan_meal_user_schedule ON meal_plan_meal (user_id, scheduled_datetime)")
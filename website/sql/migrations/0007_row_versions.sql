@@ -0,0 +1,128 @@
+-- 0007_row_versions.sql
+
+-- version and updated_at of the rows behind the detail pages, the validators of their ETag / Last-Modified headers
+-- (views.render_conditional). version goes up with every change of the row or of anything the page shows with it,
+-- updated_at is the UTC time of that change. The triggers below keep both current for every write path, including
+-- ON DELETE CASCADE.
+ALTER TABLE recipe ADD COLUMN version INTEGER NOT NULL DEFAULT 1;
+ALTER TABLE recipe ADD COLUMN updated_at TEXT;
+ALTER TABLE meal ADD COLUMN version INTEGER NOT NULL DEFAULT 1;
+ALTER TABLE meal ADD COLUMN updated_at TEXT;
+ALTER TABLE meal_plan ADD COLUMN version INTEGER NOT NULL DEFAULT 1;
+ALTER TABLE meal_plan ADD COLUMN updated_at TEXT;
+
+UPDATE recipe SET updated_at = datetime('now');
+UPDATE meal SET updated_at = datetime('now');
+UPDATE meal_plan SET updated_at = datetime('now');
+
+-- recipe: its own columns, steps, ingredient links and the names of its ingredients
+
+CREATE TRIGGER recipe_version_insert AFTER INSERT ON recipe
+BEGIN
+    UPDATE recipe SET updated_at = datetime('now') WHERE id = new.id;
+END;
+
+CREATE TRIGGER recipe_version_update
+AFTER UPDATE OF user_id, name, origin, difficulty, preparation_time, cooking_time, serving_size, source, photo_hash
+ON recipe
+BEGIN
+    UPDATE recipe SET version = version + 1, updated_at = datetime('now') WHERE id = new.id;
+END;
+
+CREATE TRIGGER recipe_version_step_insert AFTER INSERT ON recipe_step
+BEGIN
+    UPDATE recipe SET version = version + 1, updated_at = datetime('now') WHERE id = new.recipe_id;
+END;
+
+CREATE TRIGGER recipe_version_step_update AFTER UPDATE ON recipe_step
+BEGIN
+    UPDATE recipe SET version = version + 1, updated_at = datetime('now') WHERE id IN (old.recipe_id, new.recipe_id);
+END;
+
+CREATE TRIGGER recipe_version_step_delete AFTER DELETE ON recipe_step
+BEGIN
+    UPDATE recipe SET version = version + 1, updated_at = datetime('now') WHERE id = old.recipe_id;
+END;
+
+CREATE TRIGGER recipe_version_ingredient_insert AFTER INSERT ON recipe_ingredient
+BEGIN
+    UPDATE recipe SET version = version + 1, updated_at = datetime('now') WHERE id = new.recipe_id;
+END;
+
+CREATE TRIGGER recipe_version_ingredient_update AFTER UPDATE ON recipe_ingredient
+BEGIN
+    UPDATE recipe SET version = version + 1, updated_at = datetime('now') WHERE id IN (old.recipe_id, new.recipe_id);
+END;
+
+CREATE TRIGGER recipe_version_ingredient_delete AFTER DELETE ON recipe_ingredient
+BEGIN
+    UPDATE recipe SET version = version + 1, updated_at = datetime('now') WHERE id = old.recipe_id;
+END;
+
+CREATE TRIGGER recipe_version_ingredient_rename AFTER UPDATE OF name ON ingredient
+BEGIN
+    UPDATE recipe SET version = version + 1, updated_at = datetime('now')
+     WHERE id IN (SELECT recipe_id FROM recipe_ingredient WHERE ingredient_id = new.id);
+END;
+
+-- meal: its own columns, its recipe links and every change of one of its recipes (the page shows their details)
+
+CREATE TRIGGER meal_version_insert AFTER INSERT ON meal
+BEGIN
+    UPDATE meal SET updated_at = datetime('now') WHERE meal_id = new.meal_id;
+END;
+
+CREATE TRIGGER meal_version_update AFTER UPDATE OF user_id, meal_title, meal_time ON meal
+BEGIN
+    UPDATE meal SET version = version + 1, updated_at = datetime('now') WHERE meal_id = new.meal_id;
+END;
+
+CREATE TRIGGER meal_version_recipe_insert AFTER INSERT ON meal_recipe
+BEGIN
+    UPDATE meal SET version = version + 1, updated_at = datetime('now') WHERE meal_id = new.meal_id;
+END;
+
+CREATE TRIGGER meal_version_recipe_delete AFTER DELETE ON meal_recipe
+BEGIN
+    UPDATE meal SET version = version + 1, updated_at = datetime('now') WHERE meal_id = old.meal_id;
+END;
+
+CREATE TRIGGER meal_version_recipe_changed AFTER UPDATE OF version ON recipe
+BEGIN
+    UPDATE meal SET version = version + 1, updated_at = datetime('now')
+     WHERE meal_id IN (SELECT meal_id FROM meal_recipe WHERE recipe_id = new.id);
+END;
+
+-- meal plan: its own columns, its schedule and the titles of its meals
+
+CREATE TRIGGER meal_plan_version_insert AFTER INSERT ON meal_plan
+BEGIN
+    UPDATE meal_plan SET updated_at = datetime('now') WHERE meal_plan_id = new.meal_plan_id;
+END;
+
+CREATE TRIGGER meal_plan_version_update AFTER UPDATE OF user_id, title, start_date, end_date, goals ON meal_plan
+BEGIN
+    UPDATE meal_plan SET version = version + 1, updated_at = datetime('now') WHERE meal_plan_id = new.meal_plan_id;
+END;
+
+CREATE TRIGGER meal_plan_version_meal_insert AFTER INSERT ON meal_plan_meal
+BEGIN
+    UPDATE meal_plan SET version = version + 1, updated_at = datetime('now') WHERE meal_plan_id = new.meal_plan_id;
+END;
+
+CREATE TRIGGER meal_plan_version_meal_update AFTER UPDATE OF meal_plan_id, meal_id, scheduled_datetime ON meal_plan_meal
+BEGIN
+    UPDATE meal_plan SET version = version + 1, updated_at = datetime('now')
+     WHERE meal_plan_id IN (old.meal_plan_id, new.meal_plan_id);
+END;
+
+CREATE TRIGGER meal_plan_version_meal_delete AFTER DELETE ON meal_plan_meal
+BEGIN
+    UPDATE meal_plan SET version = version + 1, updated_at = datetime('now') WHERE meal_plan_id = old.meal_plan_id;
+END;
+
+CREATE TRIGGER meal_plan_version_meal_renamed AFTER UPDATE OF meal_title ON meal
+BEGIN
+    UPDATE meal_plan SET version = version + 1, updated_at = datetime('now')
+     WHERE meal_plan_id IN (SELECT meal_plan_id FROM meal_plan_meal WHERE meal_id = new.meal_id);
+END;
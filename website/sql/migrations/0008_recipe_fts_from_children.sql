@@ -0,0 +1,17 @@
+-- 0008_recipe_fts_from_children.sql
+
+-- The search row of a new recipe is built from the steps and ingredient links already pointing at its id. Recipes
+-- saved through the forms have none yet when they are inserted (the step / link triggers of 0004 fill the row in
+-- afterwards), the bulk import (database.import_batch) inserts them first under deferred foreign keys, so each
+-- imported recipe is indexed once instead of once per step and ingredient.
+DROP TRIGGER recipe_fts_recipe_insert;
+
+CREATE TRIGGER recipe_fts_recipe_insert AFTER INSERT ON recipe
+BEGIN
+    INSERT INTO recipe_fts (rowid, owner, name, origin, steps, ingredients)
+    VALUES (new.id, 'u' || new.user_id, new.name, new.origin,
+            COALESCE((SELECT group_concat(description, ' ') FROM recipe_step WHERE recipe_id = new.id), ''),
+            COALESCE((SELECT group_concat(i.name, ' ')
+                        FROM recipe_ingredient AS ri JOIN ingredient AS i ON i.id = ri.ingredient_id
+                       WHERE ri.recipe_id = new.id), ''));
+END;
@@ -0,0 +1,29 @@
+-- 0009_jobs.sql
+
+-- durable queue of the background jobs (see website/jobs.py). Times are unix timestamps in seconds.
+-- user_id is the user a job belongs to (for GET /jobs/<id>), deliberately without a foreign key: deleting a user is
+-- a job itself and must not take its own row with it.
+CREATE TABLE job (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL DEFAULT '{}',
+    user_id INTEGER,
+    status TEXT NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'done', 'failed')),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    run_after REAL NOT NULL,
+    worker TEXT,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+
+-- the next job to claim: queued, due, oldest first
+CREATE INDEX idx_job_queue ON job (status, run_after, id);
+-- a user's jobs, newest first
+CREATE INDEX idx_job_user ON job (user_id, id);
+
+-- set when the user asked to delete the account; the account can't be used any more while a job deletes its rows
+ALTER TABLE users ADD COLUMN deleted_at TEXT;
@@ -0,0 +1,185 @@
+-- 0010_global_row_versions.sql
+
+-- The row versions of 0007 counted per row, from 1. Ids are reused after a delete (INTEGER PRIMARY KEY without
+-- AUTOINCREMENT), so a recreated recipe / meal / meal plan could reach the version its predecessor had and the ETag
+-- of the deleted row matched again (views.render_conditional answered 304 with the old page).
+-- Now every change takes the next value of one counter shared by the three tables, which only grows: no two
+-- lifetimes of a row, and no two rows, ever have the same version. It starts above every version given out so far.
+CREATE TABLE row_version_counter (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    value INTEGER NOT NULL
+);
+
+INSERT INTO row_version_counter (id, value)
+SELECT 1, MAX((SELECT COALESCE(MAX(version), 0) FROM recipe),
+              (SELECT COALESCE(MAX(version), 0) FROM meal),
+              (SELECT COALESCE(MAX(version), 0) FROM meal_plan));
+
+DROP TRIGGER recipe_version_insert;
+DROP TRIGGER recipe_version_update;
+DROP TRIGGER recipe_version_step_insert;
+DROP TRIGGER recipe_version_step_update;
+DROP TRIGGER recipe_version_step_delete;
+DROP TRIGGER recipe_version_ingredient_insert;
+DROP TRIGGER recipe_version_ingredient_update;
+DROP TRIGGER recipe_version_ingredient_delete;
+DROP TRIGGER recipe_version_ingredient_rename;
+DROP TRIGGER meal_version_insert;
+DROP TRIGGER meal_version_update;
+DROP TRIGGER meal_version_recipe_insert;
+DROP TRIGGER meal_version_recipe_delete;
+DROP TRIGGER meal_version_recipe_changed;
+DROP TRIGGER meal_plan_version_insert;
+DROP TRIGGER meal_plan_version_update;
+DROP TRIGGER meal_plan_version_meal_insert;
+DROP TRIGGER meal_plan_version_meal_update;
+DROP TRIGGER meal_plan_version_meal_delete;
+DROP TRIGGER meal_plan_version_meal_renamed;
+
+-- recipe: its own columns, steps, ingredient links and the names of its ingredients
+
+CREATE TRIGGER recipe_version_insert AFTER INSERT ON recipe
+BEGIN
+    UPDATE row_version_counter SET value = value + 1;
+    UPDATE recipe SET version = (SELECT value FROM row_version_counter), updated_at = datetime('now') WHERE id = new.id;
+END;
+
+CREATE TRIGGER recipe_version_update
+AFTER UPDATE OF user_id, name, origin, difficulty, preparation_time, cooking_time, serving_size, source, photo_hash
+ON recipe
+BEGIN
+    UPDATE row_version_counter SET value = value + 1;
+    UPDATE recipe SET version = (SELECT value FROM row_version_counter), updated_at = datetime('now') WHERE id = new.id;
+END;
+
+CREATE TRIGGER recipe_version_step_insert AFTER INSERT ON recipe_step
+BEGIN
+    UPDATE row_version_counter SET value = value + 1;
+    UPDATE recipe SET version = (SELECT value FROM row_version_counter), updated_at = datetime('now')
+     WHERE id = new.recipe_id;
+END;
+
+CREATE TRIGGER recipe_version_step_update AFTER UPDATE ON recipe_step
+BEGIN
+    UPDATE row_version_counter SET value = value + 1;
+    UPDATE recipe SET version = (SELECT value FROM row_version_counter), updated_at = datetime('now')
+     WHERE id IN (old.recipe_id, new.recipe_id);
+END;
+
+CREATE TRIGGER recipe_version_step_delete AFTER DELETE ON recipe_step
+BEGIN
+    UPDATE row_version_counter SET value = value + 1;
+    UPDATE recipe SET version = (SELECT value FROM row_version_counter), updated_at = datetime('now')
+     WHERE id = old.recipe_id;
+END;
+
+CREATE TRIGGER recipe_version_ingredient_insert AFTER INSERT ON recipe_ingredient
+BEGIN
+    UPDATE row_version_counter SET value = value + 1;
+    UPDATE recipe SET version = (SELECT value FROM row_version_counter), updated_at = datetime('now')
+     WHERE id = new.recipe_id;
+END;
+
+CREATE TRIGGER recipe_version_ingredient_update AFTER UPDATE ON recipe_ingredient
+BEGIN
+    UPDATE row_version_counter SET value = value + 1;
+    UPDATE recipe SET version = (SELECT value FROM row_version_counter), updated_at = datetime('now')
+     WHERE id IN (old.recipe_id, new.recipe_id);
+END;
+
+CREATE TRIGGER recipe_version_ingredient_delete AFTER DELETE ON recipe_ingredient
+BEGIN
+    UPDATE row_version_counter SET value = value + 1;
+    UPDATE recipe SET version = (SELECT value FROM row_version_counter), updated_at = datetime('now')
+     WHERE id = old.recipe_id;
+END;
+
+CREATE TRIGGER recipe_version_ingredient_rename AFTER UPDATE OF name ON ingredient
+BEGIN
+    UPDATE row_version_counter SET value = value + 1;
+    UPDATE recipe SET version = (SELECT value FROM row_version_counter), updated_at = datetime('now')
+     WHERE id IN (SELECT recipe_id FROM recipe_ingredient WHERE ingredient_id = new.id);
+END;
+
+-- meal: its own columns, its recipe links and every change of one of its recipes (the page shows their details)
+
+CREATE TRIGGER meal_version_insert AFTER INSERT ON meal
+BEGIN
+    UPDATE row_version_counter SET value = value + 1;
+    UPDATE meal SET version = (SELECT value FROM row_version_counter), updated_at = datetime('now')
+     WHERE meal_id = new.meal_id;
+END;
+
+CREATE TRIGGER meal_version_update AFTER UPDATE OF user_id, meal_title, meal_time ON meal
+BEGIN
+    UPDATE row_version_counter SET value = value + 1;
+    UPDATE meal SET version = (SELECT value FROM row_version_counter), updated_at = datetime('now')
+     WHERE meal_id = new.meal_id;
+END;
+
+CREATE TRIGGER meal_version_recipe_insert AFTER INSERT ON meal_recipe
+BEGIN
+    UPDATE row_version_counter SET value = value + 1;
+    UPDATE meal SET version = (SELECT value FROM row_version_counter), updated_at = datetime('now')
+     WHERE meal_id = new.meal_id;
+END;
+
+CREATE TRIGGER meal_version_recipe_delete AFTER DELETE ON meal_recipe
+BEGIN
+    UPDATE row_version_counter SET value = value + 1;
+    UPDATE meal SET version = (SELECT value FROM row_version_counter), updated_at = datetime('now')
+     WHERE meal_id = old.meal_id;
+END;
+
+-- a new recipe sets its version too, only recipes that are in a meal take a value for their meals
+CREATE TRIGGER meal_version_recipe_changed AFTER UPDATE OF version ON recipe
+WHEN EXISTS (SELECT 1 FROM meal_recipe WHERE recipe_id = new.id)
+BEGIN
+    UPDATE row_version_counter SET value = value + 1;
+    UPDATE meal SET version = (SELECT value FROM row_version_counter), updated_at = datetime('now')
+     WHERE meal_id IN (SELECT meal_id FROM meal_recipe WHERE recipe_id = new.id);
+END;
+
+-- meal plan: its own columns, its schedule and the titles of its meals
+
+CREATE TRIGGER meal_plan_version_insert AFTER INSERT ON meal_plan
+BEGIN
+    UPDATE row_version_counter SET value = value + 1;
+    UPDATE meal_plan SET version = (SELECT value FROM row_version_counter), updated_at = datetime('now')
+     WHERE meal_plan_id = new.meal_plan_id;
+END;
+
+CREATE TRIGGER meal_plan_version_update AFTER UPDATE OF user_id, title, start_date, end_date, goals ON meal_plan
+BEGIN
+    UPDATE row_version_counter SET value = value + 1;
+    UPDATE meal_plan SET version = (SELECT value FROM row_version_counter), updated_at = datetime('now')
+     WHERE meal_plan_id = new.meal_plan_id;
+END;
+
+CREATE TRIGGER meal_plan_version_meal_insert AFTER INSERT ON meal_plan_meal
+BEGIN
+    UPDATE row_version_counter SET value = value + 1;
+    UPDATE meal_plan SET version = (SELECT value FROM row_version_counter), updated_at = datetime('now')
+     WHERE meal_plan_id = new.meal_plan_id;
+END;
+
+CREATE TRIGGER meal_plan_version_meal_update AFTER UPDATE OF meal_plan_id, meal_id, scheduled_datetime ON meal_plan_meal
+BEGIN
+    UPDATE row_version_counter SET value = value + 1;
+    UPDATE meal_plan SET version = (SELECT value FROM row_version_counter), updated_at = datetime('now')
+     WHERE meal_plan_id IN (old.meal_plan_id, new.meal_plan_id);
+END;
+
+CREATE TRIGGER meal_plan_version_meal_delete AFTER DELETE ON meal_plan_meal
+BEGIN
+    UPDATE row_version_counter SET value = value + 1;
+    UPDATE meal_plan SET version = (SELECT value FROM row_version_counter), updated_at = datetime('now')
+     WHERE meal_plan_id = old.meal_plan_id;
+END;
+
+CREATE TRIGGER meal_plan_version_meal_renamed AFTER UPDATE OF meal_title ON meal
+BEGIN
+    UPDATE row_version_counter SET value = value + 1;
+    UPDATE meal_plan SET version = (SELECT value FROM row_version_counter), updated_at = datetime('now')
+     WHERE meal_plan_id IN (SELECT meal_plan_id FROM meal_plan_meal WHERE meal_id = new.meal_id);
+END;
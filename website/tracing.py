@@ -0,0 +1,310 @@
+# tracing.py
+
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g, has_request_context, request
+
+from .pool import PooledConnection
+
+
+"""
+This script contains the per-request sql tracing.
+
+With QUERY_TRACE on, the pooled connections are TracedConnections: every statement a helper runs through them is
+recorded in the RequestTrace of the current request, with the shape of its parameters, its duration (execute plus
+fetching) and the rows it returned. Outside a request (cli, scripts) nothing is recorded.
+
+A trace keeps the first QUERY_TRACE_MAX_STATEMENTS statements; the ones after are only counted and timed, so a
+request that runs many statements doesn't hold one record for each. The bulk paths (the streamed body of /import,
+the background jobs) detach the trace from their connection with detach_trace() before they start.
+
+After each request the trace is summed up in a Server-Timing header (db;dur=<ms>;desc="<n> queries"). A statement
+that runs QUERY_TRACE_REPEATS times or more in one request is the N+1 pattern (one query per row of an earlier one)
+and gets printed with the endpoint, as does every statement slower than QUERY_TRACE_SLOW_MS. QUERY_TRACE_LOG prints a
+summary line for every request.
+
+query_budget is for tests and scripts: it collects the traces of the requests made inside it and raises
+AssertionError when one of them ran more statements than allowed.
+"""
+
+
+class QueryRecord:
+    __slots__ = ('sql', 'params', 'duration', 'rows')
+
+    def __init__(self, sql, params, duration):
+        self.sql = sql
+        self.params = params
+        self.duration = duration
+        self.rows = 0
+
+    def as_dict(self):
+        return {'sql': self.sql, 'params': self.params, 'ms': round(self.duration * 1000, 3), 'rows': self.rows}
+
+
+def param_shape(parameters) -> str:
+    """
+    Returns the types of the parameters without their values, e.g. '(int, str, NoneType)' or '{id: int}'.
+    """
+    if isinstance(parameters, dict):
+        return '{' + ', '.join(f"{key}: {type(value).__name__}" for key, value in parameters.items()) + '}'
+    return '(' + ', '.join(type(value).__name__ for value in parameters) + ')'
+
+
+def _normalize(sql):
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+class RequestTrace:
+    def __init__(self, endpoint, method=None, path=None, max_statements=None):
+        """
+        Parameters:
+            endpoint (str): flask endpoint the statements are tagged with, e.g. 'views.view_meal'.
+            method (str, optional): http method of the request.
+            path (str, optional): path of the request.
+            max_statements (int, optional): statements kept, the ones after are only counted in dropped.
+        """
+        self.endpoint = endpoint
+        self.method = method
+        self.path = path
+        self.max_statements = max_statements
+        self.statements = []
+        self.dropped = 0
+        self._dropped_duration = 0.0
+
+    def record(self, sql, parameters, duration) -> QueryRecord:
+        if self.max_statements is not None and len(self.statements) >= self.max_statements:
+            # not kept, fetching time added to it afterwards is lost
+            self.dropped += 1
+            self._dropped_duration += duration
+            return QueryRecord(sql, None, duration)
+        query = QueryRecord(_normalize(sql), param_shape(parameters), duration)
+        self.statements.append(query)
+        return query
+
+    @property
+    def count(self) -> int:
+        return len(self.statements) + self.dropped
+
+    @property
+    def duration(self) -> float:
+        return sum(query.duration for query in self.statements) + self._dropped_duration
+
+    def repeated(self, threshold=2) -> dict:
+        """
+        Returns:
+            dict: sql -> number of times it ran, for the statements that ran at least threshold times.
+        """
+        counts = {}
+        for query in self.statements:
+            counts[query.sql] = counts.get(query.sql, 0) + 1
+        return {sql: count for sql, count in counts.items() if count >= threshold}
+
+    def slow(self, threshold_ms) -> list:
+        return [query for query in self.statements if query.duration * 1000 >= threshold_ms]
+
+    def summary(self) -> str:
+        dropped = f" ({self.dropped} not kept)" if self.dropped else ""
+        return (f"{self.method} {self.path} ({self.endpoint}): {self.count} queries{dropped}, "
+                f"{self.duration * 1000:.2f} ms, {sum(query.rows for query in self.statements)} rows")
+
+    def as_dict(self) -> dict:
+        return {
+            'endpoint': self.endpoint,
+            'method': self.method,
+            'path': self.path,
+            'count': self.count,
+            'dropped': self.dropped,
+            'ms': round(self.duration * 1000, 3),
+            'statements': [query.as_dict() for query in self.statements],
+        }
+
+
+class TracingCursor(sqlite3.Cursor):
+    """
+    Cursor of a TracedConnection, records its statements in the trace the connection is bound to. The rows and the
+    time spent fetching them are added to the record of the statement that produced them.
+    """
+    _query = None
+
+    def execute(self, sql, parameters=()):
+        trace = self.connection.trace
+        if trace is None:
+            self._query = None
+            return super().execute(sql, parameters)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._query = trace.record(sql, parameters, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        trace = self.connection.trace
+        if trace is None:
+            self._query = None
+            return super().executemany(sql, seq_of_parameters)
+        seq_of_parameters = list(seq_of_parameters)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            query = trace.record(sql, seq_of_parameters[0] if seq_of_parameters else (),
+                                 time.perf_counter() - started)
+            query.params = f"{len(seq_of_parameters)} x {query.params}"
+            self._query = None
+
+    def _fetched(self, started, rows):
+        self._query.duration += time.perf_counter() - started
+        self._query.rows += rows
+
+    def fetchone(self):
+        if self._query is None:
+            return super().fetchone()
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(started, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        if self._query is None:
+            return super().fetchmany(self.arraysize if size is None else size)
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(started, len(rows))
+        return rows
+
+    def fetchall(self):
+        if self._query is None:
+            return super().fetchall()
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(started, len(rows))
+        return rows
+
+    def __next__(self):
+        if self._query is None:
+            return super().__next__()
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(started, 0)
+            raise
+        self._fetched(started, 1)
+        return row
+
+
+class TracedConnection(PooledConnection):
+    """
+    Pooled connection whose cursors are TracingCursors. trace is set by database.get_db_connection while the
+    connection serves a request.
+    """
+    trace = None
+
+    def cursor(self, factory=TracingCursor):
+        return super().cursor(factory)
+
+    # sqlite3.Connection.execute opens its cursor without going through cursor()
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def _start_trace():
+    g.query_trace = RequestTrace(request.endpoint, request.method, request.path,
+                                 current_app.config['QUERY_TRACE_MAX_STATEMENTS'])
+
+
+def _finish_trace(response):
+    trace = g.pop('query_trace', None)
+    if trace is None:
+        return response
+
+    response.headers.add('Server-Timing', f'db;dur={trace.duration * 1000:.2f};desc="{trace.count} queries"')
+
+    config = current_app.config
+    if config['QUERY_TRACE_LOG']:
+        print("SQL", trace.summary())
+    for sql, count in trace.repeated(config['QUERY_TRACE_REPEATS']).items():
+        print(f"SQL N+1 in {trace.endpoint}: ran {count} times in one request: {sql}")
+    for query in trace.slow(config['QUERY_TRACE_SLOW_MS']):
+        print(f"SQL slow in {trace.endpoint}: {query.duration * 1000:.1f} ms, {query.rows} rows: {query.sql}")
+
+    for listener in current_app.extensions['query_trace_listeners']:
+        listener(trace)
+    return response
+
+
+def current_trace():
+    """
+    Returns the RequestTrace of the current request, None outside a request or with QUERY_TRACE off.
+    """
+    return g.get('query_trace') if has_request_context() else None
+
+
+def detach_trace():
+    """
+    Stops recording the statements of the current app context: its trace is dropped and unbound from the pooled
+    connection. For the bulk paths, whose thousands of statements would otherwise each keep a record.
+    """
+    g.pop('query_trace', None)
+    conn = g.get('db_conn')
+    if conn is not None:
+        conn.trace = None
+
+
+def init_query_tracing(app):
+    app.extensions['query_trace_listeners'] = []
+    app.before_request(_start_trace)
+    app.after_request(_finish_trace)
+
+
+@contextmanager
+def record_queries(app):
+    """
+    Collects the RequestTrace of every request the app finishes inside the with block (needs QUERY_TRACE).
+
+        with record_queries(app) as traces:
+            client.get('/meal/1')
+        print(traces[0].summary())
+    """
+    if 'query_trace_listeners' not in app.extensions:
+        raise RuntimeError("sql tracing is off, set QUERY_TRACE")
+    traces = []
+    app.extensions['query_trace_listeners'].append(traces.append)
+    try:
+        yield traces
+    finally:
+        app.extensions['query_trace_listeners'].remove(traces.append)
+
+
+@contextmanager
+def query_budget(app, max_queries, max_repeats=None):
+    """
+    Asserts a query budget for the requests made inside the with block.
+
+        with query_budget(app, 3):
+            client.get('/meal/1')
+
+    Parameters:
+        app: the flask app, created with QUERY_TRACE on.
+        max_queries (int): statements one request may run.
+        max_repeats (int, optional): times one request may run the same statement.
+
+    Raises:
+        AssertionError: listing the statements of the first request over budget.
+    """
+    with record_queries(app) as traces:
+        yield traces
+
+    for trace in traces:
+        repeated = trace.repeated(max_repeats + 1) if max_repeats is not None else {}
+        if trace.count > max_queries or repeated:
+            problem = (f"{trace.count} queries, budget {max_queries}" if trace.count > max_queries
+                       else f"statements ran more than {max_repeats} times")
+            raise AssertionError(f"{trace.method} {trace.path} ({trace.endpoint}): {problem}\n"
+                                 + "\n".join(f"  {query.sql}  {query.params}" for query in trace.statements))
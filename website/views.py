@@ -1,17 +1,36 @@
 # views.py
 
-from flask import Blueprint, render_template, request, flash, url_for, redirect
+from flask import (Blueprint, render_template, request, flash, url_for, redirect, abort, send_file, current_app,
+                   jsonify, session, make_response, Response, stream_with_context)
 from flask_login import login_required, current_user, logout_user
+from markupsafe import Markup
+from datetime import date, datetime, timedelta, timezone
+from werkzeug.http import is_resource_modified
+import calendar
+import csv
 from .database import (
-    get_all_recipes, get_all_meals, get_all_meal_plans, get_recipe_by_name, create_recipe, get_ingredients,
-    create_ingredient, create_recipe_ingredient, get_recipe, get_recipe_ingredients, update_recipe, delete_recipe as delete_recipe_db,
-    delete_recipe_ingredient, get_recipe_steps, get_meal_by_name, create_meal, get_meal, get_recipe_in_meal,
+    get_all_recipes, get_all_meals, get_recipes_page, get_meals_page, get_meal_plans_page, get_recipe_by_name,
+    save_recipe, get_recipe, get_recipe_ingredients, delete_recipe as delete_recipe_db, get_recipe_steps,
+    get_meal_by_name, create_meal, get_meal, get_meal_with_recipes,
     update_meal, get_recipe_ids_for_meal, delete_recipe_from_meal_recipe, add_recipe_to_meal,
     delete_meal as delete_meal_db, get_meal_plan_by_user_and_title, create_meal_plan_with_schedule, get_meal_plan,
     get_meal_plan_meals_and_schedules, update_meal_plan, delete_meal_plan_meal, add_meal_to_plan,
     update_meal_plan_meal_schedule, delete_meal_plan_and_meal_plan_meals_by_id, get_user_by_email, update_user_profile,
-    get_user_by_id, delete_user_by_id) # helper methods from database.py
-import re, base64
+    get_user_by_id, search_recipes, HIGHLIGHT_START, HIGHLIGHT_END,
+    suggest_ingredients, get_shopping_list_for_plan, get_shopping_list_for_dates, normalize_scheduled_datetime,
+    get_scheduled_meals_between, cached_page, get_recipe_version, get_meal_version, get_meal_plan_version,
+    get_job, get_jobs) # helper methods from database.py
+from .quantities import format_ingredient, format_amount, humanize
+from .photos import (save_photo, schedule_variants, photo_path, variant_path, is_valid_digest, guess_mimetype,
+                     VARIANTS)
+from .importer import import_batches, guess_format, spool_import, FORMATS
+from .jobs import enqueue, enqueue_user_deletion, job_status
+from .tracing import detach_trace
+from .exporter import iter_export, export_filename, EXPORT_FORMATS, MIMETYPES as EXPORT_MIMETYPES
+import json
+import re
+import shutil
+import tempfile
 
 
 """
@@ -23,11 +42,62 @@ The methods are ordered in the following order
 3) CRUD routings for meals
 4) CRUD routings for meal plan
 5) CRUD routings for profile
+6) photo routing
+7) bulk import and export routing
+8) background job status routing
 """
 
 views = Blueprint('views', __name__)
 
 
+def render_cached(page, render):
+    """
+    Serves a page of the current user from the render cache, render() builds it on a miss. The key holds the
+    generation of the user's data, which every write in database.py bumps, so a hit needs no query at all.
+
+    Pages are cached with the flashed messages base.html shows, so while messages are waiting the page is rendered
+    fresh and not stored.
+    """
+    if session.get('_flashes'):
+        return render()
+    return cached_page(current_user.id, page, render)
+
+
+def render_conditional(version_row, page, render):
+    """
+    Answers a detail page with 304 Not Modified when the browser's copy is still current, before anything else is
+    loaded, and otherwise from the render cache or render(), with the validators for the next request.
+
+    Parameters:
+        version_row: version and updated_at of the recipe / meal / meal plan, None when it isn't the user's.
+        page (str): identifies the page and its query parameters, the owner and the version are appended for the
+            ETag and the render cache key (so a change made by another process is never served from the cache either).
+        render: builds the page (or a redirect) on a miss.
+
+    Versions come from one counter for all rows (migration 0010), so a row recreated under the id of a deleted one
+    never gets the deleted row's ETag.
+    """
+    if version_row is None:
+        return render()
+
+    etag = f"{page}-u{current_user.id}-v{version_row['version']}"
+    last_modified = datetime.strptime(version_row['updated_at'], '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+    # a flashed message has to be shown, a 304 would keep the page without it
+    if session.get('_flashes') or is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = make_response(render_cached(etag, render))
+        if response.status_code != 200:
+            return response
+    else:
+        response = current_app.response_class(status=304)
+
+    response.set_etag(etag, weak=True)
+    response.last_modified = last_modified
+    # the browser keeps the page but asks every time, a change shows up on the next view
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
 def is_valid_email(email):
     pattern = r'^[\w\.-]+@[\w\.-]+\.\w+$'
     return re.match(pattern, email)
@@ -37,27 +107,40 @@ def is_valid_email(email):
 @views.route('/', methods=['GET'])
 @login_required
 def home():
-    # get all recipes
-    rows = get_all_recipes(current_user.id)
-    recipes = []
-    for row in rows:
-        rec = dict(row)
-        blob = rec.pop('photo')
-        rec['photo'] = base64.b64decode(blob).decode('utf-8') if blob else None
-        recipes.append(rec)
-
-    # get all meals
-    # get all meals (no photos)
-    rows = get_all_meals(current_user.id)
-    meals = [{
-            'meal_id': r['meal_id'],
-            'meal_title': r['meal_title'],
-            'meal_time': r['meal_time']
-    } for r in rows]
-
-    meal_plans = get_all_meal_plans(current_user.id)
-    return render_template("home.html", user=current_user, recipes=recipes, meals= meals,
-                           meal_plans=meal_plans)
+    def render():
+        # first page of each section, the rest is fetched by the "load more" cards
+        page_size = current_app.config['PAGE_SIZE']
+        recipes, next_recipes = get_recipes_page(current_user.id, limit=page_size)
+        meals, next_meals = get_meals_page(current_user.id, limit=page_size)
+        meal_plans, next_meal_plans = get_meal_plans_page(current_user.id, limit=page_size)
+        return render_template("home.html", user=current_user, recipes=recipes, meals=meals, meal_plans=meal_plans,
+                               next_recipes=next_recipes, next_meals=next_meals, next_meal_plans=next_meal_plans)
+
+    return render_cached('home', render)
+
+
+@views.route('/recipes/page', methods=['GET'])
+@login_required
+def recipes_page():
+    recipes, next_after = get_recipes_page(current_user.id, request.args.get('after', 0, type=int),
+                                           current_app.config['PAGE_SIZE'])
+    return render_template('partials/recipe_cards.html', recipes=recipes, next_after=next_after)
+
+
+@views.route('/meals/page', methods=['GET'])
+@login_required
+def meals_page():
+    meals, next_after = get_meals_page(current_user.id, request.args.get('after', 0, type=int),
+                                       current_app.config['PAGE_SIZE'])
+    return render_template('partials/meal_cards.html', meals=meals, next_after=next_after)
+
+
+@views.route('/meal-plans/page', methods=['GET'])
+@login_required
+def meal_plans_page():
+    meal_plans, next_after = get_meal_plans_page(current_user.id, request.args.get('after', 0, type=int),
+                                                 current_app.config['PAGE_SIZE'])
+    return render_template('partials/meal_plan_cards.html', meal_plans=meal_plans, next_after=next_after)
 
 
 @views.route('/add-recipe', methods=['GET', 'POST'])
@@ -105,34 +188,27 @@ def add_recipe():
         ingredients = [i.strip() for i in ingredients_raw.split(',') if i.strip()]
 
         file = request.files.get('photo')
-        photo_data = file.read() if file and file.filename else None
+        photo_hash = None
+        if file and file.filename:
+            photo_hash = save_photo(file)
+            schedule_variants(photo_hash)
 
-        # Insert recipe
+        # Insert recipe, its steps and ingredients
         try:
-            recipe_id = create_recipe(
+            save_recipe(
                 user_id=current_user.id,
                 name=name,
                 origin=origin,
                 difficulty=difficulty,
                 preparation_steps=preparation_steps,
+                ingredients=ingredients,
                 preparation_time=prep_time,
                 cooking_time=cook_time,
                 serving_size=serving_size,
                 source=source or 'Unknown',
-                photo_data=photo_data
+                photo_hash=photo_hash
             )
 
-            for ingredient_name in ingredients:
-                # Ensure ingredient exists for this user
-                row = get_ingredients(user_id=current_user.id, name_query=ingredient_name)
-                if row:
-                    ingredient_id = row['id']
-                else:
-                    ingredient_id = create_ingredient(user_id=current_user.id, name=ingredient_name)
-
-                # Link recipe <-> ingredient
-                create_recipe_ingredient(recipe_id, ingredient_id)
-
             flash('Recipe created successfully!', 'success')
             return redirect(url_for('views.home'))
         except Exception as e:
@@ -186,35 +262,26 @@ def edit_recipe(recipe_id):
 
         # single-photo upload
         file = request.files.get('photo')
-        photo_data = None
+        photo_hash = None
 
         if file and file.filename:
-            photo_data = file.read()
+            photo_hash = save_photo(file)
+            schedule_variants(photo_hash)
 
         if not name or not preparation_steps_raw or not ingredients_raw:
             flash('Please fill out required fields.', category='error')
         else:
-            # update recipe table
             preparation_steps = [step.strip() for step in preparation_steps_raw.split(',') if step.strip()]
-            update_recipe(name=name, origin=origin, difficulty=difficulty,
-                          preparation_steps=preparation_steps, preparation_time=preparation_time,
-                          cooking_time=cooking_time, serving_size=serving_size, source=source,
-                          photo_data=photo_data, recipe_id=recipe_id)
-
-            # delete existing recipe_ingredients
-            delete_recipe_ingredient(recipe_id)
-
-            # add the new ingredients
             ingredients = [ingredient.strip() for ingredient in ingredients_raw.split(',') if ingredient.strip()]
-            for ingredient_name in ingredients:
-                existing_ingredient = get_ingredients(user_id=current_user.id, name_query=ingredient_name)
-
-                if existing_ingredient:
-                    ingredient_id = existing_ingredient['id']
-                else:
-                    ingredient_id = create_ingredient(user_id=current_user.id, name=ingredient_name)
-
-                create_recipe_ingredient(recipe_id=recipe_id, ingredient_id=ingredient_id)
+            # update recipe, steps and ingredients
+            try:
+                save_recipe(user_id=current_user.id, name=name, origin=origin, difficulty=difficulty,
+                            preparation_steps=preparation_steps, ingredients=ingredients,
+                            preparation_time=preparation_time, cooking_time=cooking_time,
+                            serving_size=serving_size, source=source, photo_hash=photo_hash, recipe_id=recipe_id)
+            except Exception as e:
+                flash(f'Error updating recipe: {e}', 'error')
+                return redirect(url_for('views.edit_recipe', recipe_id=recipe_id))
 
             flash('Recipe updated successfully!', category='success')
             return redirect(url_for('views.view_recipe', recipe_id=recipe_id))
@@ -228,23 +295,67 @@ def edit_recipe(recipe_id):
 @views.route('/recipe/<int:recipe_id>')
 @login_required
 def view_recipe(recipe_id):
-    recipe_row = get_recipe(recipe_id, current_user.id)
-    if not recipe_row:
-        flash('Recipe not found.', category='error')
-        return redirect(url_for('views.home'))
+    # ?servings=N scales the ingredient amounts
+    servings = request.args.get('servings', type=int)
+    if servings is not None and servings < 1:
+        servings = None
+
+    def render():
+        recipe_row = get_recipe(recipe_id, current_user.id)
+        if not recipe_row:
+            flash('Recipe not found.', category='error')
+            return redirect(url_for('views.home'))
 
-    recipe = dict(recipe_row)
-    blob = recipe.pop('photo')
-    recipe['photo'] = base64.b64encode(blob).decode('utf-8') if blob else None
+        recipe = dict(recipe_row)
+        ingredients = get_recipe_ingredients(recipe_id, servings)
 
-    ingredients = get_recipe_ingredients(recipe_id)
+        ingredients = [ingredient_line(r, scaled=servings is not None) for r in ingredients]
 
-    ingredients = [r['name'] for r in ingredients]
+        preparation_steps = get_recipe_steps(recipe_id)
 
-    preparation_steps = get_recipe_steps(recipe_id)
+        return render_template('view_recipe.html', user=current_user, recipe=recipe,
+                               preparation_steps=preparation_steps, ingredients=ingredients,
+                               servings=servings or recipe['serving_size'])
+
+    return render_conditional(get_recipe_version(recipe_id, current_user.id), f'recipe-{recipe_id}-{servings}', render)
+
+
+@views.route('/search', methods=['GET'])
+@login_required
+def search():
+    query = request.args.get('q', '').strip()
+    results = search_recipes(current_user.id, query) if query else []
+    return render_template('search.html', user=current_user, query=query, results=results)
+
+
+@views.route('/ingredients/autocomplete', methods=['GET'])
+@login_required
+def ingredient_autocomplete():
+    # served from the in-memory index, see database.suggest_ingredients
+    names = suggest_ingredients(current_user.id, request.args.get('q', ''), limit=request.args.get('limit', 10, type=int))
+    return jsonify(names)
 
-    return render_template('view_recipe.html', user=current_user, recipe=recipe,
-                           preparation_steps=preparation_steps, ingredients=ingredients)
+
+@views.app_template_filter('ingredient_line')
+def ingredient_line(row, scaled=False):
+    # "1 1/2 cups Rice" as typed, or with the amount computed for other servings
+    return format_ingredient(row['name'], row['quantity'], row['unit'],
+                             row['amount'] if scaled and row['amount'] is not None else None)
+
+
+@views.app_template_filter('amount')
+def amount_filter(amount, unit):
+    # amount in a base unit (shopping list), 1500 g is shown as 1.5 kg
+    amount, unit = humanize(amount, unit)
+    return f"{format_amount(amount)} {unit}".strip()
+
+
+@views.app_template_filter('highlight')
+def highlight(text):
+    # text comes from search_recipes, escape it and turn its match markers into <mark> tags
+    return (Markup.escape(text or '')
+            .replace(HIGHLIGHT_START, Markup('<mark>'))
+            .replace(HIGHLIGHT_END, Markup('</mark>')))
 
 
 # ----------- Meal Related Routing -----------
@@ -294,37 +405,17 @@ def add_meal():
 @views.route('/meal/<int:meal_id>')
 @login_required
 def view_meal(meal_id):
-    meal = get_meal(meal_id)
-
-    if meal is None or meal['user_id'] != current_user.id:
-        flash('Meal not found.', category='error')
-        return redirect(url_for('views.home'))
-
-    # Retrieve recipes associated with the meal
-    recipes = get_recipe_in_meal(meal_id)
-    meal_recipes = []
-    unique_ingredients = set()
-
-    for recipe in recipes:
-        rec = dict(recipe)
-        recipe_id = rec['id']
-
-        # fetch ordered preparation steps
-        rec['preparation_steps'] = get_recipe_steps(recipe_id)
+    def render():
+        meal = get_meal_with_recipes(meal_id, current_user.id)
 
-        # fetch and attach ingredient list for this recipe
-        ingr_rows = get_recipe_ingredients(recipe_id)
-        ingredients = [row['name'] for row in ingr_rows]
-        rec['ingredients'] = ingredients
-
-        unique_ingredients.update(rec['ingredients'])
-
-        meal_recipes.append(rec)
+        if meal is None:
+            flash('Meal not found.', category='error')
+            return redirect(url_for('views.home'))
 
-    unique_ingredients = list(unique_ingredients)
+        return render_template('view_meal.html', user=current_user, meal=meal,
+                               meal_recipes=meal['recipes'], unique_ingredients=meal['ingredients'])
 
-    return render_template('view_meal.html', user=current_user, meal=meal,
-                           meal_recipes=meal_recipes, unique_ingredients=unique_ingredients)
+    return render_conditional(get_meal_version(meal_id, current_user.id), f'meal-{meal_id}', render)
 
 
 @views.route('/edit-meal/<int:meal_id>', methods=['GET', 'POST'])
@@ -419,7 +510,11 @@ def add_meal_plan():
             if not dt:
                 flash('Each selected meal must have a date/time.', 'error')
                 return redirect(url_for('views.add_meal_plan'))
-            schedule_map[m] = dt
+            try:
+                schedule_map[m] = normalize_scheduled_datetime(dt)
+            except ValueError:
+                flash('Each date/time must be in the format YYYY-MM-DDTHH:MM.', 'error')
+                return redirect(url_for('views.add_meal_plan'))
 
 
         try:
@@ -450,21 +545,119 @@ def add_meal_plan():
 @views.route('/view-meal-plan/<int:meal_plan_id>', methods=['GET'])
 @login_required
 def view_meal_plan(meal_plan_id):
-    plan = get_meal_plan(meal_plan_id, current_user.id)
+    def render():
+        plan = get_meal_plan(meal_plan_id, current_user.id)
+
+        # Not found or not owned by this user?
+        if not plan or plan['user_id'] != current_user.id:
+            flash('Meal plan not found or access denied.', 'error')
+            return redirect(url_for('views.home'))
+
+        rows = get_meal_plan_meals_and_schedules(meal_plan_id)
+        scheduled_meals = [dict(r) for r in rows]
+
+        return render_template(
+            'view_meal_plan.html',
+            user=current_user,
+            plan=plan,
+            scheduled_meals=scheduled_meals
+        )
+
+    return render_conditional(get_meal_plan_version(meal_plan_id, current_user.id), f'meal-plan-{meal_plan_id}',
+                              render)
+
 
-    # Not found or not owned by this user?
+@views.route('/view-meal-plan/<int:meal_plan_id>/shopping-list', methods=['GET'])
+@login_required
+def meal_plan_shopping_list(meal_plan_id):
+    plan = get_meal_plan(meal_plan_id, current_user.id)
     if not plan or plan['user_id'] != current_user.id:
         flash('Meal plan not found or access denied.', 'error')
         return redirect(url_for('views.home'))
 
-    rows = get_meal_plan_meals_and_schedules(meal_plan_id)
-    scheduled_meals = [dict(r) for r in rows]
+    stores = get_shopping_list_for_plan(meal_plan_id, current_user.id)
+    return render_template('shopping_list.html', user=current_user, plan=plan, stores=stores)
+
+
+@views.route('/shopping-list', methods=['GET'])
+@login_required
+def shopping_list():
+    # defaults to the coming week
+    today = date.today()
+    start_date = request.args.get('start_date', '').strip() or today.isoformat()
+    end_date = request.args.get('end_date', '').strip() or (today + timedelta(days=6)).isoformat()
+    try:
+        date.fromisoformat(start_date)
+        date.fromisoformat(end_date)
+    except ValueError:
+        flash('Dates must be in the format YYYY-MM-DD.', 'error')
+        return redirect(url_for('views.shopping_list'))
+    if start_date > end_date:
+        flash('Start date must be on or before end date.', 'error')
+        return redirect(url_for('views.shopping_list'))
+
+    stores = get_shopping_list_for_dates(current_user.id, start_date, end_date)
+    return render_template('shopping_list.html', user=current_user, plan=None, stores=stores,
+                           start_date=start_date, end_date=end_date)
+
+
+def _meals_by_day(user_id, first_day, last_day):
+    # one query for the visible window, grouped by the date part of scheduled_datetime
+    by_day = {}
+    for row in get_scheduled_meals_between(user_id, first_day.isoformat(), last_day.isoformat()):
+        by_day.setdefault(row['scheduled_datetime'][:10], []).append(row)
+    return by_day
+
+
+@views.route('/calendar/week', methods=['GET'])
+@login_required
+def calendar_week():
+    # any day of the week to show, defaults to the current week
+    try:
+        day = date.fromisoformat(request.args.get('date', '').strip() or date.today().isoformat())
+    except ValueError:
+        flash('Dates must be in the format YYYY-MM-DD.', 'error')
+        return redirect(url_for('views.calendar_week'))
 
+    monday = day - timedelta(days=day.weekday())
+    days = [monday + timedelta(days=i) for i in range(7)]
     return render_template(
-        'view_meal_plan.html',
+        'calendar.html',
         user=current_user,
-        plan=plan,
-        scheduled_meals=scheduled_meals
+        view='week',
+        title=f"Week of {monday.strftime('%B %d, %Y')}",
+        weeks=[days],
+        month=None,
+        meals_by_day=_meals_by_day(current_user.id, days[0], days[-1]),
+        prev_url=url_for('views.calendar_week', date=(monday - timedelta(days=7)).isoformat()),
+        next_url=url_for('views.calendar_week', date=(monday + timedelta(days=7)).isoformat()),
+    )
+
+
+@views.route('/calendar/month', methods=['GET'])
+@login_required
+def calendar_month():
+    # YYYY-MM, defaults to the current month
+    try:
+        first = date.fromisoformat((request.args.get('month', '').strip() or date.today().strftime('%Y-%m')) + '-01')
+    except ValueError:
+        flash('Months must be in the format YYYY-MM.', 'error')
+        return redirect(url_for('views.calendar_month'))
+
+    # whole weeks from monday, the days of the neighbouring months in them are shown too
+    weeks = calendar.Calendar().monthdatescalendar(first.year, first.month)
+    previous_month = first - timedelta(days=1)
+    next_month = first + timedelta(days=calendar.monthrange(first.year, first.month)[1])
+    return render_template(
+        'calendar.html',
+        user=current_user,
+        view='month',
+        title=first.strftime('%B %Y'),
+        weeks=weeks,
+        month=first.month,
+        meals_by_day=_meals_by_day(current_user.id, weeks[0][0], weeks[-1][-1]),
+        prev_url=url_for('views.calendar_month', month=previous_month.strftime('%Y-%m')),
+        next_url=url_for('views.calendar_month', month=next_month.strftime('%Y-%m')),
     )
 
 
@@ -507,7 +700,11 @@ def edit_meal_plan(meal_plan_id):
             if not dt:
                 flash('Each selected meal must have a date/time.', 'error')
                 return redirect(url_for('views.edit_meal_plan', meal_plan_id=meal_plan_id))
-            schedule_map[m] = dt
+            try:
+                schedule_map[m] = normalize_scheduled_datetime(dt)
+            except ValueError:
+                flash('Each date/time must be in the format YYYY-MM-DDTHH:MM.', 'error')
+                return redirect(url_for('views.edit_meal_plan', meal_plan_id=meal_plan_id))
 
         existing_rows = get_meal_plan_meals_and_schedules(meal_plan_id)
         old_map = {r['meal_id']: r['scheduled_datetime'] for r in existing_rows}
@@ -566,10 +763,11 @@ def delete_meal_plan(meal_plan_id):
 @login_required
 def profile_page():
     if request.method == 'POST':
-        photo_data = None
+        photo_hash = None
         file = request.files.get('profile_picture')
         if file and file.filename != '':
-            photo_data = file.read()
+            photo_hash = save_photo(file)
+            schedule_variants(photo_hash)
 
         new_user_name = request.form.get('user_name', '').strip()
         new_email = request.form.get('email', '').strip()
@@ -625,7 +823,7 @@ def profile_page():
                 dietary_preferences=new_dietary_preferences,
                 cooking_level=new_cooking_level,
                 allergies=new_allergies,
-                photo_data=photo_data
+                photo_hash=photo_hash
             )
             flash('Profile page updated!', category='success')
         except Exception as e:
@@ -634,21 +832,19 @@ def profile_page():
         return redirect(url_for('views.profile_page'))
 
     updated_user = get_user_by_id(current_user.id)
-    profile_image_data = None
-    if updated_user.profile_image:  # assuming this is a BLOB (bytes)
-        profile_image_data = base64.b64encode(updated_user.profile_image).decode('utf-8')
 
-    return render_template("profile.html", user=updated_user,
-                           profile_image_data = profile_image_data)
+    return render_template("profile.html", user=updated_user)
 
 
 @views.route('/delete-account', methods=['POST'])
 @login_required
 def delete_account():
     try:
-        delete_user_by_id(current_user.id)
+        # the account is closed right away, its rows are deleted by a background job (jobs.py)
+        user_id = current_user.id
+        enqueue_user_deletion(user_id)
         logout_user()
-        flash("Your account has been deleted. We're sorry to see you go 💔", category='success')
+        flash("Your account is being deleted. We're sorry to see you go 💔", category='success')
 
         return redirect(url_for('auth.login'))
 
@@ -656,3 +852,124 @@ def delete_account():
         flash(f"Something went wrong: {str(e)}", category='error')
         return redirect(url_for('views.profile_page'))
 
+
+# ----------- Photo Routing -----------
+@views.route('/photo/<digest>', defaults={'variant': 'original'})
+@views.route('/photo/<digest>/<variant>')
+@login_required
+def photo(digest, variant):
+    # photos are stored under the sha256 of their content, so a url always refers to the same bytes and
+    # browsers may keep it forever
+    if not is_valid_digest(digest) or (variant != 'original' and variant not in VARIANTS):
+        abort(404)
+    path = photo_path(digest).resolve()
+    if not path.exists():
+        abort(404)
+
+    etag = digest
+    immutable = True
+    if variant != 'original':
+        resized = variant_path(digest, variant).resolve()
+        if resized.exists():
+            path, etag = resized, f"{digest}.{variant}"
+        else:
+            # not rendered yet, serve the original but don't let the browser keep it
+            immutable = False
+
+    response = send_file(path, mimetype=guess_mimetype(path), etag=etag, conditional=True,
+                         max_age=31536000 if immutable else 0)
+    response.cache_control.public = False
+    response.cache_control.private = True
+    if immutable:
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+
+# ----------- Bulk Import and Export Routing -----------
+@views.route('/import', methods=['POST'])
+@login_required
+def import_data():
+    # NDJSON or CSV (see importer.py) as the 'file' of a form or as the request body, the format comes from
+    # ?format=, the file name or the content type. The answer is streamed, one json line per committed batch;
+    # with ?background=1 the file is imported by a job instead and the answer is its id and status url
+    upload = request.files.get('file')
+    if upload is not None:
+        fmt = guess_format(upload.filename, upload.mimetype)
+    else:
+        fmt = guess_format(mimetype=request.mimetype)
+    fmt = request.args.get('format', fmt)
+    if fmt not in FORMATS:
+        return jsonify(error=f"Unknown format, pass ?format= with one of {', '.join(FORMATS)}"), 400
+
+    if request.args.get('background') == '1':
+        path = spool_import(upload.stream if upload is not None else request.stream)
+        job_id = enqueue('import', {'path': str(path), 'format': fmt, 'user_id': current_user.id}, current_user.id)
+        return jsonify(job=job_id, status=url_for('views.job_status_page', job_id=job_id)), 202
+
+    stream = request.stream
+    if upload is not None:
+        # werkzeug closes the uploaded files before the response is streamed, the import reads its own copy
+        stream = tempfile.TemporaryFile()
+        shutil.copyfileobj(upload.stream, stream)
+        stream.seek(0)
+    batch_size = current_app.config['IMPORT_BATCH_SIZE']
+    # the body is streamed in a fresh app context with its own pooled connection, current_user is read here
+    user_id = current_user.id
+
+    def progress():
+        # the request's trace is reported already, the thousands of statements of the import aren't recorded
+        detach_trace()
+        report = {'rows': 0, 'recipe': 0, 'meal': 0, 'meal_plan': 0, 'errors': [], 'seconds': 0.0}
+        try:
+            for report, errors in import_batches(user_id, stream, fmt, batch_size):
+                yield json.dumps({
+                    'rows': report['rows'], 'recipe': report['recipe'], 'meal': report['meal'],
+                    'meal_plan': report['meal_plan'], 'seconds': report['seconds'],
+                    'errors': [{'line': line, 'error': error} for line, error in errors],
+                }) + "\n"
+        except (UnicodeDecodeError, csv.Error) as e:
+            # the batches before this one are committed
+            yield json.dumps({'error': f"Can't read the file after {report['rows']} rows: {e}"}) + "\n"
+            return
+        finally:
+            if upload is not None:
+                stream.close()
+        yield json.dumps({
+            'done': True, 'rows': report['rows'], 'recipe': report['recipe'], 'meal': report['meal'],
+            'meal_plan': report['meal_plan'], 'skipped': len(report['errors']), 'seconds': report['seconds'],
+        }) + "\n"
+
+    return Response(stream_with_context(progress()), mimetype='application/x-ndjson')
+
+
+@views.route('/export', methods=['GET'])
+@login_required
+def export_data():
+    # ndjson (default), or zip / tar with the photos, streamed while it is written (see exporter.py)
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify(error=f"Unknown format, pass ?format= with one of {', '.join(EXPORT_FORMATS)}"), 400
+    response = Response(stream_with_context(iter_export(current_user.id, fmt)), mimetype=EXPORT_MIMETYPES[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="{export_filename(fmt)}"'
+    response.cache_control.no_store = True
+    return response
+
+
+@views.route('/jobs', methods=['GET'])
+@login_required
+def jobs_page():
+    # the user's latest background jobs, newest first
+    return jsonify(jobs=[job_status(job) for job in get_jobs(current_user.id)])
+
+
+@views.route('/jobs/<int:job_id>', methods=['GET'])
+@login_required
+def job_status_page(job_id):
+    job = get_job(job_id, current_user.id)
+    if job is None:
+        return jsonify(error="Job not found"), 404
+    response = jsonify(job_status(job))
+    response.cache_control.no_store = True
+    return response